@@ -7,9 +7,12 @@ try:
 except Exception:
     _db = None
 try:
-    from utils.firebase_utils import save_customer_to_firebase
+    from utils.firebase_utils import sync_customers_to_firebase
 except Exception:
-    save_customer_to_firebase = None
+    sync_customers_to_firebase = None
+from utils.ledger import get_ledger
+from utils.phone import format_phone as format_phone_input, phone_key, label_mask as phone_label_mask, with_phone_keys
+from utils.customer_index import ensure_db_schema
 
 
 # ===== Excel Auto-Creation (as specified) =====
@@ -62,37 +65,6 @@ def proper_case(text):
         return str(text)
 
 
-def format_phone_input(raw_input):
-    if not raw_input:
-        return None
-    digits = ''.join(filter(str.isdigit, str(raw_input)))
-    if digits.startswith("0"):
-        digits = digits[1:]
-    if digits.startswith("5") and len(digits) == 9:
-        return f"+971 {digits[:2]} {digits[2:5]} {digits[5:]}"
-    return None
-
-
-def phone_flat10(raw_input):
-    if raw_input is None:
-        return ""
-    digits = ''.join(filter(str.isdigit, str(raw_input)))
-    if not digits:
-        return ""
-    if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
-        return '0' + digits[3:12]
-    if len(digits) == 9 and digits.startswith('5'):
-        return '0' + digits
-    if len(digits) == 10 and digits.startswith('05'):
-        return digits
-    return digits[-10:]
-
-
-def phone_label_mask(raw_input):
-    flat = phone_flat10(raw_input)
-    return f"{flat} xxxxxxxxxx" if flat else "xxxxxxxxxx"
-
-
 # ===== Data IO =====
 CUSTOMERS_XLSX = "data/customers.xlsx"
 RECORDS_XLSX = "data/records.xlsx"
@@ -115,16 +87,16 @@ def load_customers():
                     if col not in df.columns:
                         df[col] = None
                 # Keep column order expected by app
-                return df[[
+                return with_phone_keys(df[[
                     "client_name", "phone", "location", "email", "status",
                     "notes", "tags", "next_follow_up", "assigned_to", "last_activity"
-                ]]
+                ]])
         except Exception:
             # Any DB error -> fall back to Excel
             pass
 
     try:
-        df = pd.read_excel(CUSTOMERS_XLSX)
+        df = pd.read_excel(CUSTOMERS_XLSX, dtype={"phone_key": str})
     except Exception:
         df = pd.DataFrame(columns=[
             "client_name", "phone", "location", "email", "status",
@@ -137,17 +109,28 @@ def load_customers():
     ]:
         if col not in df.columns:
             df[col] = None
-    return df[[
+    # phone_key is persisted by save_customers; older files get it computed here
+    return with_phone_keys(df[[
         "client_name", "phone", "location", "email", "status",
-        "notes", "tags", "next_follow_up", "assigned_to", "last_activity"
-    ]]
+        "notes", "tags", "next_follow_up", "assigned_to", "last_activity",
+    ] + (["phone_key"] if "phone_key" in df.columns else [])])
 
 
 def save_customers(df: pd.DataFrame):
     os.makedirs("data", exist_ok=True)
+    df = with_phone_keys(df, refresh=True)
+
+    # حفظ في Firebase (مستقل عن قاعدة البيانات)
+    if sync_customers_to_firebase is not None:
+        try:
+            sync_customers_to_firebase(df)
+        except Exception as e:
+            print(f"⚠️ تحذير Firebase: {str(e)}")
+
     # Try to persist to DB (non-intrusive). If DB ops fail, fall back to writing Excel only.
     if _db is not None:
         try:
+            ensure_db_schema()
             # For each row, attempt to upsert by matching name and phone
             for _, row in df.iterrows():
                 name = str(row.get('client_name') or '')
@@ -170,28 +153,14 @@ def save_customers(df: pd.DataFrame):
                         pass
                 else:
                     try:
-                        _db.db_execute('INSERT INTO customers(name, phone, email, address) VALUES (%s, %s, %s, %s)', (name, phone, email, address))
+                        _db.db_execute('INSERT INTO customers(name, phone, phone_key, email, address) VALUES (%s, %s, %s, %s, %s)', (name, phone, row.get('phone_key') or None, email, address))
                     except Exception:
                         pass
-            
-            # حفظ في Firebase
-            if save_customer_to_firebase is not None:
-                try:
-                    for _, row in df.iterrows():
-                        customer_dict = row.to_dict()
-                        customer_dict = {k: (None if pd.isna(v) else v) for k, v in customer_dict.items()}
-                        save_customer_to_firebase(customer_dict)
-                except Exception as e:
-                    print(f"⚠️ تحذير Firebase: {str(e)}")
-            
-            # After attempting DB sync, still write Excel to preserve full app fields
-            df.to_excel(CUSTOMERS_XLSX, index=False)
-            return
         except Exception:
-            # Any DB-level error -> fall back to Excel-only
+            # Any DB-level error (e.g. no connection string) -> Excel only
             pass
 
-    # Default: write Excel file
+    # Excel keeps the full app fields in every mode
     df.to_excel(CUSTOMERS_XLSX, index=False)
 
 
@@ -218,27 +187,9 @@ def load_records():
         ])
 
 
-def calculate_customer_finances(customer_name: str, customer_phone: str | None):
-    rec = load_records()
-    if rec.empty:
-        return 0.0, 0.0, 0.0, 0.0
-    # Normalize for matching
-    cname = str(customer_name).strip().lower()
-    cphone = phone_flat10(customer_phone) if customer_phone else ""
-    # Build mask: prefer phone if available, else fallback to name
-    name_mask = rec["client_name"].astype(str).str.strip().str.lower() == cname
-    if "phone" in rec.columns:
-        rec_phone_norm = rec["phone"].apply(phone_flat10)
-        phone_mask = rec_phone_norm == cphone if cphone else False
-    else:
-        phone_mask = False
-    mask = phone_mask | name_mask
-    sub = rec[mask]
-    total_q = sub[sub["type"] == "q"]["amount"].sum() if not sub.empty else 0.0
-    total_i = sub[sub["type"] == "i"]["amount"].sum() if not sub.empty else 0.0
-    total_r = sub[sub["type"] == "r"]["amount"].sum() if not sub.empty else 0.0
-    outstanding = total_i - total_r
-    return float(total_q or 0.0), float(total_i or 0.0), float(total_r or 0.0), float(outstanding or 0.0)
+def calculate_customer_finances(customer_name: str, customer_phone: str | None = None):
+    # Records matching the phone OR the name; served from the cached ledger
+    return get_ledger(load_records).totals(customer_name, customer_phone)
 
 
 # ===== Main Page =====
@@ -282,12 +233,13 @@ def customers_app():
 
     # Load Data
     customers = load_customers()
-    records = load_records()
+    ledger = get_ledger(load_records)
+    records = ledger.records
 
     # ---- Filters ----
     f1, f2, f3, f4, f5 = st.columns([2,1.2,1.2,1,1.2])
     with f1:
-        q = st.text_input("Search name or phone")
+        q = st.text_input("Search name or phone", key="customers_search")
     with f2:
         status_filter = st.selectbox("Status", options=["All","New","Follow-up","Active","Done","Lost"], index=0)
     with f3:
@@ -306,23 +258,24 @@ def customers_app():
     tbl["Next Follow-up"] = tbl["next_follow_up"].fillna("")
     tbl["Last Activity"] = tbl["last_activity"].fillna("")
 
-    def compute_fin(row):
-        q,i,r,o = calculate_customer_finances(row.get("client_name",""), row.get("phone",""))
-        return pd.Series({
-            "Total Quotations (AED)": q,
-            "Total Invoices (AED)": i,
-            "Total Paid (AED)": r,
-            "Remaining (AED)": o,
-        })
-
-    fin_cols = tbl.apply(compute_fin, axis=1)
-    for c in ["Total Quotations (AED)","Total Invoices (AED)","Total Paid (AED)","Remaining (AED)"]:
-        tbl[c] = fin_cols[c]
+    # All customers in one pass (groupby totals by phone / name)
+    fin_cols = ledger.customer_totals(tbl)
+    tbl["Total Quotations (AED)"] = fin_cols["q"]
+    tbl["Total Invoices (AED)"] = fin_cols["i"]
+    tbl["Total Paid (AED)"] = fin_cols["r"]
+    tbl["Remaining (AED)"] = fin_cols["outstanding"]
 
     # Apply filters
     if q:
         ql = q.strip().lower()
-        tbl = tbl[tbl.apply(lambda r: ql in str(r["Client Name"]).lower() or ql in str(r["Phone"]).lower(), axis=1)]
+        match = (
+            tbl["Client Name"].astype(str).str.lower().str.contains(ql, regex=False)
+            | tbl["Phone"].astype(str).str.lower().str.contains(ql, regex=False)
+        )
+        digits = ''.join(filter(str.isdigit, ql))
+        if digits:
+            match |= tbl["phone_key"].astype(str).str.contains(digits, regex=False)
+        tbl = tbl[match]
     if status_filter != "All":
         tbl = tbl[tbl["Status"].astype(str) == status_filter]
     if location_filter != "All":
@@ -384,7 +337,7 @@ def customers_app():
 
     if selected_name:
         row = customers[customers["client_name"].astype(str) == selected_name].iloc[0]
-        total_q, total_i, total_r, outstanding = calculate_customer_finances(selected_name)
+        total_q, total_i, total_r, outstanding = ledger.totals(selected_name, row.get("phone"))
 
         cA, cB = st.columns([1,1])
         with cA:
@@ -418,7 +371,7 @@ def customers_app():
                 if st.button("Create Quotation"):
                     st.session_state["active_page"] = "quotation"
                     st.session_state["client_name"] = proper_case(row['client_name'])
-                    st.session_state["client_phone"] = phone_flat10(row['phone'])
+                    st.session_state["client_phone"] = phone_key(row['phone'])
                     st.session_state["client_location"] = row['location']
                     st.rerun()
             with cI:
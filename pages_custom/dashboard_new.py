@@ -6,6 +6,10 @@ try:
     from utils import db as _db
 except Exception:
     _db = None
+from utils import kpi_snapshots, lifecycle
+
+TREND_DAYS = 90
+LIFECYCLE_ROWS = 15
 
 # Apple-style icon grid for dashboard header
 def _app_icon_grid():
@@ -73,25 +77,26 @@ def dashboard_new_app():
                 df[col] = None
         return df[columns]
 
-    records = _load_or_empty(
-        "data/records.xlsx",
-        ["base_id", "date", "type", "number", "amount", "client_name", "phone", "location", "note"],
-    )
+    def _load_records():
+        return _load_or_empty(
+            "data/records.xlsx",
+            ["base_id", "date", "type", "number", "amount", "client_name", "phone", "location", "note"],
+        )
+
     customers = _load_or_empty(
         "data/customers.xlsx",
         ["client_name", "phone", "location", "last_activity", "status"],
     )
 
-    rec = records.copy()
-    if not rec.empty and "date" in rec.columns:
-        rec["date"] = pd.to_datetime(rec["date"], errors="coerce")
+    # Daily snapshots (a few hundred rows); the ledger is only read to backfill them
+    kpis = kpi_snapshots.daily(_load_records)
 
-    total_q = int((rec["type"] == "q").sum()) if "type" in rec.columns else 0
-    total_i = int((rec["type"] == "i").sum()) if "type" in rec.columns else 0
-    total_r = int((rec["type"] == "r").sum()) if "type" in rec.columns else 0
-    total_invoice_amount = float(rec.loc[rec.get("type","") == "i", "amount"].sum()) if "amount" in rec.columns else 0.0
-    total_received = float(rec.loc[rec.get("type","") == "r", "amount"].sum()) if "amount" in rec.columns else 0.0
-    remaining_balance = total_invoice_amount - total_received
+    total_q = int(kpis["q_count"].sum())
+    total_i = int(kpis["i_count"].sum())
+    total_r = int(kpis["r_count"].sum())
+    total_invoice_amount = float(kpis["i_amount"].sum())
+    total_received = float(kpis["received"].sum())
+    remaining_balance = float(kpis["outstanding"].iloc[-1]) if not kpis.empty else 0.0
 
     c1, c2, c3 = st.columns(3)
     with c1: _metric("Quotations", total_q, "Active proposals")
@@ -103,46 +108,55 @@ def dashboard_new_app():
     with c5: _metric("Received", f"AED {total_received:,.0f}")
     with c6: _metric("Outstanding", f"AED {remaining_balance:,.0f}")
 
+    trend = kpis[kpis["day"] != ""].tail(TREND_DAYS)
+    if not trend.empty:
+        trend = trend.assign(day=pd.to_datetime(trend["day"])).set_index("day")
+        st.markdown('<div class="section-title">Trends</div>', unsafe_allow_html=True)
+        t1, t2 = st.columns(2)
+        with t1:
+            st.bar_chart(trend[["i_amount", "received"]].rename(columns={"i_amount": "Invoiced", "received": "Received"}), height=220)
+        with t2:
+            st.line_chart(
+                trend[["outstanding", "new_customers"]].rename(columns={"outstanding": "Outstanding", "new_customers": "New customers"}),
+                height=220,
+            )
+
     st.markdown('<div class="section-title">Project Lifecycle Tracking</div>', unsafe_allow_html=True)
     st.markdown('<div class="table-wrap">', unsafe_allow_html=True)
     # English Project Lifecycle Table with icons
-    lifecycle_data = pd.DataFrame([
-        {"Base ID": "20251116-002", "Client": "Fahad Ahmed Mohammed", "Phone": "5292932", "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": True, "Receipt": True, "Amount": 5639.93, "Balance": 5639.93, "Last Update": "2025-11-20 00:00:00"},
-        {"Base ID": "20251116-004", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-16 00:00:00"},
-        {"Base ID": "20251116-012", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-16 00:00:00"},
-        {"Base ID": "20251117-003", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-17 00:00:00"},
-        {"Base ID": "20251118-002", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-18 00:00:00"},
-        {"Base ID": "20251119-002", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-19 00:00:00"},
-        {"Base ID": "20251120-003", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-20 00:00:00"},
-        {"Base ID": "20251120-005", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-20 00:00:00"},
-        {"Base ID": "20251120-007", "Client": "Fahad Ahmed", "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": True, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-20 00:00:00"},
-    ])
+    view = lifecycle.get_view(_load_records)
+    view = view.sort_values("last_update", ascending=False, na_position="last").head(LIFECYCLE_ROWS)
+    lifecycle_data = pd.DataFrame({
+        "Base ID": view["base_id"],
+        "Client": view["client"],
+        "Phone": view["phone"],
+        "Location": view["location"],
+        "Quotation": view["has_q"],
+        "Invoice": view["has_i"],
+        "Receipt": view["has_r"],
+        "Amount": view["invoiced"],
+        "Balance": view["balance"],
+        "Last Update": view["last_update"],
+    })
     # تحويل القيم True/False إلى رموز
     for col in ["Quotation", "Invoice", "Receipt"]:
         lifecycle_data[col] = lifecycle_data[col].apply(lambda x: "<span style='font-size:22px;'>✅</span>" if x else "<span style='font-size:22px;'>❌</span>")
     # تنسيق المبلغ بدقتين عشريتين
     lifecycle_data["Amount"] = lifecycle_data["Amount"].apply(lambda x: f"{x:,.2f}")
     lifecycle_data["Balance"] = lifecycle_data["Balance"].apply(lambda x: f"{x:,.2f}")
-    st.markdown(f"<div style='overflow-x:auto;'><table class='project-table'>{lifecycle_data.to_html(escape=False, index=False, classes='stTable')}</table></div>", unsafe_allow_html=True)
+    if lifecycle_data.empty:
+        st.write("No projects yet.")
+    else:
+        st.markdown(f"<div style='overflow-x:auto;'><table class='project-table'>{lifecycle_data.to_html(escape=False, index=False, classes='stTable')}</table></div>", unsafe_allow_html=True)
     st.markdown('</div>', unsafe_allow_html=True)
 
     two1, two2 = st.columns(2)
     with two1:
         st.markdown('<div class="section-title">Latest Invoices</div>', unsafe_allow_html=True)
         st.markdown('<div class="table-wrap">', unsafe_allow_html=True)
-        if not rec.empty and "type" in rec.columns:
-            last_10_invoices = (
-                rec[rec["type"] == "i"]
-                .sort_values("date", ascending=False, na_position="last")
-                .head(10)[["date", "number", "client_name", "amount"]]
-            )
-            if not last_10_invoices.empty:
-                d = last_10_invoices.copy()
-                if "date" in d.columns:
-                    d["date"] = pd.to_datetime(d["date"], errors="coerce").dt.strftime("%Y-%m-%d")
-                st.table(d.rename(columns={"date": "Date", "number": "Invoice", "client_name": "Client", "amount": "Amount (AED)"}))
-            else:
-                st.write("No invoices yet.")
+        d = kpi_snapshots.latest_documents("i", 10)
+        if not d.empty:
+            st.table(d.rename(columns={"date": "Date", "number": "Invoice", "client_name": "Client", "amount": "Amount (AED)"}))
         else:
             st.write("No invoices yet.")
         st.markdown('</div>', unsafe_allow_html=True)
@@ -150,19 +164,9 @@ def dashboard_new_app():
     with two2:
         st.markdown('<div class="section-title">Latest Receipts</div>', unsafe_allow_html=True)
         st.markdown('<div class="table-wrap">', unsafe_allow_html=True)
-        if not rec.empty and "type" in rec.columns:
-            last_10_receipts = (
-                rec[rec["type"] == "r"]
-                .sort_values("date", ascending=False, na_position="last")
-                .head(10)[["date", "number", "client_name", "amount"]]
-            )
-            if not last_10_receipts.empty:
-                d = last_10_receipts.copy()
-                if "date" in d.columns:
-                    d["date"] = pd.to_datetime(d["date"], errors="coerce").dt.strftime("%Y-%m-%d")
-                st.table(d.rename(columns={"date": "Date", "number": "Receipt", "client_name": "Client", "amount": "Amount (AED)"}))
-            else:
-                st.write("No receipts yet.")
+        d = kpi_snapshots.latest_documents("r", 10)
+        if not d.empty:
+            st.table(d.rename(columns={"date": "Date", "number": "Receipt", "client_name": "Client", "amount": "Amount (AED)"}))
         else:
             st.write("No receipts yet.")
         st.markdown('</div>', unsafe_allow_html=True)
@@ -2,6 +2,8 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 import os
+import json
+import hashlib
 from pathlib import Path
 from utils.quotation_utils import render_quotation_html
 try:
@@ -9,6 +11,12 @@ try:
 except Exception:
     _db = None
 from utils.image_utils import ensure_data_url
+from utils.catalog_index import get_catalog_index
+from utils.record_events import record_saved
+from utils import export_service
+from utils import sequences
+from utils.phone import format_phone as format_phone_input, phone_key, with_phone_keys
+from utils import customer_index
 try:
     from utils.firebase_utils import save_invoice_to_firebase
 except Exception:
@@ -25,36 +33,6 @@ def proper_case(text):
 
 
 def invoice_app():
-    # Phone formatter (same logic as quotation)
-    def format_phone_input(raw_input):
-        if not raw_input:
-            return None
-        digits = ''.join(filter(str.isdigit, str(raw_input)))
-        if digits.startswith("0"):
-            digits = digits[1:]
-        if digits.startswith("5") and len(digits) == 9:
-            return f"+971 {digits[:2]} {digits[2:5]} {digits[5:]}"
-        return None
-    # Phone as 10-digit local (0502992932) for labels
-
-    def phone_flat10(raw_input):
-        if raw_input is None:
-            return ""
-        digits = ''.join(filter(str.isdigit, str(raw_input)))
-        if not digits:
-            return ""
-        if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
-            return '0' + digits[3:12]
-        if len(digits) == 9 and digits.startswith('5'):
-            return '0' + digits
-        if len(digits) == 10 and digits.startswith('05'):
-            return digits
-        return digits[-10:]
-
-    def phone_label_mask(raw_input):
-        flat = phone_flat10(raw_input)
-        return f"{flat} xxxxxxxxxx" if flat else "xxxxxxxxxx"
-
     # Page CSS (colors handled globally; keep geometry only)
     st.markdown("""
     <style>
@@ -80,22 +58,12 @@ def invoice_app():
     # (Header hero removed by request)
 
     # ---------------- LOAD DATA ----------------
-    # Load product catalog (DB-first, fallback to Excel)
-    catalog = None
-    if _db is not None:
-        try:
-            rows = _db.db_query(
-                'SELECT device as "Device", description as "Description", unit_price as "UnitPrice", warranty as "Warranty", image_base64 as "ImageBase64", image_path as "ImagePath" FROM products ORDER BY id')
-            if rows:
-                catalog = pd.DataFrame(rows)
-        except Exception:
-            catalog = None
-    if catalog is None:
-        try:
-            catalog = pd.read_excel("data/products.xlsx")
-        except Exception:
-            st.error("❌ Cannot load products.xlsx")
-            return
+    # Process-wide catalog index (DB-first, fallback to Excel): reloaded only when products change
+    try:
+        catalog_index = get_catalog_index()
+    except Exception:
+        st.error("❌ Cannot load products.xlsx")
+        return
 
     # simple records list for quotations to pick from
     def load_records():
@@ -119,32 +87,6 @@ def invoice_app():
                 "base_id", "date", "type", "number", "amount", "client_name", "phone", "location", "note"
             ])
 
-            for r in raw_items:
-                # Safely parse quantity from common keys
-                qty = 0.0
-                for k in ('Qty', 'qty', 'Quantity'):
-                    try:
-                        if k in r and r.get(k) is not None and str(r.get(k)).strip() != '':
-                            qty = float(r.get(k))
-                            break
-                    except Exception:
-                        continue
-        if {"type", "number"}.issubset(df.columns):
-            df = df.drop_duplicates(subset=["type", "number"], keep="last")
-
-        # حفظ في Firebase
-        if save_invoice_to_firebase is not None:
-            try:
-                for _, row in df.iterrows():
-                    record_dict = row.to_dict()
-                    record_dict = {k: (None if pd.isna(v) else v)
-                                   for k, v in record_dict.items()}
-                    save_invoice_to_firebase(record_dict)
-            except Exception as e:
-                print(f"⚠️ تحذير Firebase: {str(e)}")
-
-        df.to_excel("data/records.xlsx", index=False)
-
     # ---- Customers helpers (auto add/update) ----
     def ensure_customers_file():
         os.makedirs("data", exist_ok=True)
@@ -172,7 +114,7 @@ def invoice_app():
                 pass
         ensure_customers_file()
         try:
-            df = pd.read_excel("data/customers.xlsx")
+            df = pd.read_excel("data/customers.xlsx", dtype={"phone_key": str})
             df.columns = [c.strip().lower() for c in df.columns]
             return df
         except Exception:
@@ -183,8 +125,10 @@ def invoice_app():
 
     def save_customers(df: pd.DataFrame):
         os.makedirs("data", exist_ok=True)
+        df = with_phone_keys(df, refresh=True)
         if _db is not None:
             try:
+                customer_index.ensure_db_schema()
                 for _, row in df.iterrows():
                     name = str(row.get('client_name') or '')
                     phone = row.get('phone')
@@ -204,7 +148,7 @@ def invoice_app():
                     else:
                         try:
                             _db.db_execute(
-                                'INSERT INTO customers(name, phone, email, address) VALUES (%s,%s,%s,%s)', (name, phone, email, address))
+                                'INSERT INTO customers(name, phone, phone_key, email, address) VALUES (%s,%s,%s,%s,%s)', (name, phone, row.get('phone_key') or None, email, address))
                         except Exception:
                             pass
                 df.to_excel("data/customers.xlsx", index=False)
@@ -213,38 +157,26 @@ def invoice_app():
                 pass
         df.to_excel("data/customers.xlsx", index=False)
 
-    def _norm_phone(x: str):
-        digits = ''.join(filter(str.isdigit, str(x)))
-        if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
-            return '0' + digits[3:12]
-        if len(digits) == 9 and digits.startswith('5'):
-            return '0' + digits
-        if len(digits) == 10 and digits.startswith('05'):
-            return digits
-        return digits[-10:]
-
     def upsert_customer_from_invoice(name: str, phone: str, location: str):
         if not str(name).strip():
             return
         # Try DB upsert first, fallback to Excel
         if _db is not None:
             try:
-                existing = []
                 try:
-                    existing = _db.db_query(
-                        'SELECT id FROM customers WHERE name = %s OR phone = %s', (proper_case(name), phone))
+                    existing_id = customer_index.db_find(proper_case(name), phone)
                 except Exception:
-                    existing = []
-                if existing:
+                    existing_id = None
+                if existing_id is not None:
                     try:
-                        _db.db_execute('UPDATE customers SET phone = %s, address = %s WHERE id = %s', (
-                            phone, proper_case(location), existing[0].get('id')))
+                        _db.db_execute('UPDATE customers SET phone = %s, phone_key = %s, address = %s WHERE id = %s', (
+                            phone, phone_key(phone) or None, proper_case(location), existing_id))
                     except Exception:
                         pass
                 else:
                     try:
-                        _db.db_execute('INSERT INTO customers(name, phone, email, address) VALUES (%s,%s,%s,%s)', (proper_case(
-                            name), phone, '', proper_case(location)))
+                        _db.db_execute('INSERT INTO customers(name, phone, phone_key, email, address) VALUES (%s,%s,%s,%s,%s)', (proper_case(
+                            name), phone, phone_key(phone) or None, '', proper_case(location)))
                     except Exception:
                         pass
                 return
@@ -252,19 +184,9 @@ def invoice_app():
                 pass
 
         cdf = load_customers()
-        key = str(name).strip().lower()
-        idx = None
-        if not cdf.empty and "client_name" in cdf.columns:
-            m = cdf["client_name"].astype(str).str.strip().str.lower() == key
-            if m.any():
-                idx = m[m].index[0]
-            elif phone:
-                cdf_phone = cdf.get("phone", pd.Series(
-                    [], dtype=str)).apply(_norm_phone)
-                target = _norm_phone(phone)
-                pm = cdf_phone == target
-                if pm.any():
-                    idx = pm[pm].index[0]
+        # O(1) match by name, then by normalized phone
+        index = customer_index.get_customer_index(cdf)
+        idx = index.find(name, phone)
         if idx is None:
             new_row = {
                 "client_name": proper_case(name),
@@ -279,6 +201,7 @@ def invoice_app():
                 "last_activity": datetime.today().strftime('%Y-%m-%d'),
             }
             cdf = pd.concat([cdf, pd.DataFrame([new_row])], ignore_index=True)
+            idx = cdf.index[-1]
         else:
             cdf.loc[idx, "client_name"] = proper_case(name)
             if phone:
@@ -288,7 +211,9 @@ def invoice_app():
             if not str(cdf.loc[idx, "status"]).strip():
                 cdf.loc[idx, "status"] = "Active"
             cdf.loc[idx, "last_activity"] = datetime.today().strftime('%Y-%m-%d')
+        index.add(idx, proper_case(name), phone)
         save_customers(cdf)
+        customer_index.saved(index, cdf)
     records = load_records()
     quotes_df = records[records["type"] == "q"].copy()
 
@@ -300,10 +225,7 @@ def invoice_app():
                     "From Quotation", "New Invoice"], horizontal=True, key="inv_mode")
 
     # New numbering system: IYYYY#### (e.g., I20260001)
-    current_year = datetime.today().year
-    year_invoices = records[(records['type']=='i') & (records['number'].astype(str).str.startswith(f'I{current_year}'))]
-    next_seq = len(year_invoices) + 1
-    auto_no = f"I{current_year}{str(next_seq).zfill(4)}"
+    auto_no = sequences.peek_number("i", lambda: records)
 
     # Prefill defaults from previously selected quotation (before rendering widgets)
     sel_default_name = ""
@@ -337,13 +259,18 @@ def invoice_app():
             st.session_state["_last_q_selected"] = current_q
             st.rerun()
 
+    if "_inv_next_no" in st.session_state:
+        # Renumbered at save time: the displayed number had been taken by another save
+        st.session_state["inv_no"] = st.session_state.pop("_inv_next_no")
+
     # Row 1: Name | Invoice Number
     r1c1, r1c2 = st.columns(2)
     with r1c1:
         client_name = st.text_input(
             "Client Name", value=sel_default_name, key="inv_client")
     with r1c2:
-        invoice_no = st.text_input(
+        # Read back through st.session_state["inv_no"] by the export fragment
+        st.text_input(
             "Invoice Number", auto_no, disabled=True, key="inv_no")
 
     # UAE Locations (same as quotation)
@@ -467,107 +394,143 @@ def invoice_app():
     </div>
     """, unsafe_allow_html=True)
 
-    df = st.session_state.invoice_table.copy()
-    if not df.empty:
-        for i, row in df.iterrows():
-            cols = st.columns([4.5, 0.7, 1, 1, 0.7, 0.7])
-            with cols[0]:
-                st.markdown(
-                    f"<div class='added-product-row'><b>✓ {row['Product / Device']}</b></div>", unsafe_allow_html=True)
-            with cols[1]:
-                st.markdown(
-                    f"<div class='added-product-row'><span class='product-value'>{int(row['Qty'])}</span></div>", unsafe_allow_html=True)
-            with cols[2]:
-                st.markdown(
-                    f"<div class='added-product-row'><span class='product-value'>{row['Unit Price (AED)']:.2f}</span></div>", unsafe_allow_html=True)
-            with cols[3]:
-                st.markdown(
-                    f"<div class='added-product-row'><span class='product-value'>AED {row['Line Total (AED)']:.2f}</span></div>",
-                    unsafe_allow_html=True
-                )
-            with cols[4]:
-                st.markdown(
-                    f"<div class='added-product-row'><span class='product-value'>{int(row['Warranty (Years)'])} yr</span></div>", unsafe_allow_html=True)
-            with cols[5]:
-                if st.button("❌", key=f"delete_{i}"):
-                    st.session_state.invoice_table = st.session_state.invoice_table.drop(
-                        i).reset_index(drop=True)
-                    st.session_state.invoice_table["Item No"] = range(
-                        1, len(st.session_state.invoice_table)+1)
-                    st.rerun()
+    def _inv_totals():
+        """(product_total, installation, discount_value, discount_percent, total_discount, grand_total)."""
+        product_total = st.session_state.invoice_table["Line Total (AED)"].sum(
+        )
+        installation_cost = st.session_state.get("install_cost_inv_value", 0.0)
+        discount_value = st.session_state.get("disc_value_inv_value", 0.0)
+        discount_percent = st.session_state.get("disc_percent_inv_value", 0.0)
+        percent_value = (product_total + installation_cost) * \
+            (discount_percent / 100)
+        total_discount = percent_value + discount_value
+        grand_total = (product_total + installation_cost) - total_discount
+        return product_total, installation_cost, discount_value, discount_percent, total_discount, grand_total
+
+    # Line items, costs, payment terms and the download are fragments: their
+    # callbacks rerun only the sections listed here, not the whole page.
+    ITEM_SECTIONS = ["inv_items", "inv_totals", "inv_export"]
+    COST_SECTIONS = ["inv_costs", "inv_totals", "inv_export"]
+    TERM_SECTIONS = ["inv_terms", "inv_export"]
+
+    def _delete_item(i):
+        st.session_state.invoice_table = st.session_state.invoice_table.drop(
+            i).reset_index(drop=True)
+        st.session_state.invoice_table["Item No"] = range(
+            1, len(st.session_state.invoice_table)+1)
+        st.rerun(ITEM_SECTIONS)
+
+    def _add_item():
+        product = st.session_state.get("add_prod")
+        row = catalog_index.get(product)
+        if row is None:
+            return
+        qty = st.session_state["qty_inv"]
+        price = st.session_state["price_inv"]
+        # Attempt to attach image info from catalog (prefer Base64)
+        image_val = None
+        try:
+            raw_b64 = row.get(
+                'ImageBase64') if 'ImageBase64' in row.index else None
+            image_val = ensure_data_url(
+                raw_b64) if raw_b64 is not None else None
+        except Exception:
+            image_val = None
 
-    e = st.columns([4.5, 0.7, 1, 1, 0.7, 0.7])
-    with e[0]:
-        product = st.selectbox(
-            "Product", catalog["Device"], key="add_prod", label_visibility="collapsed")
-        row = catalog[catalog["Device"] == product].iloc[0]
-        desc = row["Description"]
-    # Sync defaults when product changes
-    if st.session_state.get("last_prod_inv") != product:
-        if "price_inv" not in st.session_state:
-            st.session_state["price_inv"] = float(row["UnitPrice"])
-        else:
+        new_item = {
+            "Item No": len(st.session_state.invoice_table) + 1,
+            "Product / Device": product,
+            "Description": row["Description"],
+            "Qty": qty,
+            "Unit Price (AED)": price,
+            "Line Total (AED)": qty * price,
+            "Warranty (Years)": st.session_state["war_inv"],
+            "ImagePath": row.get('ImagePath') if 'ImagePath' in row.index else None,
+            "ImageBase64": row.get('ImageBase64') if 'ImageBase64' in row.index else None,
+            "image": image_val,
+        }
+        st.session_state.invoice_table = pd.concat(
+            [st.session_state.invoice_table, pd.DataFrame([new_item])], ignore_index=True)
+        st.rerun(ITEM_SECTIONS)
+
+    def _costs_changed():
+        st.session_state["install_cost_inv_value"] = st.session_state.get("install_cost_inv", 0.0)
+        st.session_state["disc_value_inv_value"] = st.session_state.get("disc_value_inv", 0.0)
+        st.session_state["disc_percent_inv_value"] = st.session_state.get("disc_percent_inv", 0.0)
+        st.rerun(COST_SECTIONS)
+
+    @st.fragment(key="inv_items")
+    def _line_items():
+        df = st.session_state.invoice_table.copy()
+        if not df.empty:
+            for i, row in df.iterrows():
+                cols = st.columns([4.5, 0.7, 1, 1, 0.7, 0.7])
+                with cols[0]:
+                    st.markdown(
+                        f"<div class='added-product-row'><b>✓ {row['Product / Device']}</b></div>", unsafe_allow_html=True)
+                with cols[1]:
+                    st.markdown(
+                        f"<div class='added-product-row'><span class='product-value'>{int(row['Qty'])}</span></div>", unsafe_allow_html=True)
+                with cols[2]:
+                    st.markdown(
+                        f"<div class='added-product-row'><span class='product-value'>{row['Unit Price (AED)']:.2f}</span></div>", unsafe_allow_html=True)
+                with cols[3]:
+                    st.markdown(
+                        f"<div class='added-product-row'><span class='product-value'>AED {row['Line Total (AED)']:.2f}</span></div>",
+                        unsafe_allow_html=True
+                    )
+                with cols[4]:
+                    st.markdown(
+                        f"<div class='added-product-row'><span class='product-value'>{int(row['Warranty (Years)'])} yr</span></div>", unsafe_allow_html=True)
+                with cols[5]:
+                    st.button("❌", key=f"delete_{i}", on_click=_delete_item, args=(i,))
+
+        product_query = st.text_input(
+            "Search products", key="inv_product_search",
+            placeholder="🔎 Search products by name or description...", label_visibility="collapsed")
+        e = st.columns([4.5, 0.7, 1, 1, 0.7, 0.7])
+        with e[0]:
+            product = st.selectbox(
+                "Product", catalog_index.picker_options(product_query, st.session_state.get("add_prod")),
+                key="add_prod", label_visibility="collapsed")
+            row = catalog_index.get(product)
+            if row is None:
+                st.info("No products match your search.")
+                return
+        # Sync defaults when product changes
+        if st.session_state.get("last_prod_inv") != product:
             st.session_state["price_inv"] = float(row["UnitPrice"])
-        if "war_inv" not in st.session_state:
-            st.session_state["war_inv"] = int(row["Warranty"])
-        else:
             st.session_state["war_inv"] = int(row["Warranty"])
-        if "qty_inv" not in st.session_state:
             st.session_state["qty_inv"] = 1
-        else:
+            st.session_state["last_prod_inv"] = product
+
+        # Ensure keys exist (do not pass value= to widget)
+        if "qty_inv" not in st.session_state:
             st.session_state["qty_inv"] = 1
-        st.session_state["last_prod_inv"] = product
-
-    # Ensure keys exist (do not pass value= to widget)
-    if "qty_inv" not in st.session_state:
-        st.session_state["qty_inv"] = 1
-    if "price_inv" not in st.session_state:
-        st.session_state["price_inv"] = float(row["UnitPrice"])
-    if "war_inv" not in st.session_state:
-        st.session_state["war_inv"] = int(row["Warranty"])
-
-    with e[1]:
-        qty = st.number_input("Qty", min_value=1, step=1,
-                              label_visibility="collapsed", key="qty_inv")
-    with e[2]:
-        price = st.number_input(
-            "Unit Price (AED)", step=10.0, label_visibility="collapsed", key="price_inv")
-    line_total = qty * price
-    with e[3]:
-        st.markdown(
-            f"<div class='added-product-row'><span class='product-value'>AED {line_total:.2f}</span></div>",
-            unsafe_allow_html=True
-        )
-    with e[4]:
-        warranty = st.number_input("Warranty (Years)", min_value=0, value=st.session_state.get(
-            "war_inv", int(row["Warranty"])), step=1, label_visibility="collapsed", key="war_inv")
-    with e[5]:
-        if st.button("✅", key="add_inv_btn"):
-            # Attempt to attach image info from catalog (prefer Base64)
-            image_val = None
-            try:
-                raw_b64 = row.get(
-                    'ImageBase64') if 'ImageBase64' in row.index else None
-                image_val = ensure_data_url(
-                    raw_b64) if raw_b64 is not None else None
-            except Exception:
-                image_val = None
-
-            new_item = {
-                "Item No": len(st.session_state.invoice_table) + 1,
-                "Product / Device": product,
-                "Description": desc,
-                "Qty": qty,
-                "Unit Price (AED)": price,
-                "Line Total (AED)": line_total,
-                "Warranty (Years)": warranty,
-                "ImagePath": row.get('ImagePath') if 'ImagePath' in row.index else None,
-                "ImageBase64": row.get('ImageBase64') if 'ImageBase64' in row.index else None,
-                "image": image_val,
-            }
-            st.session_state.invoice_table = pd.concat(
-                [st.session_state.invoice_table, pd.DataFrame([new_item])], ignore_index=True)
-            st.rerun()
+        if "price_inv" not in st.session_state:
+            st.session_state["price_inv"] = float(row["UnitPrice"])
+        if "war_inv" not in st.session_state:
+            st.session_state["war_inv"] = int(row["Warranty"])
+
+        with e[1]:
+            qty = st.number_input("Qty", min_value=1, step=1,
+                                  label_visibility="collapsed", key="qty_inv")
+        with e[2]:
+            price = st.number_input(
+                "Unit Price (AED)", step=10.0, label_visibility="collapsed", key="price_inv")
+        line_total = qty * price
+        with e[3]:
+            st.markdown(
+                f"<div class='added-product-row'><span class='product-value'>AED {line_total:.2f}</span></div>",
+                unsafe_allow_html=True
+            )
+        with e[4]:
+            st.number_input("Warranty (Years)", min_value=0, step=1,
+                            label_visibility="collapsed", key="war_inv")
+        with e[5]:
+            st.button("✅", key="add_inv_btn", on_click=_add_item)
+
+    _line_items()
 
     # ---------- SUMMARY ----------
     st.markdown("---")
@@ -575,23 +538,13 @@ def invoice_app():
     # Two columns: Summary Table (left) | Installation & Discount (right)
     col_left, col_right = st.columns([1, 1])
 
-    with col_left:
+    @st.fragment(key="inv_totals")
+    def _totals_panel():
         st.markdown("<div class='section-title'>Project Costs</div>",
                     unsafe_allow_html=True)
 
         # Professional summary table (like receipt)
-        product_total = st.session_state.invoice_table["Line Total (AED)"].sum(
-        )
-
-        # Calculate installation/discount (needs to be defined before display)
-        installation_cost = st.session_state.get("install_cost_inv_value", 0.0)
-        discount_value = st.session_state.get("disc_value_inv_value", 0.0)
-        discount_percent = st.session_state.get("disc_percent_inv_value", 0.0)
-
-        percent_value = (product_total + installation_cost) * \
-            (discount_percent / 100)
-        total_discount = percent_value + discount_value
-        grand_total = (product_total + installation_cost) - total_discount
+        product_total, installation_cost, _, _, total_discount, grand_total = _inv_totals()
 
         st.markdown("""
         <div style='background:var(--bg-card);border:1px solid var(--border);border-radius:12px;padding:16px;'>
@@ -614,13 +567,15 @@ def invoice_app():
         </div>
         """.format(product_total, installation_cost, total_discount, grand_total), unsafe_allow_html=True)
 
-    with col_right:
+    @st.fragment(key="inv_costs")
+    def _cost_inputs():
         st.markdown(
             "<div class='section-title'>Installation & Discount</div>", unsafe_allow_html=True)
 
         # Installation Cost
         installation_cost = st.number_input(
-            "Installation & Operation Devices (AED)", min_value=0.0, step=50.0, key="install_cost_inv")
+            "Installation & Operation Devices (AED)", min_value=0.0, step=50.0, key="install_cost_inv",
+            on_change=_costs_changed)
         st.session_state["install_cost_inv_value"] = installation_cost
 
         # Discount section
@@ -629,13 +584,18 @@ def invoice_app():
         cD1, cD2 = st.columns(2)
         with cD1:
             discount_value = st.number_input(
-                "Discount Value (AED)", min_value=0.0, key="disc_value_inv")
+                "Discount Value (AED)", min_value=0.0, key="disc_value_inv", on_change=_costs_changed)
             st.session_state["disc_value_inv_value"] = discount_value
         with cD2:
             discount_percent = st.number_input(
-                "Discount %", min_value=0.0, max_value=100.0, key="disc_percent_inv")
+                "Discount %", min_value=0.0, max_value=100.0, key="disc_percent_inv", on_change=_costs_changed)
             st.session_state["disc_percent_inv_value"] = discount_percent
 
+    with col_right:
+        _cost_inputs()
+    with col_left:
+        _totals_panel()
+
     # ======================================================
     #      PAYMENT TERMS
     # ======================================================
@@ -652,78 +612,97 @@ def invoice_app():
             {'percent': 70, 'description': 'upon supply of smart home devices, including installation, system programming, configuration, testing, and commissioning.'},
         ]
 
-    # Quick preset buttons
-    col_presets = st.columns(3)
-    with col_presets[0]:
-        if st.button("📋 Preset: 30-70", use_container_width=True):
-            st.session_state.payment_terms_count = 2
-            st.session_state.payment_terms = [
-                {'percent': 30, 'description': 'upon contract signing, covering smart home infrastructure works including cabling, wiring, point preparation, and technical layouts.'},
-                {'percent': 70, 'description': 'upon supply of smart home devices, including installation, system programming, configuration, testing, and commissioning.'},
-            ]
-            st.rerun()
+    PAYMENT_PRESETS = {
+        "30-70": [
+            {'percent': 30, 'description': 'upon contract signing, covering smart home infrastructure works including cabling, wiring, point preparation, and technical layouts.'},
+            {'percent': 70, 'description': 'upon supply of smart home devices, including installation, system programming, configuration, testing, and commissioning.'},
+        ],
+        "50-50": [
+            {'percent': 50, 'description': 'upon order confirmation'},
+            {'percent': 50, 'description': 'upon project completion and handover'},
+        ],
+        "30-60-10": [
+            {'percent': 30, 'description': 'upon contract signing, covering smart home infrastructure works including cabling, wiring, point preparation, and technical layouts.'},
+            {'percent': 60, 'description': 'upon supply of smart home devices, including installation, system programming, configuration, testing, and commissioning.'},
+            {'percent': 10, 'description': 'upon final project handover, system completion, client approval.'},
+        ],
+    }
 
-    with col_presets[1]:
-        if st.button("📋 Preset: 50-50", use_container_width=True):
-            st.session_state.payment_terms_count = 2
-            st.session_state.payment_terms = [
-                {'percent': 50, 'description': 'upon order confirmation'},
-                {'percent': 50, 'description': 'upon project completion and handover'},
-            ]
-            st.rerun()
+    def _reset_term_widgets():
+        # Keyed inputs keep their old values; drop them so they show the new terms
+        for k in list(st.session_state.keys()):
+            if k.startswith(("payment_percent_", "payment_desc_")):
+                del st.session_state[k]
+
+    def _apply_preset(name):
+        _reset_term_widgets()
+        st.session_state.payment_terms_count = len(PAYMENT_PRESETS[name])
+        st.session_state.payment_terms = [dict(t) for t in PAYMENT_PRESETS[name]]
+        st.rerun(TERM_SECTIONS)
+
+    def _delete_term(i):
+        _reset_term_widgets()
+        st.session_state.payment_terms_count -= 1
+        st.session_state.payment_terms.pop(i)
+        st.rerun(TERM_SECTIONS)
+
+    def _add_term():
+        st.session_state.payment_terms_count += 1
+        st.session_state.payment_terms.append(
+            {'percent': 0, 'description': ''})
+        st.rerun(TERM_SECTIONS)
 
-    with col_presets[2]:
-        if st.button("📋 Preset: 30-60-10", use_container_width=True):
-            st.session_state.payment_terms_count = 3
-            st.session_state.payment_terms = [
-                {'percent': 30, 'description': 'upon contract signing, covering smart home infrastructure works including cabling, wiring, point preparation, and technical layouts.'},
-                {'percent': 60, 'description': 'upon supply of smart home devices, including installation, system programming, configuration, testing, and commissioning.'},
-                {'percent': 10, 'description': 'upon final project handover, system completion, client approval.'},
-            ]
-            st.rerun()
+    def _terms_changed():
+        st.rerun(TERM_SECTIONS)
 
-    st.markdown("<div style='margin:12px 0;'></div>", unsafe_allow_html=True)
+    @st.fragment(key="inv_terms")
+    def _payment_terms_editor():
+        # Quick preset buttons
+        col_presets = st.columns(3)
+        for col, name in zip(col_presets, PAYMENT_PRESETS):
+            with col:
+                st.button(f"📋 Preset: {name}", use_container_width=True, on_click=_apply_preset, args=(name,))
 
-    # Dynamic payment terms inputs
-    st.markdown("**Add/Edit Payment Terms:**")
+        st.markdown("<div style='margin:12px 0;'></div>", unsafe_allow_html=True)
 
-    payment_terms_list = []
-    for i in range(st.session_state.payment_terms_count):
-        col_term = st.columns([1, 3, 1])
+        # Dynamic payment terms inputs
+        st.markdown("**Add/Edit Payment Terms:**")
 
-        # Get existing value or default
-        existing_term = st.session_state.payment_terms[i] if i < len(
-            st.session_state.payment_terms) else {'percent': 0, 'description': ''}
+        payment_terms_list = []
+        for i in range(st.session_state.payment_terms_count):
+            col_term = st.columns([1, 3, 1])
 
-        with col_term[0]:
-            percent = st.number_input(f"% Payment {i+1}", min_value=0.0, max_value=100.0,
-                                      value=float(existing_term.get('percent', 0)), step=1.0, key=f"payment_percent_{i}")
+            # Get existing value or default
+            existing_term = st.session_state.payment_terms[i] if i < len(
+                st.session_state.payment_terms) else {'percent': 0, 'description': ''}
 
-        with col_term[1]:
-            description = st.text_input(f"Description {i+1}",
-                                        value=existing_term.get(
-                                            'description', ''),
-                                        placeholder="e.g., upon contract signing...",
-                                        key=f"payment_desc_{i}")
+            with col_term[0]:
+                percent = st.number_input(f"% Payment {i+1}", min_value=0.0, max_value=100.0,
+                                          value=float(existing_term.get('percent', 0)), step=1.0, key=f"payment_percent_{i}",
+                                          on_change=_terms_changed)
 
-        with col_term[2]:
-            if st.button("🗑️", key=f"delete_payment_{i}", help="Remove this payment term"):
-                st.session_state.payment_terms_count -= 1
-                st.session_state.payment_terms.pop(i)
-                st.rerun()
+            with col_term[1]:
+                description = st.text_input(f"Description {i+1}",
+                                            value=existing_term.get(
+                                                'description', ''),
+                                            placeholder="e.g., upon contract signing...",
+                                            key=f"payment_desc_{i}",
+                                            on_change=_terms_changed)
 
-        payment_terms_list.append(
-            {'percent': percent, 'description': description})
+            with col_term[2]:
+                st.button("🗑️", key=f"delete_payment_{i}", help="Remove this payment term",
+                          on_click=_delete_term, args=(i,))
 
-    # Update session state with current values
-    st.session_state.payment_terms = payment_terms_list
+            payment_terms_list.append(
+                {'percent': percent, 'description': description})
 
-    # Add new term button
-    if st.button("➕ Add Payment Term", use_container_width=True):
-        st.session_state.payment_terms_count += 1
-        st.session_state.payment_terms.append(
-            {'percent': 0, 'description': ''})
-        st.rerun()
+        # Update session state with current values
+        st.session_state.payment_terms = payment_terms_list
+
+        # Add new term button
+        st.button("➕ Add Payment Term", use_container_width=True, on_click=_add_term)
+
+    _payment_terms_editor()
 
     # ======================================================
     #      WARRANTY & LIABILITY
@@ -902,167 +881,190 @@ No cash refunds are provided under any circumstances."""
     st.markdown('<div class="section-title">Download Invoice</div>',
                 unsafe_allow_html=True)
 
-    # Recalculate totals
-    formatted_phone = format_phone_input(phone_raw) or phone_raw
-    product_total = st.session_state.invoice_table["Line Total (AED)"].sum()
-    installation_cost = st.session_state.get("install_cost_inv_value", 0.0)
-    discount_value = st.session_state.get("disc_value_inv_value", 0.0)
-    discount_percent = st.session_state.get("disc_percent_inv_value", 0.0)
-    percent_value = (product_total + installation_cost) * (discount_percent / 100)
-    total_discount = percent_value + discount_value
-    grand_total = (product_total + installation_cost) - total_discount
-
-    # Generate HTML Invoice
-    try:
-        # Prepare items
-        raw_items = st.session_state.invoice_table.to_dict('records') if 'invoice_table' in st.session_state else []
-        norm_items = []
-        for r in raw_items:
-            try:
-                qty_val = r.get('Qty')
-                qty = 0.0 if qty_val is None or qty_val == '' else float(qty_val)
-            except Exception:
-                qty = 0.0
-            try:
-                unit_price = float(r.get('Unit Price (AED)') or r.get('Unit Price') or r.get('unit_price') or 0)
-            except Exception:
-                unit_price = 0.0
-            try:
-                total = float(r.get('Line Total (AED)') or r.get('total') or qty * unit_price)
-            except Exception:
-                total = qty * unit_price
-            item = {
-                'description': r.get('Description') or r.get('Product / Device') or r.get('Product') or r.get('Device') or '',
-                'qty': qty,
-                'unit_price': unit_price,
-                'total': total,
-                'warranty': r.get('Warranty (Years)') or r.get('Warranty') or r.get('war_inv') or '',
-                'ImagePath': None,
-                'ImageBase64': r.get('ImageBase64') if 'ImageBase64' in r else None,
-                'image': (r.get('image') if 'image' in r else ensure_data_url(r.get('ImageBase64') if 'ImageBase64' in r else None)),
-            }
-            norm_items.append(item)
-
-        # Calculate payment details
-        down_payment = float(st.session_state.get('inv_down_payment', 0.0) or 0.0)
-        previously_paid = float(st.session_state.get('inv_previously_paid', 0.0) or 0.0)
-        balance_due = grand_total - down_payment - previously_paid
-
-        # Build payment terms HTML
-        payment_terms_html = ""
-        payment_terms = st.session_state.get('payment_terms', [])
-        if payment_terms:
-            for term in payment_terms:
-                if term.get('percent') and term.get('description'):
-                    payment_terms_html += f"<li>{term.get('percent'):.0f}% {term.get('description')}</li>"
-
-        # Build warranty HTML
-        warranty_text = st.session_state.get('warranty_text', '')
-        warranty_shipping_cost = st.session_state.get('warranty_shipping_cost', 100.0)
-        warranty_html = warranty_text.format(shipping_cost=warranty_shipping_cost)
-
-        # Get additional details
-        power_provider = st.session_state.get('power_provider', 'ADDC – Abu Dhabi')
-        project_title = st.session_state.get('project_title', '')
-        project_description = st.session_state.get('project_description', '')
-
-        # Generate HTML
-        html_content = render_quotation_html({
-            'company_name': load_settings().get('company_name', 'Newton Smart Home'),
-            'quotation_number': invoice_no,
-            'quotation_date': datetime.today().strftime('%Y-%m-%d'),
-            'client_name': client_name,
-            'mobile': client_phone or phone_raw,
-            'client_address': client_location,
-            'project_location': client_location,
-            'items': norm_items,
-            'subtotal': product_total,
-            'Installation': installation_cost,
-            'total_amount': grand_total,
-            'down_payment': down_payment,
-            'previously_paid': previously_paid,
-            'project_title': project_title,
-            'project_description': project_description,
-            'balance_due': balance_due,
-            'payment_terms_html': payment_terms_html,
-            'warranty_html': warranty_html,
-            'power_provider': power_provider,
-            'delivery_text': st.session_state.get('inv_delivery_text', ''),
-            'bank_name': load_settings().get('bank_name', ''),
-            'bank_account': load_settings().get('bank_account', ''),
-            'bank_iban': load_settings().get('bank_iban', ''),
-            'sig_name': load_settings().get('default_prepared_by', ''),
-            'sig_role': load_settings().get('default_approved_by', ''),
-        }, template_name='newton_invoice_A4.html')
-
-        html_filename = f"Invoice_{invoice_no}.html"
-
-        # Single Download Button (HTML + Save Record + Firebase)
-        if st.download_button(
-            label="📥 Download Invoice (HTML)",
-            data=html_content,
-            file_name=html_filename,
-            mime='text/html',
-            use_container_width=True
-        ):
-            # Determine base_id
-            base_id = None
-            if mode == "From Quotation":
+    @st.fragment(key="inv_export")
+    def _export_section():
+        # Recalculate totals
+        formatted_phone = format_phone_input(phone_raw) or phone_raw
+        product_total, installation_cost, discount_value, discount_percent, total_discount, grand_total = _inv_totals()
+
+        # Generate HTML Invoice
+        try:
+            # Prepare items
+            raw_items = st.session_state.invoice_table.to_dict('records') if 'invoice_table' in st.session_state else []
+            norm_items = []
+            for r in raw_items:
                 try:
-                    q_row = records[records["number"] == st.session_state.get("q_select_inline")].iloc[0]
-                    base_id = q_row.get("base_id", None)
+                    qty_val = r.get('Qty')
+                    qty = 0.0 if qty_val is None or qty_val == '' else float(qty_val)
                 except Exception:
-                    base_id = None
-            if not base_id:
-                today_id = datetime.today().strftime('%Y%m%d')
-                same_day = records[records["base_id"].astype(str).str.contains(today_id, na=False)] if not records.empty else pd.DataFrame()
-                seq = len(same_day) + 1
-                base_id = f"{today_id}-{str(seq).zfill(3)}"
-
-            # Prepare invoice data
-            invoice_data = {
-                "base_id": base_id,
-                "date": datetime.today().strftime('%Y-%m-%d'),
-                "type": "i",
-                "number": invoice_no,
-                "amount": grand_total,
-                "client_name": client_name,
-                "phone": phone_raw,
-                "location": client_location,
-                "note": st.session_state.get("q_select_inline") or "",
-                "products": norm_items,
-                "installation_cost": installation_cost,
-                "discount_value": discount_value,
-                "discount_percent": discount_percent,
-                "down_payment": down_payment,
-                "previously_paid": previously_paid,
-                "balance_due": balance_due,
-            }
-
-            # Save to records
-            save_record(invoice_data)
-
-            # Save to Firebase
-            if save_invoice_to_firebase is not None:
+                    qty = 0.0
                 try:
-                    save_invoice_to_firebase(invoice_data)
-                except Exception as e:
-                    print(f"⚠️ Firebase warning: {str(e)}")
-
-            # Update customer
-            upsert_customer_from_invoice(client_name, phone_raw, client_location)
-
-            # Save HTML file locally
-            out_dir = Path('data') / 'exports'
-            out_dir.mkdir(parents=True, exist_ok=True)
-            html_path = out_dir / html_filename
-            with open(html_path, 'w', encoding='utf-8') as fh:
-                fh.write(html_content)
-
-            st.success(f"✅ Invoice saved! ID: {base_id}")
-
-    except Exception as e:
-        st.error(f"❌ Error generating invoice: {e}")
+                    unit_price = float(r.get('Unit Price (AED)') or r.get('Unit Price') or r.get('unit_price') or 0)
+                except Exception:
+                    unit_price = 0.0
+                try:
+                    total = float(r.get('Line Total (AED)') or r.get('total') or qty * unit_price)
+                except Exception:
+                    total = qty * unit_price
+                item = {
+                    'description': r.get('Description') or r.get('Product / Device') or r.get('Product') or r.get('Device') or '',
+                    'qty': qty,
+                    'unit_price': unit_price,
+                    'total': total,
+                    'warranty': r.get('Warranty (Years)') or r.get('Warranty') or r.get('war_inv') or '',
+                    'ImagePath': None,
+                    'ImageBase64': r.get('ImageBase64') if 'ImageBase64' in r else None,
+                    'image': (r.get('image') if 'image' in r else ensure_data_url(r.get('ImageBase64') if 'ImageBase64' in r else None)),
+                }
+                norm_items.append(item)
+
+            # Calculate payment details
+            down_payment = float(st.session_state.get('inv_down_payment', 0.0) or 0.0)
+            previously_paid = float(st.session_state.get('inv_previously_paid', 0.0) or 0.0)
+            balance_due = grand_total - down_payment - previously_paid
+
+            # Build payment terms HTML
+            payment_terms_html = ""
+            payment_terms = st.session_state.get('payment_terms', [])
+            if payment_terms:
+                for term in payment_terms:
+                    if term.get('percent') and term.get('description'):
+                        payment_terms_html += f"<li>{term.get('percent'):.0f}% {term.get('description')}</li>"
+
+            # Build warranty HTML
+            warranty_text = st.session_state.get('warranty_text', '')
+            warranty_shipping_cost = st.session_state.get('warranty_shipping_cost', 100.0)
+            warranty_html = warranty_text.format(shipping_cost=warranty_shipping_cost)
+
+            # Get additional details
+            power_provider = st.session_state.get('power_provider', 'ADDC – Abu Dhabi')
+            project_title = st.session_state.get('project_title', '')
+            project_description = st.session_state.get('project_description', '')
+
+            # Template context; the HTML itself is rendered when the button is clicked
+            doc_no = st.session_state.get("_inv_next_no") or st.session_state.get("inv_no", auto_no)
+            _s = load_settings()
+            context = {
+                'company_name': _s.get('company_name', 'Newton Smart Home'),
+                'quotation_number': doc_no,
+                'quotation_date': datetime.today().strftime('%Y-%m-%d'),
+                'client_name': client_name,
+                'mobile': client_phone or phone_raw,
+                'client_address': client_location,
+                'project_location': client_location,
+                'items': norm_items,
+                'subtotal': product_total,
+                'Installation': installation_cost,
+                'total_amount': grand_total,
+                'down_payment': down_payment,
+                'previously_paid': previously_paid,
+                'project_title': project_title,
+                'project_description': project_description,
+                'balance_due': balance_due,
+                'payment_terms_html': payment_terms_html,
+                'warranty_html': warranty_html,
+                'power_provider': power_provider,
+                'delivery_text': st.session_state.get('inv_delivery_text', ''),
+                'bank_name': _s.get('bank_name', ''),
+                'bank_account': _s.get('bank_account', ''),
+                'bank_iban': _s.get('bank_iban', ''),
+                'sig_name': _s.get('default_prepared_by', ''),
+                'sig_role': _s.get('default_approved_by', ''),
+            }
+            version = hashlib.sha1(json.dumps(context, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+            build_html = lambda: render_quotation_html(context, template_name='newton_invoice_A4.html')
+
+            html_filename = f"Invoice_{doc_no}.html"
+
+            # Single Download Button (HTML + Save Record + Firebase)
+            if st.download_button(
+                label="📥 Download Invoice (HTML)",
+                data=export_service.lazy("invoice_html", version, build_html),
+                file_name=html_filename,
+                mime='text/html',
+                use_container_width=True
+            ):
+                html_content = export_service.get("invoice_html", version, build_html).decode("utf-8")
+
+                # Determine base_id
+                base_id = None
+                if mode == "From Quotation":
+                    try:
+                        q_row = records[records["number"] == st.session_state.get("q_select_inline")].iloc[0]
+                        base_id = q_row.get("base_id", None)
+                    except Exception:
+                        base_id = None
+                if not base_id:
+                    base_id = sequences.next_base_id(lambda: records)
+
+                # Reserve the number now; a number another session saved first is
+                # replaced by a fresh one and the export is re-stamped with it.
+                # Saving the same invoice again in this session keeps its number.
+                taken_no = None
+                if doc_no != st.session_state.get("_inv_saved_no") and not sequences.claim_number("i", doc_no, lambda: records):
+                    taken_no, doc_no = doc_no, sequences.next_number("i", lambda: records)
+                    context['quotation_number'] = doc_no
+                    html_content = render_quotation_html(context, template_name='newton_invoice_A4.html')
+                    html_filename = f"Invoice_{doc_no}.html"
+                    st.session_state["_inv_next_no"] = doc_no
+                st.session_state["_inv_saved_no"] = doc_no
+
+                # Prepare invoice data
+                invoice_data = {
+                    "base_id": base_id,
+                    "date": datetime.today().strftime('%Y-%m-%d'),
+                    "type": "i",
+                    "number": doc_no,
+                    "amount": grand_total,
+                    "client_name": client_name,
+                    "phone": phone_raw,
+                    "location": client_location,
+                    "note": st.session_state.get("q_select_inline") or "",
+                    "products": norm_items,
+                    "installation_cost": installation_cost,
+                    "discount_value": discount_value,
+                    "discount_percent": discount_percent,
+                    "down_payment": down_payment,
+                    "previously_paid": previously_paid,
+                    "balance_due": balance_due,
+                }
+
+                # Save to records
+                save_record(invoice_data)
+
+                # Save to Firebase
+                if save_invoice_to_firebase is not None:
+                    try:
+                        save_invoice_to_firebase(invoice_data)
+                    except Exception as e:
+                        print(f"⚠️ Firebase warning: {str(e)}")
+
+                # Update customer
+                upsert_customer_from_invoice(client_name, phone_raw, client_location)
+
+                # Save HTML file locally
+                out_dir = Path('data') / 'exports'
+                out_dir.mkdir(parents=True, exist_ok=True)
+                html_path = out_dir / html_filename
+                with open(html_path, 'w', encoding='utf-8') as fh:
+                    fh.write(html_content)
+
+                st.success(f"✅ Invoice saved! ID: {base_id}")
+                if taken_no:
+                    st.warning(f"⚠️ {taken_no} was already saved by another user; this invoice was saved as {doc_no}.")
+                    st.download_button(
+                        label=f"📥 Download {doc_no}",
+                        data=html_content,
+                        file_name=html_filename,
+                        mime='text/html',
+                        use_container_width=True,
+                        key=f"renumbered_dl_{doc_no}",
+                    )
+
+        except Exception as e:
+            st.error(f"❌ Error generating invoice: {e}")
+
+    _export_section()
 
 
 def load_settings():
@@ -1100,3 +1102,4 @@ def save_record(record: dict):
         ])
     df = pd.concat([df, pd.DataFrame([record])], ignore_index=True)
     df.to_excel(path, index=False)
+    record_saved(record)
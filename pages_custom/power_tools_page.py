@@ -6,10 +6,11 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 import os
-import base64
 from pathlib import Path
 import json
 
+from utils.assets import image_src
+
 try:
     from utils.openai_utils import chat_with_ai, generate_document, analyze_file
 except:
@@ -47,11 +48,8 @@ def power_tools_app():
 
     # Hero Header with Logo
     logo_path = Path("data") / "logo.png"
-    logo_html = ""
-    if logo_path.exists():
-        with open(logo_path, "rb") as f:
-            logo_b64 = base64.b64encode(f.read()).decode()
-            logo_html = f'<img src="data:image/png;base64,{logo_b64}" style="height:60px; margin-bottom:12px;">'
+    logo_src = image_src(logo_path)
+    logo_html = f'<img src="{logo_src}" style="height:60px; margin-bottom:12px;">' if logo_src else ""
 
     st.markdown(f"""
     <div class='power-card'>
@@ -62,12 +60,13 @@ def power_tools_app():
     """, unsafe_allow_html=True)
 
     # Create tabs for different tools
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "📁 File Storage", 
         "🎨 Logo Manager", 
         "🤖 AI Assistant", 
         "📝 Document Editor",
-        "⚙️ Advanced Tools"
+        "⚙️ Advanced Tools",
+        "🧮 Reconcile"
     ])
 
     # ==========================================
@@ -345,6 +344,30 @@ def power_tools_app():
                 except Exception as e:
                     st.error(f"Error: {e}")
         
+        if st.button("🖼️ Sync All Product Images", use_container_width=True):
+            try:
+                from utils.firebase_utils import sync_all_product_images_to_storage
+                from pages_custom.products_page import load_products
+                bar = st.progress(0.0, text="Uploading product images...")
+                report = sync_all_product_images_to_storage(
+                    load_products(),
+                    progress=lambda done, total: bar.progress(done / total, text=f"Checked {done}/{total} images"),
+                )
+                if report is None:
+                    st.error("❌ Firebase is not configured")
+                else:
+                    m1, m2, m3, m4 = st.columns(4)
+                    m1.metric("Uploaded", report["uploaded"])
+                    m2.metric("Unchanged", report["skipped"])
+                    m3.metric("Failed", report["failed"])
+                    m4.metric("Throughput", f"{report['images_per_sec']} img/s")
+                    st.caption(f"{report['bytes'] / 1e6:.2f} MB in {report['seconds']}s ({report['mb_per_sec']} MB/s)")
+                    failed = [r for r in report["results"] if r["status"] == "failed"]
+                    if failed:
+                        st.dataframe(pd.DataFrame(failed), use_container_width=True, hide_index=True)
+            except Exception as e:
+                st.error(f"Error: {e}")
+        
         st.markdown('</div>', unsafe_allow_html=True)
         
         # System Info
@@ -363,3 +386,54 @@ def power_tools_app():
             st.write(f"**{key}:** {value}")
         
         st.markdown('</div>', unsafe_allow_html=True)
+
+    # ==========================================
+    # TAB 6: RECONCILE STORES
+    # ==========================================
+    with tab6:
+        st.markdown('<div class="section-header">🧮 Reconcile Excel / Postgres / Firebase</div>', unsafe_allow_html=True)
+        st.caption("Compares per-bucket hashes (records by month, customers and products by name prefix) and only "
+                   "drills into buckets that differ. Read-only: the repair plan lists what would change.")
+        
+        from utils.reconcile import DATASETS, STORES, reconcile, discrepancies_frame
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            datasets = st.multiselect("Datasets", list(DATASETS), default=list(DATASETS), key="reconcile_datasets")
+        with c2:
+            stores = st.multiselect("Stores", list(STORES), default=list(STORES), key="reconcile_stores")
+        with c3:
+            source = st.selectbox("Source of truth", ["auto"] + list(STORES), key="reconcile_source")
+        
+        if st.button("🔍 Run Reconciliation", use_container_width=True, disabled=not datasets or len(stores) < 2):
+            with st.spinner("Comparing stores..."):
+                try:
+                    st.session_state["_reconcile_result"] = reconcile(
+                        datasets, stores, None if source == "auto" else source
+                    )
+                except Exception as e:
+                    st.error(f"Error: {e}")
+        
+        result = st.session_state.get("_reconcile_result")
+        if result:
+            summary = pd.DataFrame([{
+                "Dataset": r["dataset"],
+                "Stores": ", ".join(r["stores"]),
+                "Buckets": r["buckets_total"],
+                "Mismatched": r["buckets_mismatched"],
+                "Rows fetched": r["rows_fetched"],
+                "Discrepancies": len(r["discrepancies"]),
+            } for r in result["reports"]])
+            st.dataframe(summary, use_container_width=True, hide_index=True)
+            frame = discrepancies_frame(result)
+            if frame.empty:
+                st.success("✅ All compared stores agree")
+            else:
+                st.dataframe(frame, use_container_width=True, hide_index=True)
+                st.markdown(f"**Repair plan** (source of truth: `{result['source']}`)")
+                st.dataframe(pd.DataFrame(result["plan"]), use_container_width=True, hide_index=True)
+                st.download_button(
+                    "📥 Download Report (JSON)",
+                    data=json.dumps(result, indent=2, ensure_ascii=False),
+                    file_name=f"reconcile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                    mime="application/json",
+                )
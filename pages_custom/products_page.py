@@ -25,11 +25,24 @@ try:
     from utils import db as _db
 except Exception:
     _db = None
-from utils.image_utils import ensure_data_url
+from utils.image_utils import ensure_data_url, encode_to_budget, IMAGE_MIME
+from utils import image_store
+from utils.image_ingest import DEFAULT_CUTOFF, plan_ingest, ingest_images
+from utils.catalog_index import get_catalog_index, load_catalog
+from utils import data_version, export_service
+from utils.catalog_export import start_export_job, get_job, discard_job
+from utils.image_dedupe import (
+    DEFAULT_MAX_DISTANCE,
+    build_index,
+    find_duplicate_groups,
+    describe_groups,
+    collapse_catalog_duplicates,
+    quarantine_folder_duplicates,
+)
 try:
-    from utils.firebase_utils import save_product_to_firebase
+    from utils.firebase_utils import sync_products_to_firebase
 except Exception:
-    save_product_to_firebase = None
+    sync_products_to_firebase = None
 
 
 # ==========================================
@@ -57,34 +70,7 @@ def proper_case(text):
 
 def load_products() -> pd.DataFrame:
     ensure_product_file()
-    # Prefer DB source if available
-    if _db is not None:
-        try:
-            rows = _db.db_query(
-                'SELECT id, device as "Device", description as "Description", unit_price as "UnitPrice", warranty as "Warranty", image_base64 as "ImageBase64", image_path as "ImagePath" FROM products ORDER BY id'
-            )
-            if rows:
-                import pandas as _pd
-
-                df = _pd.DataFrame(rows)
-                for col in ["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]:
-                    if col not in df.columns:
-                        df[col] = None
-                return df[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]]
-        except Exception:
-            # Fall back to Excel
-            pass
-
-    try:
-        df = pd.read_excel("data/products.xlsx")
-        for col in ["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]:
-            if col not in df.columns:
-                df[col] = None
-        return df[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]]
-    except Exception:
-        return pd.DataFrame(
-            columns=["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]
-        )
+    return load_catalog()
 
 
 def save_products(df: pd.DataFrame):
@@ -95,14 +81,9 @@ def save_products(df: pd.DataFrame):
     df = df[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]]
     
     # حفظ في Firebase
-    if save_product_to_firebase is not None:
+    if sync_products_to_firebase is not None:
         try:
-            for _, row in df.iterrows():
-                device_val = row.get("Device")
-                if device_val and str(device_val).strip():
-                    product_dict = row.to_dict()
-                    product_dict = {k: (None if pd.isna(v) else v) for k, v in product_dict.items()}
-                    save_product_to_firebase(product_dict)
+            sync_products_to_firebase(df)
         except Exception as e:
             print(f"⚠️ تحذير Firebase: {str(e)}")
     
@@ -168,18 +149,23 @@ def save_products(df: pd.DataFrame):
         except Exception:
             pass
     df.to_excel("data/products.xlsx", index=False)
+    data_version.bump("products")
 
 
 # ==========================================
 # IMAGE HELPERS
 # ==========================================
-def image_to_base64(uploaded_file, target_size=None, mode="contain"):
+def image_to_base64(uploaded_file, target_size=None, mode="contain", fmt=None, max_bytes=None):
     """
     Convert an uploaded image file to base64 with optional resize/crop.
     Uses contain mode by default to fit inside the box without cropping or upscaling.
-    Flattens to a white background and saves as JPEG to avoid clipping and keep size small.
+    Flattens to a white background and encodes once to the size budget
+    (`product_image_max_kb`) in the configured format (`product_image_format`).
+    JPEG output is returned as raw base64; WebP/AVIF as a full data URI so the
+    MIME type is preserved.
     """
     try:
+        settings = load_settings()
         raw = Image.open(uploaded_file)
 
         # Always flatten on white to avoid dark/transparent backgrounds
@@ -191,7 +177,6 @@ def image_to_base64(uploaded_file, target_size=None, mode="contain"):
             raw = raw.convert("RGB")
 
         if target_size is None:
-            settings = load_settings()
             tw = int(settings.get("ui_product_image_width_px", 350))
             th = int(settings.get("ui_product_image_height_px", 195))
         else:
@@ -227,96 +212,46 @@ def image_to_base64(uploaded_file, target_size=None, mode="contain"):
             canvas.paste(img, offset)
             img = canvas
 
-        # Compress JPEG on a quality ladder to keep under Excel cell limits
-        data = None
-        for q in (80, 70, 60, 50):
-            buffered = BytesIO()
-            img.convert("RGB").save(buffered, format="JPEG", quality=q, optimize=True)
-            data = buffered.getvalue()
-            # Stop once size is reasonable for Excel cells (~24KB raw bytes -> ~32KB base64)
-            if len(data) <= 24000:
-                break
-        return base64.b64encode(data).decode()
+        # Search quality on the already-resized image (~24KB raw bytes -> ~32KB base64 fits Excel cells)
+        if fmt is None:
+            fmt = settings.get("product_image_format", "jpeg")
+        if max_bytes is None:
+            max_bytes = int(float(settings.get("product_image_max_kb", 24)) * 1000)
+        data, used_fmt = encode_to_budget(img.convert("RGB"), max_bytes=max_bytes, fmt=fmt)
+        encoded = base64.b64encode(data).decode()
+        if used_fmt != "jpeg":
+            return f"data:{IMAGE_MIME[used_fmt]};base64,{encoded}"
+        return encoded
     except Exception as e:
         st.error(f"Error processing image: {e}")
         return None
 
 
-def save_original_image(uploaded_file, device_name: str) -> str:
+def store_uploaded_image(uploaded_file):
     """
-    Legacy placeholder: do NOT save images to disk per Base64-only requirement.
-    This function intentionally does not write files and returns None.
+    Keep the original upload in the content-addressed image store and return its
+    `sha256:` key. Falls back to inline base64 if the store cannot be written.
     """
-    return None
-
-
-def insert_product_card(doc: Document, row: pd.Series, width_cm: float, height_cm: float, card_index: int):
-    table = doc.add_table(rows=2, cols=2)
-    table.style = "Table Grid"
-
-    # Image cell
-    img_cell = table.cell(0, 0)
-    img_cell.merge(table.cell(1, 0))
-    b64 = row.get("ImageBase64")
-    if b64 and pd.notna(b64):
-        try:
-            img_bytes = base64.b64decode(b64)
-            bio = BytesIO(img_bytes)
-            img_cell.text = ""
-            p = img_cell.paragraphs[0] if img_cell.paragraphs else img_cell.add_paragraph("")
-            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            run = p.add_run()
-            run.add_picture(bio, width=Cm(width_cm), height=Cm(height_cm))
-        except Exception:
-            img_cell.text = "No Image"
-    else:
-        img_cell.text = "No Image"
-
-    # Text cell
-    text_cell = table.cell(0, 1)
-    text_cell.paragraphs[0].text = ""
-    p = text_cell.paragraphs[0]
-    p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-    name_run = p.add_run(str(row.get("Device", "")))
-    name_run.bold = True
-    desc_p = text_cell.add_paragraph(str(row.get("Description", "")))
-    price_p = text_cell.add_paragraph(f"{row.get('UnitPrice', '')} AED")
-    price_p.paragraph_format.space_after = Pt(0)
-    warr_p = text_cell.add_paragraph(f"Warranty: {row.get('Warranty', '')}")
-    warr_p.paragraph_format.space_after = Pt(0)
-
-    # Spacing between cards and page break every 4
-    doc.add_paragraph("")
-    if (card_index + 1) % 4 == 0:
-        doc.add_page_break()
-
-
-def build_word_cards_document(products_df: pd.DataFrame) -> BytesIO:
-    if not HAVE_PYDOX:
-        raise RuntimeError("python-docx is not installed; catalog Word export unavailable.")
-    tpl = Path("data/catalog_template.docx")
-    if not tpl.exists():
-        raise FileNotFoundError("Catalog Word template not found at data/catalog_template.docx")
     try:
-        from utils.template_validator import validate_template, format_mismatch_message
-        missing, extra = validate_template(tpl, {})
-        # For the product catalog template we expect no special top-level placeholders,
-        # but still validate that replacements (none) don't contradict template usage.
-        if missing:
-            # If template expects keys we don't have, report clearly instead of failing silently
-            raise ValueError(f"Catalog template placeholders missing: {format_mismatch_message(missing, extra)}")
+        ref = image_store.put_upload(uploaded_file)
+        if ref:
+            return ref
+    except Exception as e:
+        print(f"Image store unavailable, keeping inline image: {e}")
+    data = image_to_base64(uploaded_file)
+    try:
+        uploaded_file.seek(0)
     except Exception:
-        # Propagate to caller for UI handling
-        raise
-
-    doc = Document(str(tpl))
-    width_cm = float(load_settings().get("quote_product_image_width_cm", 3.49))
-    height_cm = float(load_settings().get("quote_product_image_height_cm", 1.5))
+        pass
+    return data
 
-    for idx, (_, row) in enumerate(products_df.iterrows()):
-        insert_product_card(doc, row, width_cm, height_cm, idx)
 
-    return save_docx_to_buffer(doc)
+def save_original_image(uploaded_file, device_name: str) -> str:
+    """
+    Legacy placeholder: do NOT save images to disk per Base64-only requirement.
+    This function intentionally does not write files and returns None.
+    """
+    return None
 
 
 def save_docx_to_buffer(doc: Document) -> BytesIO:
@@ -332,7 +267,7 @@ def base64_to_image_html(base64_str, width=None, height=None):
         width = int(s.get("ui_product_image_width_px", 350))
         height = int(s.get("ui_product_image_height_px", 195))
     if base64_str and pd.notna(base64_str):
-        src = ensure_data_url(base64_str)
+        src = ensure_data_url(base64_str, size="grid")
         if src:
             return f'<img src="{src}" class="product-img">'
     return (
@@ -340,6 +275,52 @@ def base64_to_image_html(base64_str, width=None, height=None):
     )
 
 
+@st.fragment(run_every=1)
+def _product_cards_progress(job_id):
+    """Poll the background build every second without rerunning the page."""
+    job = get_job(job_id)
+    if job is None or job["status"] not in ("queued", "running"):
+        st.rerun()
+    total = max(int(job.get("total") or 0), 1)
+    if job.get("stage") == "cards":
+        st.progress(min(job["done"] / total, 1.0), text=f"Building cards {job['done']}/{total}...")
+    else:
+        st.progress(0.0, text="Preparing images...")
+
+
+def product_cards_job_panel():
+    job_id = st.session_state.get("_cards_job")
+    job = get_job(job_id)
+    if job is None:
+        st.session_state.pop("_cards_job", None)
+        return
+    if job["status"] in ("queued", "running"):
+        _product_cards_progress(job_id)
+    elif job["status"] == "error":
+        st.error(f"Product cards failed: {job['error']}")
+        if st.button("Dismiss", key="_cards_dismiss"):
+            st.session_state.pop("_cards_job", None)
+            st.rerun()
+    else:
+        path = Path(job["path"])
+        st.success(f"Product cards ready ({job['total']} products)")
+        st.download_button(
+            "Download Product Cards (Word)",
+            data=path.read_bytes() if path.exists() else b"",
+            file_name="product_cards.docx",
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            key="_cards_download",
+            on_click=_discard_cards_job,
+            args=(job_id,),
+        )
+
+
+def _discard_cards_job(job_id):
+    """The file was served with the page; drop it from data/exports once downloaded."""
+    discard_job(job_id)
+    st.session_state.pop("_cards_job", None)
+
+
 # ==========================================
 # PAGE
 # ==========================================
@@ -404,7 +385,8 @@ def products_app():
     st.markdown(css_template.substitute(dw=display_w, dh=display_h), unsafe_allow_html=True)
 
     # ---------------- ADD NEW PRODUCT (TOP) ----------------
-    df = load_products()
+    catalog_index = get_catalog_index()
+    df = catalog_index.df.copy()
     st.markdown("<div class='section-title'>Add New Product</div>", unsafe_allow_html=True)
     with st.expander("Add product", expanded=False):
         img_col1, img_col2 = st.columns([1, 3])
@@ -457,9 +439,7 @@ def products_app():
                     ):
                         st.warning("Device must be unique.")
                     else:
-                        img_b64 = image_to_base64(uploaded_image) if uploaded_image else None
-                        if uploaded_image:
-                            uploaded_image.seek(0)
+                        img_b64 = store_uploaded_image(uploaded_image) if uploaded_image else None
                         img_path = None
                         new_row = {
                             "Device": cand,
@@ -492,17 +472,16 @@ def products_app():
     s1, s2 = st.columns([2, 1])
     with s1:
         q_text = st.text_input(
-            "Search by name or description", placeholder="Type to filter products..."
+            "Search by name or description", placeholder="Type to filter products...",
+            key="products_search",
         )
     with s2:
         only_with_images = st.checkbox("Show items with images only", value=False)
 
     fdf = df.copy()
     if q_text:
-        ql = q_text.strip().lower()
-        mask_name = fdf["Device"].astype(str).str.lower().str.contains(ql, na=False)
-        mask_desc = fdf["Description"].astype(str).str.lower().str.contains(ql, na=False)
-        fdf = fdf[mask_name | mask_desc]
+        # Indexed search (prefix / trigram) instead of scanning every row
+        fdf = fdf[fdf["Device"].astype(str).isin(set(catalog_index.search(q_text, limit=None)))]
     if only_with_images:
         fdf = fdf[fdf["ImageBase64"].notna() & (fdf["ImageBase64"].astype(str) != "")]
 
@@ -615,8 +594,7 @@ def products_app():
                                     new_img_b64 = row.get("ImageBase64")
                                     new_img_path = None
                                     if img_upload:
-                                        new_img_b64 = image_to_base64(img_upload)
-                                        img_upload.seek(0)
+                                        new_img_b64 = store_uploaded_image(img_upload)
                                         new_img_path = None
 
                                     df.loc[
@@ -711,33 +689,115 @@ def products_app():
                     st.session_state.pop("_prod_mode", None)
                     st.rerun()
 
+    # ---------------- BULK IMAGE INGEST ----------------
+    st.markdown("---")
+    with st.expander("Bulk import images from data/product_images", expanded=False):
+        bi1, bi2 = st.columns(2)
+        with bi1:
+            ingest_overwrite = st.checkbox("Replace existing images", value=False, key="_ingest_overwrite")
+        with bi2:
+            ingest_cutoff = st.slider("Match threshold", 0.5, 1.0, float(DEFAULT_CUTOFF), 0.05, key="_ingest_cutoff")
+        # The folder is only matched on demand; a scan for other settings is stale
+        if st.button("Scan folder", key="_ingest_scan"):
+            with st.spinner("Matching photos to products..."):
+                st.session_state["_ingest_plan"] = (
+                    (ingest_cutoff, ingest_overwrite),
+                    plan_ingest(df, cutoff=ingest_cutoff, overwrite=ingest_overwrite),
+                )
+        scan = st.session_state.get("_ingest_plan")
+        plan = scan[1] if scan and scan[0] == (ingest_cutoff, ingest_overwrite) else None
+        if plan is None:
+            st.caption("Scan the folder to match photos to products.")
+        elif plan.empty:
+            st.info("No product photos found.")
+        else:
+            st.dataframe(plan[["Device", "File", "Score", "Action"]], use_container_width=True, hide_index=True)
+            to_attach = int((plan["Action"] == "attach").sum())
+            if st.button(f"Attach {to_attach} image(s)", disabled=to_attach == 0, key="_ingest_run"):
+                bar = st.progress(0.0, text="Processing images...")
+                updated_df, result = ingest_images(
+                    df,
+                    cutoff=ingest_cutoff,
+                    overwrite=ingest_overwrite,
+                    progress=lambda done, total: bar.progress(done / total, text=f"Processed {done}/{total}"),
+                )
+                attached = int((result["Result"] == "attached").sum())
+                if attached:
+                    save_products(updated_df)
+                st.session_state.pop("_ingest_plan", None)
+                failed = result[result["Result"].str.startswith("failed")]
+                if not failed.empty:
+                    st.warning(f"{len(failed)} image(s) failed")
+                    st.dataframe(failed[["Device", "File", "Result"]], hide_index=True)
+                st.success(f"Attached {attached} image(s)")
+
+    # ---------------- DUPLICATE IMAGES ----------------
+    with st.expander("Find duplicate images", expanded=False):
+        st.caption("Compares perceptual hashes (pHash + dHash) of catalog images and data/product_images.")
+        max_dist = st.slider("Max difference (bits)", 0, 16, DEFAULT_MAX_DISTANCE, key="_dup_dist")
+        if st.button("Scan for duplicates", key="_dup_scan"):
+            with st.spinner("Hashing images..."):
+                dup_index = build_index(df)
+                st.session_state["_dup_scan"] = (dup_index, find_duplicate_groups(dup_index, max_dist))
+        scan = st.session_state.get("_dup_scan")
+        if scan:
+            dup_index, dup_groups = scan
+            if not dup_groups:
+                st.success(f"No near-duplicates among {len(dup_index)} image(s).")
+            else:
+                st.dataframe(describe_groups(dup_index, dup_groups), use_container_width=True, hide_index=True)
+                dc1, dc2 = st.columns(2)
+                with dc1:
+                    if st.button("Collapse catalog duplicates", key="_dup_collapse"):
+                        collapsed_df, changed = collapse_catalog_duplicates(df, dup_index, dup_groups)
+                        if changed:
+                            save_products(collapsed_df)
+                        st.session_state.pop("_dup_scan", None)
+                        st.success(f"{changed} product(s) now share a stored image.")
+                        st.rerun()
+                with dc2:
+                    redundant = quarantine_folder_duplicates(dup_index, dup_groups, dry_run=True)
+                    if st.button(f"Move {len(redundant)} folder duplicate(s)", disabled=not redundant, key="_dup_move"):
+                        quarantine_folder_duplicates(dup_index, dup_groups, dry_run=False)
+                        st.session_state.pop("_dup_scan", None)
+                        st.success("Moved older variants to data/product_images/_duplicates")
+                        st.rerun()
+
     # ---------------- PRODUCT CARDS (WORD) ----------------
     st.markdown("---")
     if st.button("Generate Product Cards (Word)"):
-        products_df = load_products()
-        doc_buf = build_word_cards_document(products_df)
-        st.download_button(
-            "Download Product Cards (Word)",
-            data=doc_buf.getvalue(),
-            file_name="product_cards.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        )
+        st.session_state["_cards_job"] = start_export_job(load_products())
+    if st.session_state.get("_cards_job"):
+        product_cards_job_panel()
 
     # ---------------- IMPORT / EXPORT ----------------
     st.markdown("---")
     st.markdown("<div class='section-title'>Import / Export</div>", unsafe_allow_html=True)
 
-    buf = BytesIO()
-    fdf[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]].to_excel(
-        buf, index=False
-    )
-    buf.seek(0)
+    export_cols = ["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]
+    export_df = fdf[export_cols]
     st.download_button(
         "Download Products (Excel)",
-        data=buf,
+        data=export_service.lazy(
+            "products_export.xlsx",
+            (export_service.source_version("products", "data/products.xlsx"), q_text, only_with_images),
+            lambda: export_service.excel_bytes(export_df),
+        ),
         file_name=f"products_export_{datetime.today().strftime('%Y%m%d')}.xlsx",
     )
 
+    inline_count = int(
+        df["ImageBase64"].apply(lambda v: isinstance(v, str) and bool(v.strip()) and not image_store.is_image_ref(v)).sum()
+    )
+    if inline_count:
+        st.caption(f"{inline_count} product(s) still carry inline Base64 images.")
+        if st.button("Move images to image store"):
+            migrated_df, migrated = image_store.migrate_products(df)
+            if migrated:
+                save_products(migrated_df)
+            st.success(f"Moved {migrated} image(s) to the image store.")
+            st.rerun()
+
     up = st.file_uploader("Upload products.xlsx", type=["xlsx"], accept_multiple_files=False)
     if up is not None:
         try:
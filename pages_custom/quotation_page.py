@@ -24,6 +24,7 @@ from pathlib import Path
 import sys
 import threading
 import json
+import hashlib
 import subprocess
 import time
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
@@ -34,6 +35,12 @@ try:
 except Exception:
     _db = None
 from utils.image_utils import ensure_data_url
+from utils.catalog_index import get_catalog_index
+from utils.record_events import record_saved
+from utils import export_service
+from utils import sequences
+from utils.phone import phone_key, with_phone_keys
+from utils import customer_index
 try:
     from utils.firebase_utils import save_quotation_to_firebase
 except Exception:
@@ -64,16 +71,6 @@ def quotation_app():
 
         # (Header hero removed to match invoice page)
 
-    # =========================
-    # Helper
-    # =========================
-    def format_phone_input(raw_input):
-        digits = ''.join(filter(str.isdigit, raw_input))
-        if digits.startswith("0"): digits = digits[1:]
-        if digits.startswith("5") and len(digits) == 9:
-            return f"+971 {digits[:2]} {digits[2:5]} {digits[5:]}"
-        return None
-
     # =========================
     # UAE Locations
     # =========================
@@ -118,22 +115,13 @@ def quotation_app():
     # =========================
     # Setup
     # =========================
-    catalog = None
-    if _db is not None:
-        try:
-            rows = _db.db_query(
-                'SELECT device as "Device", description as "Description", unit_price as "UnitPrice", warranty as "Warranty", image_base64 as "ImageBase64", image_path as "ImagePath" FROM products ORDER BY id'
-            )
-            if rows:
-                catalog = pd.DataFrame(rows)
-        except Exception:
-            catalog = None
-    if catalog is None:
-        try:
-            catalog = pd.read_excel("data/products.xlsx")
-        except Exception:
-            st.error("❌ ERROR: Cannot load product catalog")
-            return
+    # Process-wide catalog index: reloaded only when products change
+    try:
+        catalog_index = get_catalog_index()
+    except Exception:
+        st.error("❌ ERROR: Cannot load product catalog")
+        return
+    catalog = catalog_index.df
 
     required_cols = ["Device", "Description", "UnitPrice", "Warranty"]
     for col in required_cols:
@@ -176,6 +164,7 @@ def quotation_app():
                     'INSERT INTO records(base_id, date, type, number, amount, client_name, phone, location, note) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)',
                     (rec.get('base_id'), rec.get('date'), rec.get('type'), rec.get('number'), rec.get('amount'), rec.get('client_name'), rec.get('phone'), rec.get('location'), rec.get('note'))
                 )
+                record_saved(rec)
                 return
             except Exception:
                 pass
@@ -187,6 +176,7 @@ def quotation_app():
         if {"type", "number"}.issubset(df.columns):
             df = df.drop_duplicates(subset=["type", "number"], keep="last")
         df.to_excel("data/records.xlsx", index=False)
+        record_saved(rec)
 
     # Customers helpers (auto add from quotation)
     def ensure_customers_file():
@@ -213,7 +203,7 @@ def quotation_app():
                 pass
         ensure_customers_file()
         try:
-            df = pd.read_excel("data/customers.xlsx")
+            df = pd.read_excel("data/customers.xlsx", dtype={"phone_key": str})
             df.columns = [c.strip().lower() for c in df.columns]
             return df
         except:
@@ -224,9 +214,11 @@ def quotation_app():
 
     def save_customers(df: pd.DataFrame):
         os.makedirs("data", exist_ok=True)
+        df = with_phone_keys(df, refresh=True)
         # Try DB sync (upsert) then write Excel to preserve app-specific fields
         if _db is not None:
             try:
+                customer_index.ensure_db_schema()
                 for _, row in df.iterrows():
                     name = str(row.get('client_name') or '')
                     phone = row.get('phone')
@@ -243,7 +235,7 @@ def quotation_app():
                             pass
                     else:
                         try:
-                            _db.db_execute('INSERT INTO customers(name, phone, email, address) VALUES (%s,%s,%s,%s)', (name, phone, email, address))
+                            _db.db_execute('INSERT INTO customers(name, phone, phone_key, email, address) VALUES (%s,%s,%s,%s,%s)', (name, phone, row.get('phone_key') or None, email, address))
                         except Exception:
                             pass
                 df.to_excel("data/customers.xlsx", index=False)
@@ -258,20 +250,19 @@ def quotation_app():
         # Try DB upsert matching DB schema, otherwise fall back to Excel logic
         if _db is not None:
             try:
-                # Simple phone/name lookup
-                existing = []
+                # Indexed name / phone_key lookup
                 try:
-                    existing = _db.db_query('SELECT id FROM customers WHERE name = %s OR phone = %s', (proper_case(name), phone))
+                    existing_id = customer_index.db_find(proper_case(name), phone)
                 except Exception:
-                    existing = []
-                if existing:
+                    existing_id = None
+                if existing_id is not None:
                     try:
-                        _db.db_execute('UPDATE customers SET phone = %s, address = %s WHERE id = %s', (phone, proper_case(location), existing[0].get('id')))
+                        _db.db_execute('UPDATE customers SET phone = %s, phone_key = %s, address = %s WHERE id = %s', (phone, phone_key(phone) or None, proper_case(location), existing_id))
                     except Exception:
                         pass
                 else:
                     try:
-                        _db.db_execute('INSERT INTO customers(name, phone, email, address) VALUES (%s,%s,%s,%s)', (proper_case(name), phone, '', proper_case(location)))
+                        _db.db_execute('INSERT INTO customers(name, phone, phone_key, email, address) VALUES (%s,%s,%s,%s,%s)', (proper_case(name), phone, phone_key(phone) or None, '', proper_case(location)))
                     except Exception:
                         pass
                 return
@@ -281,29 +272,9 @@ def quotation_app():
         # Fallback: original Excel behaviour
         ensure_customers_file()
         cdf = load_customers()
-        key = str(name).strip().lower()
-        exists = None
-        if not cdf.empty and "client_name" in cdf.columns:
-            m = cdf["client_name"].astype(str).str.strip().str.lower() == key
-            if m.any():
-                exists = cdf[m].index[0]
-            else:
-                # Try phone-based matching when names differ
-                cdf_phone = cdf.get("phone", pd.Series([], dtype=str)).apply(lambda x: x if pd.isna(x) else str(x))
-                try_phone = phone
-                def norm(x):
-                    digits = ''.join(filter(str.isdigit, str(x)))
-                    if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
-                        return '0' + digits[3:12]
-                    if len(digits) == 9 and digits.startswith('5'):
-                        return '0' + digits
-                    if len(digits) == 10 and digits.startswith('05'):
-                        return digits
-                    return digits[-10:]
-                if try_phone:
-                    m2 = cdf_phone.apply(norm) == norm(try_phone)
-                    if m2.any():
-                        exists = cdf[m2].index[0]
+        # O(1) match by name, then by normalized phone
+        index = customer_index.get_customer_index(cdf)
+        exists = index.find(name, phone)
         if exists is not None:
             cdf.at[exists, 'client_name'] = proper_case(name)
             cdf.at[exists, 'phone'] = phone
@@ -322,7 +293,10 @@ def quotation_app():
                 'last_activity': datetime.today().strftime('%Y-%m-%d')
             }
             cdf = pd.concat([cdf, pd.DataFrame([new_row])], ignore_index=True)
+            exists = cdf.index[-1]
+        index.add(exists, proper_case(name), phone)
         save_customers(cdf)
+        customer_index.saved(index, cdf)
 
     # Quotation summary inputs (Client name, Quotation No, Location, Mobile, Prepared/Approved)
     if 'quo_client_name' not in st.session_state:
@@ -331,13 +305,12 @@ def quotation_app():
         st.session_state['quo_phone'] = ''
     if 'quo_loc' not in st.session_state:
         st.session_state['quo_loc'] = uae_locations[0] if uae_locations else ''
+    if '_quo_next_no' in st.session_state:
+        # Renumbered at save time: the displayed number had been taken by another save
+        st.session_state['quo_no'] = st.session_state.pop('_quo_next_no')
     if 'quo_no' not in st.session_state:
         # New numbering system: QYYYY#### (e.g., Q20260001)
-        current_year = datetime.today().year
-        records = load_records()
-        year_quotations = records[(records['type']=='q') & (records['number'].astype(str).str.startswith(f'Q{current_year}'))]
-        next_seq = len(year_quotations) + 1
-        st.session_state['quo_no'] = f"Q{current_year}{str(next_seq).zfill(4)}"
+        st.session_state['quo_no'] = sequences.peek_number("q", load_records)
     if 'quo_prepared_by' not in st.session_state:
         st.session_state['quo_prepared_by'] = 'Mr Bukhry'
     if 'quo_approved_by' not in st.session_state:
@@ -377,210 +350,233 @@ def quotation_app():
             help="Enter project description or click Generate to auto-create",
             height=100
         )
+    def _generate_project_details():
+        # Runs as a callback, before the title/description widgets are created,
+        # so their keys can still be set.
+        table = st.session_state.product_table
+        if table.empty:
+            st.session_state['_quo_ai_message'] = ("warning", "⚠️ Please add products first to generate project details")
+            return
+        with st.spinner("🔄 Generating project details..."):
+            try:
+                from utils.openai_utils import generate_project_details
+
+                # Title and description are requested concurrently (cached per product list)
+                details = generate_project_details(
+                    list(zip(table['Product / Device'], table['Qty'])),
+                    st.session_state.get('quo_client_name', 'Client'),
+                    st.session_state.get('quo_loc', 'UAE'),
+                )
+                st.session_state['quo_project_title'] = details["title"]
+                st.session_state['quo_project_description'] = details["description"]
+                st.session_state['_quo_ai_message'] = ("success", "✅ Project details generated successfully!")
+            except Exception as e:
+                st.session_state['_quo_ai_message'] = ("error", f"❌ Error generating details: {str(e)}")
+
     with proj_col2:
         st.markdown("<br>", unsafe_allow_html=True)
-        if st.button("🤖 Generate with AI", key="generate_project_details", use_container_width=True, type="primary"):
-            if st.session_state.product_table.empty:
-                st.warning("⚠️ Please add products first to generate project details")
-            else:
-                with st.spinner("🔄 Generating project details..."):
-                    try:
-                        from utils.openai_utils import chat_with_ai
-                        
-                        # Build product list
-                        products_list = []
-                        for _, row in st.session_state.product_table.iterrows():
-                            products_list.append(f"- {row['Product / Device']} (Qty: {int(row['Qty'])})")
-                        products_str = "\n".join(products_list)
-                        
-                        # Generate title
-                        title_prompt = f"""Generate a short professional project title (max 8 words) for a smart home quotation with these products:
-{products_str}
-
-Client: {st.session_state.get('quo_client_name', 'Client')}
-Location: {st.session_state.get('quo_loc', 'UAE')}
-
-Return ONLY the title, nothing else."""
-                        
-                        title_response = chat_with_ai(title_prompt, [])
-                        st.session_state['quo_project_title'] = title_response.strip()
-                        
-                        # Generate description
-                        desc_prompt = f"""Generate a concise professional project description (2-3 sentences, max 150 words) for a smart home quotation with these products:
-{products_str}
-
-Client: {st.session_state.get('quo_client_name', 'Client')}
-Location: {st.session_state.get('quo_loc', 'UAE')}
-
-Return ONLY the description, nothing else. Focus on benefits and scope."""
-                        
-                        desc_response = chat_with_ai(desc_prompt, [])
-                        st.session_state['quo_project_description'] = desc_response.strip()
-                        
-                        st.success("✅ Project details generated successfully!")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"❌ Error generating details: {str(e)}")
+        st.button("🤖 Generate with AI", key="generate_project_details", use_container_width=True, type="primary",
+                  on_click=_generate_project_details)
+        ai_message = st.session_state.pop('_quo_ai_message', None)
+        if ai_message:
+            getattr(st, ai_message[0])(ai_message[1])
 
     st.session_state.num_entries = 1
 
-    df = st.session_state.product_table.copy()
+    def _quo_totals():
+        """(product_total, installation, total_discount, grand_total) from session state."""
+        table = st.session_state.product_table
+        product_total = float(table["Line Total (AED)"].sum()) if not table.empty else 0.0
+        installation_cost_val = float(st.session_state.get("install_cost_quo_value", 0.0) or 0.0)
+        discount_value_val = float(st.session_state.get("disc_value_quo_value", 0.0) or 0.0)
+        discount_percent_val = float(st.session_state.get("disc_percent_quo_value", 0.0) or 0.0)
+        percent_value = (product_total + installation_cost_val) * (discount_percent_val / 100)
+        total_discount = percent_value + discount_value_val
+        grand_total = (product_total + installation_cost_val) - total_discount
+        return product_total, installation_cost_val, total_discount, grand_total
+
+    # Item, cost and export sections are fragments: editing them reruns only the
+    # sections listed here instead of the whole page.
+    ITEM_SECTIONS = ["quo_items", "quo_totals", "quo_export"]
+    COST_SECTIONS = ["quo_costs", "quo_totals", "quo_export"]
+
+    def _delete_item(i):
+        st.session_state.product_table = st.session_state.product_table.drop(i).reset_index(drop=True)
+        st.session_state.product_table["Item No"] = range(1, len(st.session_state.product_table)+1)
+        st.rerun(ITEM_SECTIONS)
+
+    def _add_item(entry_idx):
+        product = st.session_state.get(f"prod_entry_{entry_idx}")
+        row = catalog_index.get(product)
+        if row is None:
+            return
+        qty = st.session_state[f"qty_val_{entry_idx}"]
+        price = st.session_state[f"price_val_{entry_idx}"]
+        # attach image only from Base64 field (no filesystem/URL fallbacks)
+        image_val = None
+        try:
+            raw_b64 = row.get('ImageBase64') if 'ImageBase64' in row.index else None
+            image_val = ensure_data_url(raw_b64) if raw_b64 is not None else None
+        except Exception:
+            image_val = None
+
+        new_row = {
+            "Item No": len(st.session_state.product_table) + 1,
+            "Product / Device": product,
+            "Description": row["Description"],
+            "Qty": qty,
+            "Unit Price (AED)": price,
+            "Line Total (AED)": qty * price,
+            "Warranty (Years)": st.session_state[f"war_val_{entry_idx}"],
+            # keep both raw columns for Word export and a normalized `image` for HTML rendering
+            "ImagePath": row.get('ImagePath') if 'ImagePath' in row.index else None,
+            "ImageBase64": row.get('ImageBase64') if 'ImageBase64' in row.index else None,
+            "image": image_val,
+        }
+        new_df = pd.DataFrame([new_row])
+        if st.session_state.product_table.empty:
+            st.session_state.product_table = new_df
+        else:
+            st.session_state.product_table = pd.concat(
+                [st.session_state.product_table, new_df],
+                ignore_index=True
+            )
+        st.rerun(ITEM_SECTIONS)
+
+    def _costs_changed():
+        st.session_state["install_cost_quo_value"] = st.session_state.get("install_cost_quo", 0.0)
+        st.session_state["disc_value_quo_value"] = st.session_state.get("disc_value_quo", 0.0)
+        st.session_state["disc_percent_quo_value"] = st.session_state.get("disc_percent_quo", 0.0)
+        st.rerun(COST_SECTIONS)
+
+    @st.fragment(key="quo_items")
+    def _line_items():
+        df = st.session_state.product_table.copy()
+
+        if not df.empty:
+            for idx, (i, row) in enumerate(df.iterrows()):
+                cols = st.columns([4.5,0.7,1,1,0.7,0.7])
+
+                with cols[0]:
+                    st.markdown(f"""
+                        <div class='added-product-row'>
+                            <span style="font-weight:bold;color:var(--accent);">✓</span>
+                            <span style="font-weight:600;color:#1f2937;">{row['Product / Device']}</span>
+                        </div>
+                    """, unsafe_allow_html=True)
+
+                with cols[1]:
+                    st.markdown(f"<div class='added-product-row'><span class='product-value'>{int(row['Qty'])}</span></div>", unsafe_allow_html=True)
+
+                with cols[2]:
+                    st.markdown(f"<div class='added-product-row'><span class='product-value'>{row['Unit Price (AED)']:.2f}</span></div>", unsafe_allow_html=True)
+
+                with cols[3]:
+                    st.markdown(
+                        f"<div class='added-product-row'><span class='product-value'>AED {row['Line Total (AED)']:.2f}</span></div>",
+                        unsafe_allow_html=True
+                    )
+
+                with cols[4]:
+                    st.markdown(f"<div class='added-product-row'><span class='product-value'>{int(row['Warranty (Years)'])} yr</span></div>", unsafe_allow_html=True)
+
+                with cols[5]:
+                    st.button("❌", key=f"del_q_{i}", on_click=_delete_item, args=(i,))
+
+        product_query = st.text_input(
+            "Search products",
+            key="quo_product_search",
+            placeholder="🔎 Search products by name or description...",
+            label_visibility="collapsed",
+        )
 
-    if not df.empty:
-        for idx, (i, row) in enumerate(df.iterrows()):
+        for entry_idx in range(st.session_state.num_entries):
             cols = st.columns([4.5,0.7,1,1,0.7,0.7])
 
             with cols[0]:
-                st.markdown(f"""
-                    <div class='added-product-row'>
-                        <span style="font-weight:bold;color:var(--accent);">✓</span>
-                        <span style="font-weight:600;color:#1f2937;">{row['Product / Device']}</span>
-                    </div>
-                """, unsafe_allow_html=True)
+                product = st.selectbox(
+                    "Product",
+                    catalog_index.picker_options(product_query, st.session_state.get(f"prod_entry_{entry_idx}")),
+                    key=f"prod_entry_{entry_idx}",
+                    label_visibility="collapsed"
+                )
+                row = catalog_index.get(product)
+                if row is None:
+                    st.info("No products match your search.")
+                    return
+
+            key_qty = f"qty_val_{entry_idx}"
+            key_price = f"price_val_{entry_idx}"
+            key_war = f"war_val_{entry_idx}"
+            if key_qty not in st.session_state:
+                st.session_state[key_qty] = 1
+            if key_price not in st.session_state:
+                st.session_state[key_price] = float(row["UnitPrice"])
+            if key_war not in st.session_state:
+                st.session_state[key_war] = int(row["Warranty"])
+            # Sync price and warranty when product changes
+            last_key = f"last_prod_{entry_idx}"
+            if st.session_state.get(last_key) != product:
+                st.session_state[f"price_val_{entry_idx}"] = float(row["UnitPrice"])
+                st.session_state[f"war_val_{entry_idx}"] = int(row["Warranty"])
+                st.session_state[last_key] = product
 
             with cols[1]:
-                st.markdown(f"<div class='added-product-row'><span class='product-value'>{int(row['Qty'])}</span></div>", unsafe_allow_html=True)
+                st.number_input(
+                    "Qty",
+                    min_value=1,
+                    step=1,
+                    key=key_qty,
+                    label_visibility="collapsed"
+                )
 
             with cols[2]:
-                st.markdown(f"<div class='added-product-row'><span class='product-value'>{row['Unit Price (AED)']:.2f}</span></div>", unsafe_allow_html=True)
+                st.number_input(
+                    "Unit Price (AED)",
+                    min_value=0.0,
+                    step=10.0,
+                    key=key_price,
+                    label_visibility="collapsed"
+                )
+
+            qty = st.session_state[f"qty_val_{entry_idx}"]
+            price = st.session_state[f"price_val_{entry_idx}"]
+            line_price = qty * price
 
             with cols[3]:
                 st.markdown(
-                    f"<div class='added-product-row'><span class='product-value'>AED {row['Line Total (AED)']:.2f}</span></div>",
+                    f"<div class='added-product-row'><span class='product-value'>AED {line_price:.2f}</span></div>",
                     unsafe_allow_html=True
                 )
 
             with cols[4]:
-                st.markdown(f"<div class='added-product-row'><span class='product-value'>{int(row['Warranty (Years)'])} yr</span></div>", unsafe_allow_html=True)
+                st.number_input(
+                    "Warranty (Years)",
+                    min_value=0,
+                    step=1,
+                    key=key_war,
+                    label_visibility="collapsed"
+                )
 
             with cols[5]:
-                if st.button("❌", key=f"del_q_{i}"):
-                    st.session_state.product_table = st.session_state.product_table.drop(i).reset_index(drop=True)
-                    st.session_state.product_table["Item No"] = range(1, len(st.session_state.product_table)+1)
-                    st.rerun()
-
-    for entry_idx in range(st.session_state.num_entries):
-        cols = st.columns([4.5,0.7,1,1,0.7,0.7])
-
-        with cols[0]:
-            product = st.selectbox(
-                "Product",
-                catalog["Device"],
-                key=f"prod_entry_{entry_idx}",
-                label_visibility="collapsed"
-            )
-            row = catalog[catalog["Device"] == product].iloc[0]
-            desc = row["Description"]
-
-        key_qty = f"qty_val_{entry_idx}"
-        key_price = f"price_val_{entry_idx}"
-        key_war = f"war_val_{entry_idx}"
-        if key_qty not in st.session_state:
-            st.session_state[key_qty] = 1
-        if key_price not in st.session_state:
-            st.session_state[key_price] = float(row["UnitPrice"])
-        if key_war not in st.session_state:
-            st.session_state[key_war] = int(row["Warranty"])
-        # Sync price and warranty when product changes
-        last_key = f"last_prod_{entry_idx}"
-        if st.session_state.get(last_key) != product:
-            st.session_state[f"price_val_{entry_idx}"] = float(row["UnitPrice"])
-            st.session_state[f"war_val_{entry_idx}"] = int(row["Warranty"])
-            st.session_state[last_key] = product
-
-        with cols[1]:
-            st.number_input(
-                "Qty",
-                min_value=1,
-                step=1,
-                key=key_qty,
-                label_visibility="collapsed"
-            )
-
-        with cols[2]:
-            st.number_input(
-                "Unit Price (AED)",
-                min_value=0.0,
-                step=10.0,
-                key=key_price,
-                label_visibility="collapsed"
-            )
-
-        qty = st.session_state[f"qty_val_{entry_idx}"]
-        price = st.session_state[f"price_val_{entry_idx}"]
-        line_price = qty * price
-
-        with cols[3]:
-            st.markdown(
-                f"<div class='added-product-row'><span class='product-value'>AED {line_price:.2f}</span></div>",
-                unsafe_allow_html=True
-            )
-
-        with cols[4]:
-            st.number_input(
-                "Warranty (Years)",
-                min_value=0,
-                step=1,
-                key=key_war,
-                label_visibility="collapsed"
-            )
-
-        warranty = st.session_state[f"war_val_{entry_idx}"]
+                st.button("✅", key=f"add_row_{entry_idx}", on_click=_add_item, args=(entry_idx,))
 
-        with cols[5]:
-            if st.button("✅", key=f"add_row_{entry_idx}"):
-                # attach image only from Base64 field (no filesystem/URL fallbacks)
-                image_val = None
-                try:
-                    raw_b64 = row.get('ImageBase64') if 'ImageBase64' in row.index else None
-                    image_val = ensure_data_url(raw_b64) if raw_b64 is not None else None
-                except Exception:
-                    image_val = None
-
-                new_row = {
-                    "Item No": len(st.session_state.product_table) + 1,
-                    "Product / Device": product,
-                    "Description": desc,
-                    "Qty": qty,
-                    "Unit Price (AED)": price,
-                    "Line Total (AED)": line_price,
-                    "Warranty (Years)": warranty,
-                    # keep both raw columns for Word export and a normalized `image` for HTML rendering
-                    "ImagePath": row.get('ImagePath') if 'ImagePath' in row.index else None,
-                    "ImageBase64": row.get('ImageBase64') if 'ImageBase64' in row.index else None,
-                    "image": image_val,
-                }
-                new_df = pd.DataFrame([new_row])
-                if st.session_state.product_table.empty:
-                    st.session_state.product_table = new_df
-                else:
-                    st.session_state.product_table = pd.concat(
-                        [st.session_state.product_table, new_df],
-                        ignore_index=True
-                    )
-                st.rerun()
+    _line_items()
 
     st.markdown("---")
 
-    product_total = st.session_state.product_table["Line Total (AED)"].sum() if not st.session_state.product_table.empty else 0
-
     # =========================
     # SUMMARY (match invoice)
     # =========================
     st.markdown("---")
     col_left, col_right = st.columns([1, 1])
 
-    with col_left:
+    @st.fragment(key="quo_totals")
+    def _totals_panel():
         st.markdown("<div class='section-title'>Project Costs</div>", unsafe_allow_html=True)
 
-        # Pull persisted values (so left card reflects right inputs)
-        installation_cost_val = st.session_state.get("install_cost_quo_value", 0.0)
-        discount_value_val = st.session_state.get("disc_value_quo_value", 0.0)
-        discount_percent_val = st.session_state.get("disc_percent_quo_value", 0.0)
-
-        percent_value = (product_total + installation_cost_val) * (discount_percent_val / 100)
-        total_discount = percent_value + discount_value_val
-        grand_total = (product_total + installation_cost_val) - total_discount
+        # Persisted values (so left card reflects right inputs)
+        product_total, installation_cost_val, total_discount, grand_total = _quo_totals()
 
         st.markdown(
             """
@@ -606,7 +602,8 @@ Return ONLY the description, nothing else. Focus on benefits and scope."""
             unsafe_allow_html=True,
         )
 
-    with col_right:
+    @st.fragment(key="quo_costs")
+    def _cost_inputs():
         st.markdown("<div class='section-title'>Installation & Discount</div>", unsafe_allow_html=True)
 
         installation_cost = st.number_input(
@@ -614,18 +611,24 @@ Return ONLY the description, nothing else. Focus on benefits and scope."""
             min_value=0.0,
             step=50.0,
             key="install_cost_quo",
+            on_change=_costs_changed,
         )
         st.session_state["install_cost_quo_value"] = installation_cost
 
         st.markdown("<div style='margin-top:12px;'></div>", unsafe_allow_html=True)
         cD1, cD2 = st.columns(2)
         with cD1:
-            discount_value = st.number_input("Discount Value (AED)", min_value=0.0, key="disc_value_quo")
+            discount_value = st.number_input("Discount Value (AED)", min_value=0.0, key="disc_value_quo", on_change=_costs_changed)
             st.session_state["disc_value_quo_value"] = discount_value
         with cD2:
-            discount_percent = st.number_input("Discount %", min_value=0.0, max_value=100.0, key="disc_percent_quo")
+            discount_percent = st.number_input("Discount %", min_value=0.0, max_value=100.0, key="disc_percent_quo", on_change=_costs_changed)
             st.session_state["disc_percent_quo_value"] = discount_percent
 
+    with col_right:
+        _cost_inputs()
+    with col_left:
+        _totals_panel()
+
     # =========================
     # EXPORT - HTML Direct (Simplified)
     # =========================
@@ -637,21 +640,12 @@ Return ONLY the description, nothing else. Focus on benefits and scope."""
             f.write(data_bytes)
         return str(out_path)
 
-    def generate_quotation_html() -> str:
-        """Generate quotation HTML content"""
+    def quotation_context() -> dict:
+        """Template context for the quotation HTML (read from session state)."""
         products = st.session_state.product_table.to_dict('records') if 'product_table' in st.session_state else []
         _s = load_settings()
-        
-        # Recalculate totals
-        product_total = st.session_state.product_table["Line Total (AED)"].sum() if not st.session_state.product_table.empty else 0.0
-        installation_cost_val = float(st.session_state.get('install_cost_quo_value', 0.0) or 0.0)
-        discount_value_val = float(st.session_state.get("disc_value_quo_value", 0.0) or 0.0)
-        discount_percent_val = float(st.session_state.get("disc_percent_quo_value", 0.0) or 0.0)
-        percent_value = (product_total + installation_cost_val) * (discount_percent_val / 100)
-        total_discount = percent_value + discount_value_val
-        grand_total = (product_total + installation_cost_val) - total_discount
-        
-        html_content = render_quotation_html({
+        product_total, installation_cost_val, _, grand_total = _quo_totals()
+        return {
             'company_name': _s.get('company_name', 'Newton Smart Home'),
             'quotation_number': st.session_state.get('quo_no', f"Q{datetime.today().year}0001"),
             'quotation_date': datetime.today().strftime('%Y-%m-%d'),
@@ -678,92 +672,111 @@ Return ONLY the description, nothing else. Focus on benefits and scope."""
             'bank_company': _s.get('company_name', 'Newton Smart Home'),
             'sig_name': st.session_state.get('quo_prepared_by', 'Mr Bukhry'),
             'sig_role': st.session_state.get('quo_approved_by', 'Mr Mohammed'),
-        }, template_name="newton_quotation_A4.html")
-        return html_content
+        }
+
+    def generate_quotation_html() -> str:
+        """Generate quotation HTML content"""
+        return render_quotation_html(quotation_context(), template_name="newton_quotation_A4.html")
 
     st.markdown("---")
     st.markdown('<div class="section-title">Export Quotation</div>', unsafe_allow_html=True)
 
-    # Recalculate totals for display
-    product_total = st.session_state.product_table["Line Total (AED)"].sum() if not st.session_state.product_table.empty else 0.0
-    installation_cost_val = st.session_state.get("install_cost_quo_value", 0.0)
-    discount_value_val = st.session_state.get("disc_value_quo_value", 0.0)
-    discount_percent_val = st.session_state.get("disc_percent_quo_value", 0.0)
-    percent_value = (product_total + installation_cost_val) * (discount_percent_val / 100)
-    total_discount = percent_value + discount_value_val
-    grand_total = (product_total + installation_cost_val) - total_discount
-
-    # Client data
-    client_name = st.session_state.get('quo_client_name', '')
-    client_location = st.session_state.get('quo_loc', '')
-    quote_no = st.session_state.get('quo_no', f"Q{datetime.today().year}0001")
-    phone_raw = st.session_state.get('quo_phone', '')
-
-    # Generate HTML for download button
-    try:
-        html_content = generate_quotation_html()
-        safe_name = client_name.replace(' ', '_') if client_name else 'Client'
-        html_filename = f"Quotation_{safe_name}_{quote_no}.html"
-        
-        # Single download button that also saves the record
-        clicked = st.download_button(
-            label="💾 Save & Download Quotation",
-            data=html_content,
-            file_name=html_filename,
-            mime="text/html",
-            type="primary",
-            use_container_width=True,
-            key=f"save_dl_{quote_no}"
-        )
-        
-        if clicked:
-            # Save record
-            today_id = datetime.today().strftime('%Y%m%d')
-            existing = load_records()
-            if not existing.empty and "base_id" in existing.columns:
-                same_day = existing[existing.get("base_id", "").astype(str).str.contains(today_id, na=False)]
-                seq = len(same_day) + 1
-            else:
-                seq = 1
-            base_id = f"{today_id}-{str(seq).zfill(3)}"
-            
-            quotation_data = {
-                "base_id": base_id,
-                "date": datetime.today().strftime('%Y-%m-%d'),
-                "type": "q",
-                "number": quote_no,
-                "amount": grand_total,
-                "client_name": client_name,
-                "phone": phone_raw,
-                "location": client_location,
-                "note": ""
-            }
-            save_record(quotation_data)
-            
-            # Save to Firebase if available
-            if save_quotation_to_firebase is not None:
-                try:
-                    save_quotation_to_firebase(quotation_data)
-                except Exception as e:
-                    print(f"⚠️ Firebase warning: {str(e)}")
-            
-            upsert_customer_from_quotation(client_name, phone_raw, client_location)
-            
-            # Save HTML file locally
-            out_dir = Path('data') / 'exports'
-            out_dir.mkdir(parents=True, exist_ok=True)
-            html_path = out_dir / html_filename
-            with open(html_path, 'w', encoding='utf-8') as fh:
-                fh.write(html_content)
-            
-            # Log event
-            user = st.session_state.get("user", {})
-            log_event(user.get("name", "Unknown"), "Quotation", "quotation_created", 
-                     f"Client: {client_name}, Amount: {grand_total}")
-            
-            st.success(f"✅ Quotation saved! ID: {base_id}")
-            
-    except Exception as e:
-        st.error(f"❌ Error: {e}")
+    @st.fragment(key="quo_export")
+    def _export_section():
+        # Recalculate totals for display
+        product_total, installation_cost_val, total_discount, grand_total = _quo_totals()
+
+        # Client data
+        client_name = st.session_state.get('quo_client_name', '')
+        client_location = st.session_state.get('quo_loc', '')
+        quote_no = st.session_state.get('_quo_next_no') or st.session_state.get('quo_no', f"Q{datetime.today().year}0001")
+        phone_raw = st.session_state.get('quo_phone', '')
+
+        try:
+            # The HTML is rendered when the button is clicked, not on every rerun
+            context = quotation_context()
+            context['quotation_number'] = quote_no
+            version = hashlib.sha1(json.dumps(context, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+            build_html = lambda: render_quotation_html(context, template_name="newton_quotation_A4.html")
+            safe_name = client_name.replace(' ', '_') if client_name else 'Client'
+            html_filename = f"Quotation_{safe_name}_{quote_no}.html"
+
+            # Single download button that also saves the record
+            clicked = st.download_button(
+                label="💾 Save & Download Quotation",
+                data=export_service.lazy("quotation_html", version, build_html),
+                file_name=html_filename,
+                mime="text/html",
+                type="primary",
+                use_container_width=True,
+                key=f"save_dl_{quote_no}"
+            )
+
+            if clicked:
+                html_content = export_service.get("quotation_html", version, build_html).decode("utf-8")
+
+                # Reserve the number now; a number another session saved first is
+                # replaced by a fresh one and the export is re-stamped with it.
+                # Saving the same quotation again in this session keeps its number.
+                taken_no = None
+                if quote_no != st.session_state.get('_quo_saved_no') and not sequences.claim_number("q", quote_no, load_records):
+                    taken_no, quote_no = quote_no, sequences.next_number("q", load_records)
+                    context['quotation_number'] = quote_no
+                    html_content = render_quotation_html(context, template_name="newton_quotation_A4.html")
+                    html_filename = f"Quotation_{safe_name}_{quote_no}.html"
+                    st.session_state['_quo_next_no'] = quote_no
+                st.session_state['_quo_saved_no'] = quote_no
+
+                # Save record
+                base_id = sequences.next_base_id(load_records)
+
+                quotation_data = {
+                    "base_id": base_id,
+                    "date": datetime.today().strftime('%Y-%m-%d'),
+                    "type": "q",
+                    "number": quote_no,
+                    "amount": grand_total,
+                    "client_name": client_name,
+                    "phone": phone_raw,
+                    "location": client_location,
+                    "note": ""
+                }
+                save_record(quotation_data)
+
+                # Save to Firebase if available
+                if save_quotation_to_firebase is not None:
+                    try:
+                        save_quotation_to_firebase(quotation_data)
+                    except Exception as e:
+                        print(f"⚠️ Firebase warning: {str(e)}")
+
+                upsert_customer_from_quotation(client_name, phone_raw, client_location)
+
+                # Save HTML file locally
+                out_dir = Path('data') / 'exports'
+                out_dir.mkdir(parents=True, exist_ok=True)
+                html_path = out_dir / html_filename
+                with open(html_path, 'w', encoding='utf-8') as fh:
+                    fh.write(html_content)
+
+                # Log event
+                user = st.session_state.get("user", {})
+                log_event(user.get("name", "Unknown"), "Quotation", "quotation_created",
+                         f"Client: {client_name}, Amount: {grand_total}")
+
+                st.success(f"✅ Quotation saved! ID: {base_id}")
+                if taken_no:
+                    st.warning(f"⚠️ {taken_no} was already saved by another user; this quotation was saved as {quote_no}.")
+                    st.download_button(
+                        label=f"📥 Download {quote_no}",
+                        data=html_content,
+                        file_name=html_filename,
+                        mime="text/html",
+                        use_container_width=True,
+                        key=f"renumbered_dl_{quote_no}",
+                    )
 
+        except Exception as e:
+            st.error(f"❌ Error: {e}")
 
+    _export_section()
@@ -5,6 +5,9 @@ from utils.quotation_utils import render_quotation_html
 from utils.settings import load_settings
 from docx import Document
 from io import BytesIO
+from utils.record_events import record_saved
+from utils import sequences
+from utils.phone import format_phone as format_phone_input, label_mask as phone_label_mask
 try:
     from utils import db as _db
 except Exception:
@@ -22,34 +25,6 @@ def receipt_app():
         except Exception:
             return text
 
-    def format_phone_input(raw_input):
-        if not raw_input:
-            return None
-        digits = ''.join(filter(str.isdigit, str(raw_input)))
-        if digits.startswith("0"):
-            digits = digits[1:]
-        if digits.startswith("5") and len(digits) == 9:
-            return f"+971 {digits[:2]} {digits[2:5]} {digits[5:]}"
-        return None
-
-    def phone_flat10(raw_input):
-        if raw_input is None:
-            return ""
-        digits = ''.join(filter(str.isdigit, str(raw_input)))
-        if not digits:
-            return ""
-        if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
-            return '0' + digits[3:12]
-        if len(digits) == 9 and digits.startswith('5'):
-            return '0' + digits
-        if len(digits) == 10 and digits.startswith('05'):
-            return digits
-        return digits[-10:]
-
-    def phone_label_mask(raw_input):
-        flat = phone_flat10(raw_input)
-        return f"{flat} xxxxxxxxxx" if flat else "xxxxxxxxxx"
-
     # =====================================
     # HELPERS
     # =====================================
@@ -86,6 +61,7 @@ def receipt_app():
                         pass
                 _db.db_execute('INSERT INTO records(base_id, date, type, number, amount, client_name, phone, location, note) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)',
                                (rec.get('base_id'), rec.get('date'), rec.get('type'), rec.get('number'), rec.get('amount'), rec.get('client_name'), rec.get('phone'), rec.get('location'), rec.get('note')))
+                record_saved(rec)
                 return
             except Exception:
                 pass
@@ -98,6 +74,7 @@ def receipt_app():
         if {"type", "number"}.issubset(df.columns):
             df = df.drop_duplicates(subset=["type", "number"], keep="last")
         df.to_excel("data/records.xlsx", index=False)
+        record_saved(rec)
 
     # =====================================
     # WORD TEMPLATE ONLY (pdfkit removed)
@@ -168,14 +145,7 @@ def receipt_app():
         base_id = inv["base_id"]
 
         # New numbering system: RYYYY#### (e.g., R20260001)
-        current_year = datetime.today().year
-        if 'number_str' in records.columns:
-            number_str = records['number_str']
-        else:
-            number_str = records['number'].astype(str)
-        year_receipts = records[(records['type'] == 'r') & (number_str.str.startswith(f'R{current_year}'))]
-        next_seq = len(year_receipts) + 1
-        receipt_no = f"R{current_year}{str(next_seq).zfill(4)}"
+        receipt_no = sequences.peek_number("r", lambda: records)
 
         st.markdown("---")
         st.markdown(
@@ -307,6 +277,11 @@ def receipt_app():
 
         if clicked:
             try:
+                # Reserve the number now; if another session saved it first, take a
+                # fresh one and re-stamp the receipt with it
+                taken_no = None
+                if not sequences.claim_number("r", receipt_no, lambda: records):
+                    taken_no, receipt_no = receipt_no, sequences.next_number("r", lambda: records)
                 save_record({
                     "base_id": base_id,
                     "date": datetime.today().strftime('%Y-%m-%d'),
@@ -319,5 +294,13 @@ def receipt_app():
                     "note": ""
                 })
                 st.success(f"✅ Saved receipt {receipt_no}")
+                if taken_no:
+                    st.warning(f"⚠️ {taken_no} was already saved by another user; this receipt was saved as {receipt_no}.")
+                    st.download_button(
+                        label=f"Download Receipt {receipt_no} (Word)",
+                        data=generate_word("data/receipt_template.docx", {**data, "{{receipt_no}}": receipt_no}),
+                        file_name=f"Receipt_{receipt_no}.docx",
+                        key=f"renumbered_dl_{receipt_no}",
+                    )
             except Exception as e:
                 st.warning(f"⚠️ Downloaded, but failed to save record: {e}")
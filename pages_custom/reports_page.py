@@ -1,5 +1,4 @@
 import os
-from io import BytesIO
 from datetime import datetime, date
 from typing import Tuple
 
@@ -10,6 +9,7 @@ try:
     from utils import db as _db
 except Exception:
     _db = None
+from utils import lifecycle, export_service
 
 # ==========================================
 # File Ensurers
@@ -170,7 +170,7 @@ def _apply_filters(records: pd.DataFrame) -> Tuple[pd.DataFrame, dict]:
         end_date = st.date_input("End Date", end_default)
     with f2:
         doc_type = st.selectbox("Document Type", ["All", "Quotation", "Invoice", "Receipt"], index=0)
-        name_kw = st.text_input("Customer Name contains")
+        name_kw = st.text_input("Customer Name contains", key="reports_name_kw")
     with f3:
         location = st.selectbox("Location", ["All"] + UAE_LOCATIONS, index=0)
         min_amt, max_amt = st.columns(2)
@@ -226,6 +226,8 @@ def _metric_card(label: str, value: str):
 def reports_app():
     ensure_report_files()
     records = _load_records()
+    # Exports are built only when a download button is clicked
+    records_version = export_service.source_version("records", "data/records.xlsx")
     customers = _load_customers()
     products = _load_products()
 
@@ -249,36 +251,22 @@ def reports_app():
     st.markdown("<div class='section-title'>متابعة دورة حياة المشاريع</div>", unsafe_allow_html=True)
     # 2) جدول متابعة المشاريع
     if not records.empty:
-        # بناء جدول لكل base_id
-        lifecycle = []
-        for base_id, group in records.groupby("base_id"):
-            client = group["client_name"].iloc[0] if "client_name" in group.columns else "—"
-            phone = group["phone"].iloc[0] if "phone" in group.columns else "—"
-            location = group["location"].iloc[0] if "location" in group.columns else "—"
-            q_row = group[group["type"] == "q"]
-            i_row = group[group["type"] == "i"]
-            r_row = group[group["type"] == "r"]
-            status_q = "✅" if not q_row.empty else "❌"
-            status_i = "✅" if not i_row.empty else "❌"
-            status_r = "✅" if not r_row.empty else "❌"
-            amt = i_row["amount"].sum() if not i_row.empty else 0.0
-            paid = r_row["amount"].sum() if not r_row.empty else 0.0
-            remain = amt - paid
-            last_update = group["date"].max() if "date" in group.columns else "—"
-            lifecycle.append({
-                "base_id": base_id,
-                "client": client,
-                "phone": phone,
-                "location": location,
-                "عرض سعر": status_q,
-                "فاتورة": status_i,
-                "إيصال": status_r,
-                "المبلغ": amt,
-                "المدفوع": paid,
-                "الرصيد": remain,
-                "آخر تحديث": last_update,
-            })
-        df_life = pd.DataFrame(lifecycle)
+        # جدول المشاريع من العرض المحفوظ (يُحدَّث عند كل حفظ)
+        view = lifecycle.get_view(lambda: records)
+        marks = {True: "✅", False: "❌"}
+        df_life = pd.DataFrame({
+            "base_id": view["base_id"],
+            "client": view["client"],
+            "phone": view["phone"],
+            "location": view["location"],
+            "عرض سعر": view["has_q"].map(marks),
+            "فاتورة": view["has_i"].map(marks),
+            "إيصال": view["has_r"].map(marks),
+            "المبلغ": view["invoiced"],
+            "المدفوع": view["paid"],
+            "الرصيد": view["balance"],
+            "آخر تحديث": view["last_update"],
+        })
         st.dataframe(df_life, use_container_width=True, hide_index=True)
     else:
         st.info("لا توجد مشاريع بعد.")
@@ -309,13 +297,16 @@ def reports_app():
         view = view[cols].sort_values(by=["date"], ascending=False)
         st.dataframe(view, use_container_width=True, hide_index=True)
 
-        buf_xlsx = BytesIO()
-        view.to_excel(buf_xlsx, index=False)
-        buf_xlsx.seek(0)
-        st.download_button("Export Excel", buf_xlsx, file_name="documents_report.xlsx")
-
-        buf_csv = BytesIO(view.to_csv(index=False).encode("utf-8"))
-        st.download_button("Export CSV", buf_csv, file_name="documents_report.csv")
+        st.download_button(
+            "Export Excel",
+            export_service.lazy("documents_report.xlsx", records_version, lambda: export_service.excel_bytes(view)),
+            file_name="documents_report.xlsx",
+        )
+        st.download_button(
+            "Export CSV",
+            export_service.lazy("documents_report.csv", records_version, lambda: export_service.csv_bytes(view)),
+            file_name="documents_report.csv",
+        )
     else:
         st.info("No documents found.")
 
@@ -406,10 +397,11 @@ def reports_app():
     st.markdown("<div class='section-title'>Exporting</div>", unsafe_allow_html=True)
 
     # Full report = جميع المستندات
-    full_buf = BytesIO()
-    records.to_excel(full_buf, index=False)
-    full_buf.seek(0)
-    st.download_button("Download Full Report (Excel)", full_buf, file_name="full_report.xlsx")
+    st.download_button(
+        "Download Full Report (Excel)",
+        export_service.lazy("full_report.xlsx", records_version, lambda: export_service.excel_bytes(records)),
+        file_name="full_report.xlsx",
+    )
 
     # Summary only
     summary_df = pd.DataFrame([
@@ -419,7 +411,8 @@ def reports_app():
         {"Metric":"Outstanding Balance","Value": outstanding},
         {"Metric":"Total Projects","Value": projects},
     ])
-    sum_buf = BytesIO()
-    summary_df.to_excel(sum_buf, index=False)
-    sum_buf.seek(0)
-    st.download_button("Download Summary Only (Excel)", sum_buf, file_name="summary_report.xlsx")
\ No newline at end of file
+    st.download_button(
+        "Download Summary Only (Excel)",
+        export_service.lazy("summary_report.xlsx", records_version, lambda: export_service.excel_bytes(summary_df)),
+        file_name="summary_report.xlsx",
+    )
\ No newline at end of file
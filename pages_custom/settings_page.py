@@ -5,6 +5,7 @@ Settings Page - Complete Implementation with 5 Sections:
 3. Template Manager
 4. Backup & Restore
 5. Log Viewer
+6. Cloud Sync (Firebase outbound queue)
 """
 
 import streamlit as st
@@ -21,10 +22,16 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from utils.auth import load_users, save_users, is_admin
 from utils.logger import log_event, load_logs
 from utils.settings import load_settings, save_settings
+from utils.image_utils import supported_image_formats
+from utils import export_service
 try:
     from utils import db as _db
 except Exception:
     _db = None
+try:
+    from utils import sync_outbox
+except Exception:
+    sync_outbox = None
 
 
 def _apply_settings_theme():
@@ -477,12 +484,13 @@ def settings_app():
         st.warning("⚠️ Most settings require administrator privileges.")
     
     # Create tabs for sections
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "Users",
         "Configuration",
         "Templates",
         "Backup & Restore",
-        "Activity Logs"
+        "Activity Logs",
+        "Cloud Sync"
     ])
 
     # Accent selector (non-blocking) - keep themes unchanged but allow overlay accents
@@ -512,6 +520,9 @@ def settings_app():
     
     with tab5:
         log_viewer_section(user, user_name)
+    
+    with tab6:
+        cloud_sync_section(user, user_name)
 
 
 # ========================================================
@@ -683,6 +694,18 @@ def system_config_section(user, user_name):
             q_w = st.number_input("Quotation Image Width (cm)", min_value=0.5, max_value=20.0, value=float(settings.get("quote_product_image_width_cm", 3.49)))
             q_h = st.number_input("Quotation Image Height (cm)", min_value=0.5, max_value=20.0, value=float(settings.get("quote_product_image_height_cm", 1.5)))
             st.caption("Used in Word quotation table")
+        f1, f2 = st.columns(2)
+        with f1:
+            img_formats = supported_image_formats()
+            cur_fmt = settings.get("product_image_format", "jpeg")
+            img_fmt = st.selectbox(
+                "Inline Image Format",
+                img_formats,
+                index=img_formats.index(cur_fmt) if cur_fmt in img_formats else 0,
+                help="WebP/AVIF are listed only when the installed Pillow can encode them.",
+            )
+        with f2:
+            img_kb = st.number_input("Inline Image Budget (KB)", min_value=4, max_value=200, value=int(settings.get("product_image_max_kb", 24)))
         
         st.markdown('<div class="spacing-md"></div>', unsafe_allow_html=True)
         
@@ -700,7 +723,9 @@ def system_config_section(user, user_name):
             "ui_product_image_width_px": int(ui_w),
             "ui_product_image_height_px": int(ui_h),
             "quote_product_image_width_cm": float(q_w),
-            "quote_product_image_height_cm": float(q_h)
+            "quote_product_image_height_cm": float(q_h),
+            "product_image_format": img_fmt,
+            "product_image_max_kb": int(img_kb)
         })
         save_settings(settings)
         log_event(user_name, "Settings", "config_updated", "System configuration saved")
@@ -926,7 +951,76 @@ def log_viewer_section(user, user_name):
     st.dataframe(filtered, use_container_width=True, hide_index=True, height=400)
     
     st.markdown('<div class="spacing-sm"></div>', unsafe_allow_html=True)
-    if st.button("Export to CSV", type="primary"):
-        csv = filtered.to_csv(index=False)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        st.download_button("⬇ Download CSV", csv, f"activity_logs_{ts}.csv", "text/csv")
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    st.download_button(
+        "⬇ Export to CSV",
+        export_service.lazy(
+            "activity_logs.csv",
+            (export_service.source_version("logs", "data/logs.xlsx"), f_user, f_page, f_action),
+            lambda: export_service.csv_bytes(filtered),
+        ),
+        f"activity_logs_{ts}.csv",
+        "text/csv",
+        type="primary",
+    )
+
+
+# ========================================================
+# SECTION 6: CLOUD SYNC QUEUE
+# ========================================================
+def cloud_sync_section(user, user_name):
+    """Status of the background Firebase write queue."""
+    
+    st.markdown('<div class="crm-section-title">Cloud Sync Queue</div>', unsafe_allow_html=True)
+    st.markdown(
+        '<p style="color: var(--text-muted); font-size: 14px; margin-bottom: 20px;">'
+        'Saves are queued locally and written to Firebase in the background. Failed writes are retried with backoff; '
+        'writes that keep failing are parked as dead letters.</p>',
+        unsafe_allow_html=True,
+    )
+    
+    if sync_outbox is None:
+        st.info("Cloud sync queue is not available.")
+        return
+    
+    counts = sync_outbox.stats()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown('<div class="log-metric"><div class="log-metric-value">{}</div><div class="log-metric-label">Pending</div></div>'.format(counts.get("pending", 0)), unsafe_allow_html=True)
+    with col2:
+        st.markdown('<div class="log-metric"><div class="log-metric-value">{}</div><div class="log-metric-label">Dead letters</div></div>'.format(counts.get("dead", 0)), unsafe_allow_html=True)
+    with col3:
+        state = "Running" if sync_outbox.worker_running() else "Stopped"
+        st.markdown('<div class="log-metric"><div class="log-metric-value">{}</div><div class="log-metric-label">Worker</div></div>'.format(state), unsafe_allow_html=True)
+    
+    st.markdown('<div class="spacing-sm"></div>', unsafe_allow_html=True)
+    items = sync_outbox.list_items()
+    if items:
+        st.dataframe(pd.DataFrame(items), use_container_width=True, hide_index=True, height=300)
+    else:
+        st.success("✓ All writes have reached Firebase.")
+    
+    if not is_admin(user):
+        return
+    
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        if st.button("Sync now", key="sync_queue_flush"):
+            try:
+                from utils.firebase_utils import start_sync_worker, flush_sync_queue
+                start_sync_worker()
+                done = flush_sync_queue(timeout=30)
+                log_event(user_name, "Settings", "sync_queue_flush", f"Flushed sync queue (complete={done})")
+                st.rerun()
+            except Exception as e:
+                st.error(f"Sync failed: {e}")
+    with c2:
+        if st.button("Retry dead letters", key="sync_queue_retry", disabled=not counts.get("dead")):
+            n = sync_outbox.retry_dead()
+            log_event(user_name, "Settings", "sync_queue_retry", f"Requeued {n} dead letters")
+            st.rerun()
+    with c3:
+        if st.button("Purge dead letters", key="sync_queue_purge", disabled=not counts.get("dead")):
+            n = sync_outbox.purge_dead()
+            log_event(user_name, "Settings", "sync_queue_purge", f"Purged {n} dead letters")
+            st.rerun()
@@ -0,0 +1,37 @@
+"""Rebuild the daily KPI snapshots and the project lifecycle view from records.
+
+The dashboard backfills automatically when the snapshots are missing or
+records.xlsx was edited outside the app; run this after importing history
+into Postgres, or to check the snapshot totals.
+
+Usage:
+    python scripts/backfill_kpis.py
+"""
+from pathlib import Path
+import os
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from pages_custom.reports_page import _load_records
+from utils import kpi_snapshots, lifecycle
+
+
+def main():
+    os.chdir(ROOT)
+    t0 = time.perf_counter()
+    records = _load_records()
+    days = kpi_snapshots.backfill(records)
+    projects = len(lifecycle.rebuild(records))
+    kpis = kpi_snapshots.daily()
+    print(f"records={len(records)} days={days} projects={projects} ({time.perf_counter() - t0:.2f}s)")
+    if not kpis.empty:
+        print(f"invoiced={kpis['i_amount'].sum():,.2f} received={kpis['received'].sum():,.2f} "
+              f"outstanding={kpis['outstanding'].iloc[-1]:,.2f} customers={int(kpis['new_customers'].sum())}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
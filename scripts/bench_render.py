@@ -0,0 +1,241 @@
+"""Rendering benchmark suite for utils.quotation_utils.
+
+Times `render_quotation_html`, `validate_template` and (optionally) `html_to_pdf`
+across templates (quotation / invoice / receipt), line counts and image
+presence, and reports p50/p95 latency plus peak traced memory per case.
+
+Results are written as JSON so they can be compared against a stored baseline
+before deploying.
+
+Usage:
+    python scripts/bench_render.py                      # run + write data/benchmarks/render_latest.json
+    python scripts/bench_render.py --pdf                # also time html_to_pdf (slow, needs weasyprint/playwright)
+    python scripts/bench_render.py --save-baseline      # store this run as the baseline
+    python scripts/bench_render.py --compare            # fail (exit 1) when a case regresses past --tolerance
+    python scripts/bench_render.py --lines 1 10 --repeat 5
+"""
+from pathlib import Path
+import argparse
+import base64
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from utils.quotation_utils import render_quotation_html, html_to_pdf
+from utils.template_validator import validate_template
+
+TEMPLATES = {
+    "quotation": "newton_quotation_A4.html",
+    "invoice": "newton_invoice_A4.html",
+    "receipt": "newton_receipt_A4.html",
+}
+DEFAULT_LINES = [1, 10, 100, 1000]
+BENCH_DIR = ROOT / "data" / "benchmarks"
+DEFAULT_OUTPUT = BENCH_DIR / "render_latest.json"
+DEFAULT_BASELINE = BENCH_DIR / "render_baseline.json"
+
+
+def _sample_image_data_url() -> str:
+    """Use the real logo as a representative product image payload."""
+    for p in (ROOT / "data" / "logo.png", ROOT / "data" / "image.png"):
+        if p.exists():
+            return "data:image/png;base64," + base64.b64encode(p.read_bytes()).decode("ascii")
+    # 1x1 transparent PNG keeps the suite runnable on a bare checkout
+    return (
+        "data:image/png;base64,"
+        "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+    )
+
+
+def build_context(kind: str, lines: int, with_images: bool) -> dict:
+    """Build a context that satisfies every placeholder of the given template."""
+    image = _sample_image_data_url() if with_images else None
+    items = []
+    for i in range(lines):
+        qty = (i % 5) + 1
+        price = 100 + (i % 17) * 25
+        items.append({
+            "description": f"Smart device {i + 1} — benchmark line",
+            "qty": qty,
+            "unit_price": price,
+            "total": qty * price,
+            "warranty": f"{(i % 3) + 1} Year",
+            "image": image,
+        })
+    subtotal = sum(it["total"] for it in items)
+    ctx = {
+        "quotation_number": f"BENCH{lines:04}",
+        "quotation_date": "2025-01-01",
+        "client_name": "Benchmark Client",
+        "mobile": "+971 50 123 4567",
+        "project_location": "Dubai",
+        "project_title": "Benchmark Project",
+        "items": items,
+        "subtotal": subtotal,
+        "Installation": 500,
+        "total_amount": subtotal + 500,
+    }
+    if kind == "invoice":
+        ctx.update({
+            "discount": 0,
+            "down_payment": 0,
+            "previously_paid": 0,
+            "balance_due": subtotal + 500,
+            "delivery_text": "Delivery within 7 working days.",
+            "payment_terms_html": "<ol><li>50% advance</li><li>50% on delivery</li></ol>",
+            "power_provider": "DEWA",
+            "project_description": "Benchmark project description.",
+            "warranty_html": "<p>Standard warranty applies.</p>",
+        })
+    elif kind == "receipt":
+        ctx.update({
+            "amount_paid": subtotal / 2,
+            "payment_date": "2025-01-02",
+            "payment_method": "Bank Transfer",
+            "project_scope": "Benchmark scope",
+            "remaining_balance": subtotal / 2 + 500,
+            "total_invoice_amount": subtotal + 500,
+        })
+    return ctx
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def measure(fn, repeat: int, warmup: int = 1) -> dict:
+    """Run `fn` repeatedly and return latency percentiles (ms) and peak memory (KiB)."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000.0)
+    # Memory is traced in a separate run so tracemalloc overhead does not skew timings
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "runs": repeat,
+        "p50_ms": round(_percentile(timings, 50), 3),
+        "p95_ms": round(_percentile(timings, 95), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "peak_kib": round(peak / 1024.0, 1),
+    }
+
+
+def run_suite(line_counts, repeat: int, with_pdf: bool, pdf_max_lines: int) -> dict:
+    results = {}
+    pdf_available = with_pdf
+    for kind, template_name in TEMPLATES.items():
+        tpl_path = ROOT / "templates" / template_name
+        if not tpl_path.exists():
+            print(f"skip {kind}: {tpl_path} not found")
+            continue
+        for lines in line_counts:
+            for with_images in (False, True):
+                ctx = build_context(kind, lines, with_images)
+                case = f"{kind}/lines={lines}/images={'yes' if with_images else 'no'}"
+                # Fewer repeats on the big cases keep a full run under a few minutes
+                reps = max(3, repeat // 4) if lines >= 1000 else repeat
+
+                results[f"render/{case}"] = measure(lambda: render_quotation_html(ctx, template_name=template_name), reps)
+                results[f"validate/{case}"] = measure(lambda: validate_template(tpl_path, ctx), reps)
+
+                if pdf_available and lines <= pdf_max_lines:
+                    html = render_quotation_html(ctx, template_name=template_name)
+                    try:
+                        html_to_pdf(html)
+                    except Exception as e:
+                        print(f"html_to_pdf unavailable, skipping PDF cases: {e}")
+                        pdf_available = False
+                    else:
+                        results[f"pdf/{case}"] = measure(lambda: html_to_pdf(html), max(1, reps // 5), warmup=0)
+
+                r = results[f"render/{case}"]
+                print(f"{case:<40} render p50={r['p50_ms']:>9.2f}ms p95={r['p95_ms']:>9.2f}ms peak={r['peak_kib']:>9.1f}KiB")
+    return results
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Return a list of (case, metric, baseline, current) tuples that regressed."""
+    regressions = []
+    for case, cur in current.items():
+        base = baseline.get(case)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p95_ms", "peak_kib"):
+            b = float(base.get(metric) or 0)
+            c = float(cur.get(metric) or 0)
+            # Ignore sub-millisecond noise on tiny cases
+            if metric.endswith("_ms") and c - b < 1.0:
+                continue
+            if b > 0 and c > b * (1.0 + tolerance):
+                regressions.append((case, metric, b, c))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quotation/invoice/receipt rendering")
+    parser.add_argument("--lines", type=int, nargs="+", default=DEFAULT_LINES, help="line counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per case")
+    parser.add_argument("--pdf", action="store_true", help="also benchmark html_to_pdf")
+    parser.add_argument("--pdf-max-lines", type=int, default=100, help="largest line count used for PDF cases")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write this run to the baseline file")
+    parser.add_argument("--compare", action="store_true", help="compare against the baseline and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = run_suite(args.lines, args.repeat, args.pdf, args.pdf_max_lines)
+    payload = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    print(f"Wrote {args.output}")
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.compare:
+        if not args.baseline.exists():
+            print(f"No baseline at {args.baseline}; run with --save-baseline first")
+            return 1
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")).get("results", {})
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for case, metric, b, c in regressions:
+                print(f"  {case} {metric}: {b} -> {c}")
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Check incremental Firestore sync against the local Firestore emulator.
+
+Start the emulator first, e.g.:
+    gcloud emulators firestore start --host-port=localhost:8080
+
+Then:
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python scripts/emulator_sync_check.py
+
+Uses a temporary sync manifest and a synthetic 40-product catalog: the first
+sync must write every document, editing one product must write exactly one
+and removing one product must issue exactly one delete (a tombstone). The
+incremental pull must then rebuild the same catalog in the local cache and a
+follow-up pull must only see documents at the high-water mark.
+"""
+from pathlib import Path
+import os
+import sys
+import tempfile
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import pandas as pd
+
+from utils import sync_manifest, sync_outbox, firebase_cache
+from utils import firebase_utils
+
+COLLECTION = "products"
+
+
+def _catalog(n=40):
+    return pd.DataFrame({
+        "Device": [f"Emulator Device {i}" for i in range(n)],
+        "Description": [f"Synthetic product {i}" for i in range(n)],
+        "UnitPrice": [100.0 + i for i in range(n)],
+        "Warranty": [1] * n,
+        "ImageBase64": [""] * n,
+    })
+
+
+def _sync(df):
+    # Writes go through the outbox; drain it here so the remote state is final
+    stats = firebase_utils.sync_products_to_firebase(df, upload_images=False)
+    firebase_utils.flush_sync_queue()
+    return stats
+
+
+def _check(label, stats, upserts, deletes):
+    ok = stats is not None and stats["upserts"] == upserts and stats["deletes"] == deletes
+    print(f"{'OK  ' if ok else 'FAIL'} {label}: {stats}")
+    return ok
+
+
+def main():
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        print("FIRESTORE_EMULATOR_HOST is not set; start the emulator and export it first.")
+        return 2
+
+    tmp = tempfile.mkdtemp(prefix="sync_check_")
+    sync_manifest.MANIFEST_PATH = Path(tmp) / "manifest.sqlite"
+    sync_outbox.OUTBOX_PATH = Path(tmp) / "outbox.sqlite"
+    firebase_cache.CACHE_DIR = Path(tmp) / "firebase_cache"
+    db = firebase_utils.get_firestore_client()
+    # Start from an empty collection so the counts are exact
+    for doc in db.collection(COLLECTION).stream():
+        doc.reference.delete()
+
+    df = _catalog()
+    results = [_check("initial sync", _sync(df), len(df), 0)]
+    results.append(_check("no-op sync", _sync(df), 0, 0))
+
+    df.loc[7, "UnitPrice"] = 999.0
+    results.append(_check("edit one product", _sync(df), 1, 0))
+
+    df = df.drop(index=12)
+    results.append(_check("delete one product", _sync(df), 0, 1))
+
+    remote = sum(1 for doc in db.collection(COLLECTION).stream() if not (doc.to_dict() or {}).get("deleted"))
+    results.append(remote == len(df))
+    print(f"{'OK  ' if remote == len(df) else 'FAIL'} remote documents: {remote} (expected {len(df)})")
+
+    first = firebase_utils.pull_collection(COLLECTION)
+    cached = len(firebase_cache.documents(COLLECTION))
+    results.append(cached == len(df))
+    print(f"{'OK  ' if cached == len(df) else 'FAIL'} initial pull: {first}, cached {cached}")
+    again = firebase_utils.pull_collection(COLLECTION)
+    ok = again is not None and again["upserted"] + again["deleted"] < len(df)
+    results.append(ok)
+    print(f"{'OK  ' if ok else 'FAIL'} incremental pull: {again}")
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""Report near-duplicate product images (pHash + dHash) in the catalog and data/product_images.
+
+Usage:
+    python scripts/find_duplicate_images.py                    # report only
+    python scripts/find_duplicate_images.py --max-distance 4
+    python scripts/find_duplicate_images.py --collapse         # point duplicate catalog rows at one stored image
+    python scripts/find_duplicate_images.py --move-folder      # move older same-name variants to data/product_images/_duplicates
+"""
+from pathlib import Path
+import argparse
+import os
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from utils.image_dedupe import (
+    DEFAULT_MAX_DISTANCE,
+    build_index,
+    find_duplicate_groups,
+    describe_groups,
+    collapse_catalog_duplicates,
+    quarantine_folder_duplicates,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate product images")
+    parser.add_argument("--max-distance", type=int, default=DEFAULT_MAX_DISTANCE, help="max Hamming distance (bits of 64)")
+    parser.add_argument("--collapse", action="store_true", help="collapse catalog duplicates onto one stored image")
+    parser.add_argument("--move-folder", action="store_true", help="move redundant folder variants to _duplicates/")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    from pages_custom.products_page import load_products, save_products
+
+    df = load_products()
+    index = build_index(df)
+    groups = find_duplicate_groups(index, args.max_distance)
+    if not groups:
+        print(f"No near-duplicates among {len(index)} image(s)")
+        return 0
+    print(describe_groups(index, groups).to_string(index=False))
+
+    if args.collapse:
+        updated, changed = collapse_catalog_duplicates(df, index, groups)
+        if changed:
+            save_products(updated)
+        print(f"Collapsed {changed} catalog row(s)")
+    moved = quarantine_folder_duplicates(index, groups, dry_run=not args.move_folder)
+    if moved:
+        verb = "Moved" if args.move_folder else "Would move (use --move-folder)"
+        print(f"{verb} {len(moved)} folder file(s): " + ", ".join(moved))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""Bulk-attach photos from data/product_images to catalog products.
+
+Filenames are matched fuzzily to `Device` names, the newest timestamped
+variant wins, images are stored/thumbnailed in a process pool and the catalog
+is written back with a single save_products().
+
+Usage:
+    python scripts/ingest_product_images.py --dry-run
+    python scripts/ingest_product_images.py                  # attach to products without an image
+    python scripts/ingest_product_images.py --overwrite --cutoff 0.9 --workers 4
+"""
+from pathlib import Path
+import argparse
+import os
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from utils.image_ingest import IMAGES_DIR, DEFAULT_CUTOFF, plan_ingest, ingest_images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk ingest product photos")
+    parser.add_argument("--folder", type=Path, default=IMAGES_DIR)
+    parser.add_argument("--cutoff", type=float, default=DEFAULT_CUTOFF, help="minimum match score (0-1)")
+    parser.add_argument("--overwrite", action="store_true", help="replace images on products that already have one")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument("--dry-run", action="store_true", help="only print the match plan")
+    args = parser.parse_args()
+
+    # products_page resolves data/ relative to the working directory
+    os.chdir(ROOT)
+    from pages_custom.products_page import load_products, save_products
+
+    df = load_products()
+    if args.dry_run:
+        plan = plan_ingest(df, args.folder, args.cutoff, args.overwrite)
+        print(plan[["Device", "File", "Score", "Action"]].to_string(index=False))
+        return 0
+
+    t0 = time.perf_counter()
+    updated, plan = ingest_images(df, args.folder, args.cutoff, args.overwrite, args.workers)
+    attached = int((plan["Result"] == "attached").sum())
+    if attached:
+        save_products(updated)
+    print(plan[["Device", "File", "Score", "Action", "Result"]].to_string(index=False))
+    print(f"Attached {attached} image(s) in {time.perf_counter() - t0:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
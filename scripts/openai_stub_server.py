@@ -0,0 +1,91 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Answers POST /v1/chat/completions with a canned completion (a short title
+when the prompt asks for one, a description otherwise) after an optional
+delay, so the AI features can be exercised without a key or network access.
+With --delay, concurrent requests finish together: the quotation's
+"Generate with AI" should take about one delay, not two.
+
+Usage:
+    python scripts/openai_stub_server.py --port 8765 --delay 1.5
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub streamlit run main.py
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import itertools
+import json
+import sys
+import time
+
+TITLE = "Smart Villa Automation Project"
+DESCRIPTION = (
+    "Supply and installation of an integrated smart home system covering lighting, "
+    "security and climate control. Includes configuration, testing and handover."
+)
+
+_ids = itertools.count(1)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send(400, {"error": {"message": "invalid JSON"}})
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        prompt = " ".join(str(m.get("content", "")) for m in request.get("messages", []) if m.get("role") == "user")
+        content = TITLE if "project title" in prompt.lower() else DESCRIPTION
+        n = next(_ids)
+        time.sleep(self.delay)
+        self._send(200, {
+            "id": f"chatcmpl-stub-{n}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(content.split()),
+                      "total_tokens": len(prompt.split()) + len(content.split())},
+        })
+
+    def log_message(self, fmt, *args):
+        print(f"[{time.strftime('%H:%M:%S')}] {self.address_string()} {fmt % args}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a stub OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before each response")
+    args = parser.parse_args()
+
+    StubHandler.delay = max(0.0, args.delay)
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"OpenAI stub listening on http://{args.host}:{args.port}/v1 (delay {StubHandler.delay}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
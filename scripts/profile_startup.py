@@ -0,0 +1,281 @@
+"""Cold-start profiler for the app's import graph and first page renders.
+
+Every measurement runs in a fresh interpreter so nothing is already cached in
+sys.modules:
+
+* imports — `python -X importtime -c "import <module>"` for each module main.py
+  imports at the top, each `pages_custom` module and each `utils` module.
+  Reports the module's cumulative import time and the third-party packages
+  that dominate it.
+* renders — the first `AppTest` run of the PIN screen (main.py, logged out)
+  and of every page in main.PAGE_MODULES. Firestore is disabled in the child
+  process, so renders only touch local data.
+
+Prints a ranked report and writes JSON so a new dependency that slows startup
+shows up against a stored baseline.
+
+Usage:
+    python scripts/profile_startup.py                   # run + write data/benchmarks/startup_latest.json
+    python scripts/profile_startup.py --skip-renders    # imports only (fast)
+    python scripts/profile_startup.py --save-baseline   # store this run as the baseline
+    python scripts/profile_startup.py --compare         # fail (exit 1) when something regresses past --tolerance
+    python scripts/profile_startup.py --repeat 5 --top 15
+"""
+from pathlib import Path
+import argparse
+import ast
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+BENCH_DIR = ROOT / "data" / "benchmarks"
+DEFAULT_OUTPUT = BENCH_DIR / "startup_latest.json"
+DEFAULT_BASELINE = BENCH_DIR / "startup_baseline.json"
+LOGIN_PAGE = "login"
+# Differences below this are interpreter noise, not regressions
+NOISE_MS = 25.0
+
+
+def main_imports() -> list:
+    """Modules imported at the top level of main.py (what every worker pays before the PIN screen)."""
+    tree = ast.parse((ROOT / "main.py").read_text(encoding="utf-8"))
+    mods = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            mods.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            mods.append(node.module)
+    return list(dict.fromkeys(mods))
+
+
+def page_modules() -> dict:
+    """main.PAGE_MODULES read from source (importing main.py would run the app)."""
+    tree = ast.parse((ROOT / "main.py").read_text(encoding="utf-8"))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "PAGE_MODULES" for t in node.targets):
+            return ast.literal_eval(node.value)
+    return {}
+
+
+def package_modules(package: str) -> list:
+    return sorted(
+        f"{package}.{p.stem}" for p in (ROOT / package).glob("*.py") if p.stem != "__init__"
+    )
+
+
+def parse_importtime(stderr: str) -> list:
+    """Rows of (module, self_us, cumulative_us, depth) from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            parts = line[len("import time:"):].split("|")
+            self_us, cum_us, name = int(parts[0]), int(parts[1]), parts[2]
+        except (ValueError, IndexError):
+            continue
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped) - 1) // 2
+        rows.append((stripped, self_us, cum_us, depth))
+    return rows
+
+
+def profile_import(module: str, repeat: int) -> dict:
+    """Median cold import of one module plus its heaviest third-party dependencies."""
+    totals, walls, rows, error = [], [], [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        walls.append((time.perf_counter() - t0) * 1000.0)
+        if proc.returncode != 0:
+            error = (proc.stderr.strip().splitlines() or ["import failed"])[-1]
+            break
+        rows = parse_importtime(proc.stderr)
+        own = [cum for name, _, cum, _ in rows if name == module]
+        totals.append((own[-1] if own else sum(s for _, s, _, _ in rows)) / 1000.0)
+    result = {
+        "import_ms": round(statistics.median(totals), 1) if totals else None,
+        "wall_ms": round(statistics.median(walls), 1),
+    }
+    if error:
+        result["error"] = error
+        return result
+    # Heaviest top-level packages pulled in (outside this repo)
+    local = ("utils", "pages_custom", module.split(".")[0])
+    third_party = {}
+    for name, _, cum, _ in rows:
+        top = name.split(".")[0]
+        if top in local or name != top or top in sys.stdlib_module_names:
+            continue
+        third_party[top] = max(third_party.get(top, 0), cum)
+    heavy = sorted(third_party.items(), key=lambda kv: kv[1], reverse=True)[:5]
+    result["heaviest"] = {name: round(us / 1000.0, 1) for name, us in heavy}
+    return result
+
+
+_RENDER_CHILD = r'''
+import json, sys, time
+sys.path.insert(0, {root!r})
+import utils.firebase_utils as fu
+fu.get_firestore_client = lambda: None
+from streamlit.testing.v1 import AppTest
+page = {page!r}
+if page == {login!r}:
+    at = AppTest.from_file({main!r}, default_timeout=300)
+else:
+    def app(module, func):
+        import importlib
+        import utils.firebase_utils as fu
+        fu.get_firestore_client = lambda: None
+        getattr(importlib.import_module(module), func)()
+    at = AppTest.from_function(app, args=tuple({entry!r}), default_timeout=300)
+t0 = time.perf_counter()
+at.run()
+ms = (time.perf_counter() - t0) * 1000.0
+print("__RESULT__" + json.dumps({{"render_ms": round(ms, 1), "exceptions": [e.message for e in at.exception]}}))
+'''
+
+
+def profile_render(page: str, entry) -> dict:
+    """First AppTest render of a page in a fresh interpreter."""
+    code = _RENDER_CHILD.format(
+        root=str(ROOT), page=page, login=LOGIN_PAGE, main=str(ROOT / "main.py"), entry=list(entry or ()),
+    )
+    # AppTest.from_function needs real source, so the child runs from a file, not -c
+    with tempfile.TemporaryDirectory() as tmp:
+        script = Path(tmp) / "render_page.py"
+        script.write_text(code, encoding="utf-8")
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, str(script)], cwd=ROOT, capture_output=True, text=True)
+        wall = (time.perf_counter() - t0) * 1000.0
+    for line in proc.stdout.splitlines():
+        if line.startswith("__RESULT__"):
+            result = json.loads(line[len("__RESULT__"):])
+            result["wall_ms"] = round(wall, 1)
+            return result
+    tail = (proc.stderr.strip().splitlines() or ["render failed"])[-1]
+    return {"render_ms": None, "wall_ms": round(wall, 1), "error": tail}
+
+
+def run_profile(repeat: int, with_renders: bool) -> dict:
+    groups = {
+        "main": main_imports(),
+        "pages_custom": package_modules("pages_custom"),
+        "utils": package_modules("utils"),
+    }
+    imports = {}
+    for group, modules in groups.items():
+        for module in modules:
+            key = f"{group}:{module}"
+            if any(k.endswith(f":{module}") for k in imports):
+                continue
+            imports[key] = profile_import(module, repeat)
+            r = imports[key]
+            shown = f"{r['import_ms']:>8.1f}ms" if r["import_ms"] is not None else f"ERROR {r.get('error')}"
+            print(f"import {key:<45} {shown}")
+
+    renders = {}
+    if with_renders:
+        pages = {LOGIN_PAGE: None, **page_modules()}
+        for page, entry in pages.items():
+            renders[page] = profile_render(page, entry)
+            r = renders[page]
+            shown = f"{r['render_ms']:>8.1f}ms" if r.get("render_ms") is not None else f"ERROR {r.get('error')}"
+            print(f"render {page:<45} {shown}")
+    return {"imports": imports, "renders": renders}
+
+
+def print_report(results: dict, top: int):
+    imports = [(k, v) for k, v in results["imports"].items() if v.get("import_ms") is not None]
+    imports.sort(key=lambda kv: kv[1]["import_ms"], reverse=True)
+    print(f"\nSlowest cold imports (top {top}):")
+    for key, r in imports[:top]:
+        heavy = ", ".join(f"{name} {ms:.0f}ms" for name, ms in r.get("heaviest", {}).items())
+        print(f"  {r['import_ms']:>8.1f}ms  {key:<45} {heavy}")
+    renders = [(k, v) for k, v in results["renders"].items() if v.get("render_ms") is not None]
+    if renders:
+        renders.sort(key=lambda kv: kv[1]["render_ms"], reverse=True)
+        print("\nFirst render per page:")
+        for page, r in renders:
+            note = f"  ({len(r['exceptions'])} exception(s))" if r.get("exceptions") else ""
+            print(f"  {r['render_ms']:>8.1f}ms  {page}{note}")
+    failed = [k for k, v in {**results["imports"], **results["renders"]}.items() if v.get("error")]
+    if failed:
+        print(f"\nFailed: {', '.join(failed)}")
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Return a list of (case, metric, baseline, current) tuples that regressed."""
+    regressions = []
+    for section, metric in (("imports", "import_ms"), ("renders", "render_ms")):
+        for case, cur in current.get(section, {}).items():
+            base = baseline.get(section, {}).get(case)
+            if not base:
+                continue
+            b = float(base.get(metric) or 0)
+            c = float(cur.get(metric) or 0)
+            if c - b < NOISE_MS:
+                continue
+            if b > 0 and c > b * (1.0 + tolerance):
+                regressions.append((f"{section}/{case}", metric, b, c))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile cold imports and first page renders")
+    parser.add_argument("--repeat", type=int, default=3, help="cold imports per module (median is kept)")
+    parser.add_argument("--skip-renders", action="store_true", help="only profile imports")
+    parser.add_argument("--top", type=int, default=10, help="rows in the ranked import report")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write this run to the baseline file")
+    parser.add_argument("--compare", action="store_true", help="compare against the baseline and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.30, help="allowed relative slowdown (0.30 = 30%%)")
+    args = parser.parse_args()
+
+    results = run_profile(max(1, args.repeat), not args.skip_renders)
+    print_report(results, args.top)
+    payload = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    print(f"\nWrote {args.output}")
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.compare:
+        if not args.baseline.exists():
+            print(f"No baseline at {args.baseline}; run with --save-baseline first")
+            return 1
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")).get("results", {})
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for case, metric, b, c in regressions:
+                print(f"  {case} {metric}: {b} -> {c}")
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
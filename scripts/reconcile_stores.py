@@ -0,0 +1,57 @@
+"""Check that Excel, Postgres and Firestore hold the same records/customers/products.
+
+Per-bucket hashes are compared first (records by month, customers/products by
+name prefix); only mismatching buckets are fetched row by row. Prints the
+discrepancies and a repair plan; nothing is written to any store.
+
+Usage:
+    python scripts/reconcile_stores.py
+    python scripts/reconcile_stores.py --datasets products --stores excel firestore
+    python scripts/reconcile_stores.py --source excel --json data/reconcile_report.json
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from utils.reconcile import DATASETS, STORES, reconcile, discrepancies_frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile Excel / Postgres / Firestore")
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASETS), default=list(DATASETS))
+    parser.add_argument("--stores", nargs="+", choices=list(STORES), default=list(STORES))
+    parser.add_argument("--source", choices=list(STORES), default=None, help="source of truth for the repair plan")
+    parser.add_argument("--json", type=Path, default=None, help="also write the full result as JSON")
+    args = parser.parse_args()
+
+    # Excel files and the Firestore cache live under data/ relative to the repo root
+    os.chdir(ROOT)
+    result = reconcile(args.datasets, args.stores, args.source)
+
+    for r in result["reports"]:
+        print(f"{r['dataset']}: stores={','.join(r['stores']) or '-'} buckets={r['buckets_total']} "
+              f"mismatched={r['buckets_mismatched']} rows_fetched={r['rows_fetched']} "
+              f"discrepancies={len(r['discrepancies'])}")
+    frame = discrepancies_frame(result)
+    if not frame.empty:
+        print()
+        print(frame.to_string(index=False))
+    if result["plan"]:
+        print(f"\nRepair plan (source of truth: {result['source']}):")
+        for step in result["plan"]:
+            extra = f" set {step['set']}" if step.get("set") else ""
+            print(f"  {step['action']:<7} {step['store']:<10} {step['dataset']:<10} {step['key']}{extra}")
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\nWrote {args.json}")
+    return 1 if not frame.empty else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+One-time cache for static assets (logos, stylesheets).
+
+Files are read and encoded once per mtime instead of on every rerun. With
+`server.enableStaticServing` on (see .streamlit/config.toml) they are also
+published into the app's `static/` folder under a content-hashed name and
+referenced by URL (`app/static/logo.1a2b3c4d5e.png`), so each rerun sends a
+short <img>/<link> tag instead of the base64 image or the full CSS text.
+Without static serving the same helpers return inline data URIs / <style>
+blocks, still encoded only once.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from base64 import b64encode
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import streamlit as st
+
+
+APP_ROOT = Path(__file__).resolve().parent.parent
+STATIC_DIR = APP_ROOT / "static"
+STATIC_URL = "app/static"
+
+_STYLE_BLOCK = re.compile(r"^\s*<style>(.*)</style>\s*$", re.S)
+
+_lock = threading.Lock()
+# path -> (mtime, value); keyed separately per kind of output
+_data_uris: Dict[str, Tuple[float, str]] = {}
+_published: Dict[str, Tuple[float, str]] = {}
+_stylesheets: Dict[str, str] = {}
+
+
+def _resolve(path) -> Path:
+    p = Path(path)
+    return p if p.is_absolute() else APP_ROOT / p
+
+
+def _mtime(p: Path) -> Optional[float]:
+    try:
+        return p.stat().st_mtime
+    except OSError:
+        return None
+
+
+def _mime(p: Path) -> str:
+    if p.suffix.lower() == ".svg":
+        return "image/svg+xml"
+    return mimetypes.guess_type(p.name)[0] or "application/octet-stream"
+
+
+def static_serving() -> bool:
+    """True when Streamlit serves ./static (server.enableStaticServing)."""
+    try:
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+
+def data_uri(path) -> Optional[str]:
+    """`data:` URI of a file, encoded once per mtime; None if it does not exist."""
+    p = _resolve(path)
+    mtime = _mtime(p)
+    if mtime is None:
+        return None
+    key = str(p)
+    with _lock:
+        hit = _data_uris.get(key)
+        if hit and hit[0] == mtime:
+            return hit[1]
+    uri = f"data:{_mime(p)};base64,{b64encode(p.read_bytes()).decode('utf-8')}"
+    with _lock:
+        _data_uris[key] = (mtime, uri)
+    return uri
+
+
+def _write_static(stem: str, suffix: str, content: bytes) -> str:
+    """Write content to static/<stem>.<hash><suffix> (once) and drop older versions."""
+    digest = hashlib.sha1(content).hexdigest()[:10]
+    name = f"{stem}.{digest}{suffix}"
+    target = STATIC_DIR / name
+    if not target.exists():
+        STATIC_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(target.suffix + ".tmp")
+        tmp.write_bytes(content)
+        os.replace(tmp, target)
+        for old in STATIC_DIR.glob(f"{stem}.*{suffix}"):
+            if old.name != name:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+    return f"{STATIC_URL}/{name}"
+
+
+def static_url(path) -> Optional[str]:
+    """URL of a file published to static/ (once per mtime); None without static serving."""
+    if not static_serving():
+        return None
+    p = _resolve(path)
+    mtime = _mtime(p)
+    if mtime is None:
+        return None
+    key = str(p)
+    with _lock:
+        hit = _published.get(key)
+        if hit and hit[0] == mtime:
+            return hit[1]
+    try:
+        url = _write_static(p.stem, p.suffix.lower(), p.read_bytes())
+    except OSError as e:
+        print(f"⚠️ Could not publish {p.name} to static/: {e}")
+        return None
+    with _lock:
+        _published[key] = (mtime, url)
+    return url
+
+
+def image_src(path) -> Optional[str]:
+    """Best `src` for an <img>: static URL when served, else cached data URI."""
+    return static_url(path) or data_uri(path)
+
+
+def stylesheet(name: str, css: str) -> str:
+    """Markup for a <style> block: a <link> to a static copy when possible, else the block itself."""
+    m = _STYLE_BLOCK.match(css)
+    if not m or not static_serving():
+        return css
+    key = f"{name}:{hashlib.sha1(css.encode('utf-8')).hexdigest()}"
+    with _lock:
+        hit = _stylesheets.get(key)
+    if hit:
+        return hit
+    try:
+        url = _write_static(name, ".css", m.group(1).strip().encode("utf-8"))
+    except OSError as e:
+        print(f"⚠️ Could not publish {name}.css to static/: {e}")
+        return css
+    tag = f'<link rel="stylesheet" href="{url}">'
+    with _lock:
+        _stylesheets[key] = tag
+    return tag
+
+
+__all__ = ["STATIC_DIR", "static_serving", "data_uri", "static_url", "image_src", "stylesheet"]
@@ -0,0 +1,271 @@
+"""
+Catalog export pipeline for Word product cards.
+
+Card images are decoded/resized in a thread pool and cached per image hash
+(the image store's "card" thumbnails), settings are read once per build and
+the document is assembled in a single pass and written straight to
+data/exports/. `start_export_job` runs the whole build on a background
+thread so the products page can show progress instead of blocking a rerun.
+Finished files are removed with `discard_job` once downloaded; starting a job
+also prunes older files so at most KEEP_EXPORTS stay on disk.
+"""
+
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+try:
+    from docx import Document
+    from docx.shared import Pt, Cm
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    HAVE_PYDOX = True
+except Exception:
+    Document = None
+    Pt = None
+    Cm = None
+    WD_ALIGN_PARAGRAPH = None
+    HAVE_PYDOX = False
+
+from utils import image_store
+from utils.settings import load_settings
+
+
+CATALOG_TEMPLATE = Path("data") / "catalog_template.docx"
+EXPORT_DIR = Path("data") / "exports"
+EXPORT_PATTERN = "product_cards_*.docx"
+KEEP_EXPORTS = 3
+
+
+# ==========================================
+# IMAGE PREPROCESSING
+# ==========================================
+def _card_image(value: Any) -> Optional[bytes]:
+    """Card-size JPEG for a store key or inline base64 value (cached per hash)."""
+    if image_store.is_image_ref(value):
+        return image_store.get_thumbnail(value, "card")
+    data = image_store.decode_base64_image(value)
+    if not data:
+        return None
+    # Inline images go through the store too, so later builds hit the thumbnail cache
+    return image_store.get_thumbnail(image_store.put_image(data, generate_thumbnails=False), "card")
+
+
+def prepare_card_images(values, max_workers: int = 8) -> Dict[str, Optional[bytes]]:
+    """Resolve each distinct image value to card bytes using a worker pool."""
+    distinct = []
+    seen = set()
+    for v in values:
+        if isinstance(v, str) and v.strip() and v not in seen:
+            seen.add(v)
+            distinct.append(v)
+    if not distinct:
+        return {}
+
+    def _safe(v):
+        try:
+            return _card_image(v)
+        except Exception as e:
+            print(f"Card image failed: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(distinct)))) as pool:
+        return dict(zip(distinct, pool.map(_safe, distinct)))
+
+
+# ==========================================
+# DOCX ASSEMBLY
+# ==========================================
+def add_product_card(doc, row, width_cm: float, height_cm: float, card_index: int, image_data: Optional[bytes] = None):
+    """Append one 2x2 product card table (image | name/description/price/warranty)."""
+    table = doc.add_table(rows=2, cols=2)
+    table.style = "Table Grid"
+
+    # Image cell
+    img_cell = table.cell(0, 0)
+    img_cell.merge(table.cell(1, 0))
+    if image_data:
+        try:
+            img_cell.text = ""
+            p = img_cell.paragraphs[0] if img_cell.paragraphs else img_cell.add_paragraph("")
+            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            run = p.add_run()
+            run.add_picture(BytesIO(image_data), width=Cm(width_cm), height=Cm(height_cm))
+        except Exception:
+            img_cell.text = "No Image"
+    else:
+        img_cell.text = "No Image"
+
+    # Text cell
+    text_cell = table.cell(0, 1)
+    text_cell.paragraphs[0].text = ""
+    p = text_cell.paragraphs[0]
+    p.alignment = WD_ALIGN_PARAGRAPH.LEFT
+    name_run = p.add_run(str(row.get("Device", "")))
+    name_run.bold = True
+    text_cell.add_paragraph(str(row.get("Description", "")))
+    price_p = text_cell.add_paragraph(f"{row.get('UnitPrice', '')} AED")
+    price_p.paragraph_format.space_after = Pt(0)
+    warr_p = text_cell.add_paragraph(f"Warranty: {row.get('Warranty', '')}")
+    warr_p.paragraph_format.space_after = Pt(0)
+
+    # Spacing between cards and page break every 4
+    doc.add_paragraph("")
+    if (card_index + 1) % 4 == 0:
+        doc.add_page_break()
+
+
+def _open_template():
+    if not HAVE_PYDOX:
+        raise RuntimeError("python-docx is not installed; catalog Word export unavailable.")
+    if not CATALOG_TEMPLATE.exists():
+        raise FileNotFoundError("Catalog Word template not found at data/catalog_template.docx")
+    from utils.template_validator import validate_template, format_mismatch_message
+    missing, extra = validate_template(CATALOG_TEMPLATE, {})
+    if missing:
+        raise ValueError(f"Catalog template placeholders missing: {format_mismatch_message(missing, extra)}")
+    return Document(str(CATALOG_TEMPLATE))
+
+
+def build_catalog_document(
+    products_df: pd.DataFrame,
+    output=None,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+    max_workers: int = 8,
+):
+    """Build the product-cards document.
+
+    `output` may be a path or a writable binary file object; when omitted a
+    BytesIO is returned. `progress(stage, done, total)` is called with stage
+    "images" once preprocessing finishes and "cards" while assembling.
+    """
+    doc = _open_template()
+    settings = load_settings()
+    width_cm = float(settings.get("quote_product_image_width_cm", 3.49))
+    height_cm = float(settings.get("quote_product_image_height_cm", 1.5))
+
+    values = products_df["ImageBase64"].tolist() if "ImageBase64" in products_df.columns else []
+    images = prepare_card_images(values, max_workers=max_workers)
+    total = len(products_df)
+    if progress:
+        progress("images", len(images), len(images))
+
+    for idx, (_, row) in enumerate(products_df.iterrows()):
+        value = row.get("ImageBase64")
+        add_product_card(doc, row, width_cm, height_cm, idx, images.get(value) if isinstance(value, str) else None)
+        if progress and (idx % 25 == 0 or idx + 1 == total):
+            progress("cards", idx + 1, total)
+
+    if output is None:
+        buf = BytesIO()
+        doc.save(buf)
+        buf.seek(0)
+        return buf
+    doc.save(str(output) if isinstance(output, Path) else output)
+    return output
+
+
+# ==========================================
+# BACKGROUND JOBS
+# ==========================================
+_JOBS: Dict[str, Dict[str, Any]] = {}
+_JOBS_LOCK = threading.Lock()
+
+
+def _update_job(job_id: str, **fields):
+    with _JOBS_LOCK:
+        _JOBS[job_id].update(fields)
+
+
+def _run_job(job_id: str, products_df: pd.DataFrame, output_path: Path):
+    try:
+        _update_job(job_id, status="running", stage="images")
+        build_catalog_document(
+            products_df,
+            output=output_path,
+            progress=lambda stage, done, total: _update_job(job_id, stage=stage, done=done, total=total),
+        )
+        _update_job(job_id, status="done", path=str(output_path), finished_at=datetime.now().isoformat())
+    except Exception as e:
+        _update_job(job_id, status="error", error=str(e), finished_at=datetime.now().isoformat())
+
+
+def _prune_exports(keep: int = KEEP_EXPORTS):
+    """Delete all but the newest `keep` finished export files (never a running job's)."""
+    with _JOBS_LOCK:
+        active = {
+            Path(job["output"]).name for job in _JOBS.values() if job["status"] in ("queued", "running")
+        }
+    files = sorted(
+        (p for p in EXPORT_DIR.glob(EXPORT_PATTERN) if p.name not in active),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for old in files[max(0, keep):]:
+        try:
+            old.unlink()
+        except OSError:
+            pass
+
+
+def start_export_job(products_df: pd.DataFrame) -> str:
+    """Start a background catalog build and return its job id."""
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    # Room for the new file within KEEP_EXPORTS
+    _prune_exports(KEEP_EXPORTS - 1)
+    job_id = uuid.uuid4().hex[:12]
+    output_path = EXPORT_DIR / f"product_cards_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{job_id}.docx"
+    with _JOBS_LOCK:
+        _JOBS[job_id] = {
+            "id": job_id,
+            "status": "queued",
+            "stage": "",
+            "done": 0,
+            "total": len(products_df),
+            "path": None,
+            "output": str(output_path),
+            "error": None,
+            "started_at": datetime.now().isoformat(),
+        }
+    t = threading.Thread(target=_run_job, args=(job_id, products_df.copy(), output_path), daemon=True)
+    t.start()
+    return job_id
+
+
+def get_job(job_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Snapshot of a job's state (None if unknown)."""
+    if not job_id:
+        return None
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        return dict(job) if job else None
+
+
+def discard_job(job_id: Optional[str]):
+    """Forget a finished job and delete its file."""
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id) if job_id else None
+        if job is None or job["status"] in ("queued", "running"):
+            return
+        del _JOBS[job_id]
+    try:
+        Path(job["output"]).unlink()
+    except OSError:
+        pass
+
+
+__all__ = [
+    "HAVE_PYDOX",
+    "KEEP_EXPORTS",
+    "prepare_card_images",
+    "add_product_card",
+    "build_catalog_document",
+    "start_export_job",
+    "get_job",
+    "discard_job",
+]
@@ -0,0 +1,193 @@
+"""
+Indexed in-memory product catalog.
+
+`CatalogIndex` keeps every product row in a dict keyed by Device (O(1)
+lookup) plus a trigram inverted index and a word-prefix map over device and
+description, so search stays fast with 10k+ SKUs. `get_catalog_index` caches
+one index per process and only reloads when the products data version (or
+the Excel file) changes. Every page shares that index, so it is always built
+from `load_catalog` (DB first, Excel fallback, the six catalog columns).
+"""
+
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from utils import data_version
+
+try:
+    from utils import db as _db
+except Exception:
+    _db = None
+
+
+PRODUCTS_XLSX = os.path.join("data", "products.xlsx")
+CATALOG_COLUMNS = ["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]
+MAX_PREFIX = 3
+FUZZY_MIN_SCORE = 0.5
+RELOAD_AFTER_SECONDS = 300  # also pick up edits made by other processes (e.g. directly in Postgres)
+
+_lock = threading.Lock()
+_cached: Optional[Tuple[tuple, float, "CatalogIndex"]] = None
+
+
+def _norm(text) -> str:
+    if text is None or (isinstance(text, float) and text != text):
+        return ""
+    return " ".join(str(text).replace("\u200f", "").lower().split())
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CatalogIndex:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df.reset_index(drop=True)
+        self.columns = list(self.df.columns)
+        self._rows: List[Dict] = self.df.to_dict("records")
+        self.devices: List[str] = [str(r.get("Device", "")) for r in self._rows]
+        self._by_device: Dict[str, int] = {}
+        self._by_device_lower: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._descs: List[str] = []
+        self._grams: Dict[str, Set[int]] = {}
+        self._prefixes: Dict[str, Set[int]] = {}
+
+        for i, row in enumerate(self._rows):
+            device = self.devices[i]
+            self._by_device.setdefault(device, i)
+            name = _norm(device)
+            desc = _norm(row.get("Description"))
+            self._by_device_lower.setdefault(name, i)
+            self._names.append(name)
+            self._descs.append(desc)
+            for g in _trigrams(name) | _trigrams(desc):
+                self._grams.setdefault(g, set()).add(i)
+            for word in set(re.split(r"[^0-9a-z؀-ۿ]+", f"{name} {desc}")):
+                for n in range(1, min(MAX_PREFIX, len(word)) + 1):
+                    self._prefixes.setdefault(word[:n], set()).add(i)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, device) -> Optional[pd.Series]:
+        """Row for an exact Device name (case-insensitive fallback), or None."""
+        if device is None:
+            return None
+        i = self._by_device.get(str(device))
+        if i is None:
+            i = self._by_device_lower.get(_norm(device))
+        if i is None:
+            return None
+        return pd.Series(self._rows[i], index=self.columns)
+
+    def _candidates(self, q: str) -> Set[int]:
+        words = [w for w in re.split(r"[^0-9a-z؀-ۿ]+", q) if w]
+        if len(q) < 3:
+            # Short input: every word must prefix-match some word of the product
+            sets = [self._prefixes.get(w[:MAX_PREFIX], set()) for w in words]
+            return set.intersection(*sets) if sets else set()
+        grams = _trigrams(q)
+        counts: Dict[int, int] = {}
+        for g in grams:
+            for i in self._grams.get(g, ()):
+                counts[i] = counts.get(i, 0) + 1
+        need = max(1, int(len(grams) * FUZZY_MIN_SCORE))
+        return {i for i, c in counts.items() if c >= need}
+
+    def search(self, query: str, limit: Optional[int] = 50) -> List[str]:
+        """Device names ranked for `query`: exact, prefix, word prefix, substring, then fuzzy."""
+        q = _norm(query)
+        if not q:
+            return self.devices[:limit] if limit else list(self.devices)
+        grams = _trigrams(q)
+        ranked = []
+        for i in self._candidates(q):
+            name, desc = self._names[i], self._descs[i]
+            if name == q:
+                rank = 0.0
+            elif name.startswith(q):
+                rank = 1.0
+            elif f" {q}" in f" {name}":
+                rank = 2.0
+            elif q in name:
+                rank = 3.0
+            elif q in desc:
+                rank = 4.0
+            else:
+                shared = len(grams & (_trigrams(name) | _trigrams(desc)))
+                rank = 5.0 + (1.0 - shared / float(len(grams)))
+            ranked.append((rank, name, i))
+        ranked.sort()
+        out = [self.devices[i] for _, _, i in ranked]
+        return out[:limit] if limit else out
+
+    def picker_options(self, query: str, current: Optional[str] = None, limit: int = 50) -> List[str]:
+        """Options for a search-as-you-type selectbox; keeps the current choice selectable.
+
+        Empty when nothing matches, so the page can say so instead of offering an unrelated product.
+        """
+        options = self.search(query, limit)
+        if current and current in self._by_device and current not in options:
+            options = [current] + options
+        return options
+
+
+def _with_catalog_columns(df: pd.DataFrame) -> pd.DataFrame:
+    for col in CATALOG_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    return df[CATALOG_COLUMNS]
+
+
+def load_catalog() -> pd.DataFrame:
+    """Product catalog with exactly CATALOG_COLUMNS (DB first, fallback to Excel)."""
+    if _db is not None:
+        try:
+            rows = _db.db_query(
+                'SELECT device as "Device", description as "Description", unit_price as "UnitPrice", warranty as "Warranty", image_base64 as "ImageBase64", image_path as "ImagePath" FROM products ORDER BY id'
+            )
+            if rows:
+                return _with_catalog_columns(pd.DataFrame(rows))
+        except Exception:
+            # Fall back to Excel
+            pass
+    try:
+        return _with_catalog_columns(pd.read_excel(PRODUCTS_XLSX))
+    except Exception:
+        return pd.DataFrame(columns=CATALOG_COLUMNS)
+
+
+def _excel_mtime() -> float:
+    try:
+        return os.path.getmtime(PRODUCTS_XLSX)
+    except OSError:
+        return 0.0
+
+
+def get_catalog_index() -> CatalogIndex:
+    """Process-wide index; the catalog is reloaded only when products changed or the index went stale."""
+    global _cached
+    key = (data_version.get("products"), _excel_mtime())
+    with _lock:
+        if _cached is not None and _cached[0] == key and time.time() - _cached[1] < RELOAD_AFTER_SECONDS:
+            return _cached[2]
+    index = CatalogIndex(load_catalog())
+    with _lock:
+        _cached = (key, time.time(), index)
+    return index
+
+
+def invalidate():
+    global _cached
+    with _lock:
+        _cached = None
+
+
+__all__ = ["CATALOG_COLUMNS", "CatalogIndex", "load_catalog", "get_catalog_index", "invalidate"]
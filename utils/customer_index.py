@@ -0,0 +1,136 @@
+"""
+O(1) customer lookup for quotation / invoice upserts.
+
+File store: `get_customer_index(cdf)` maps lower-cased names and `phone_key`s
+to row labels of the loaded customers frame. It is cached per customers.xlsx
+mtime; after an upsert the page records the row with `add` and calls
+`saved(index)` so the next upsert reuses it instead of re-scanning.
+
+Postgres: `ensure_db_schema()` adds a `phone_key` column (backfilled with the
+same normalization in SQL) and indexes on it and on `name`, so `db_find` is an
+index lookup instead of comparing raw phone strings.
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+from utils.phone import SQL_PHONE_KEY, phone_key
+
+try:
+    from utils import db as _db
+except Exception:
+    _db = None
+
+
+CUSTOMERS_XLSX = os.path.join("data", "customers.xlsx")
+
+_lock = threading.Lock()
+_cached: Optional[Tuple[Tuple[float, int], "CustomerIndex"]] = None
+_schema_ready = False
+
+
+def _name_key(name) -> str:
+    s = str(name if name is not None else "").strip().lower()
+    return "" if s in ("nan", "none") else s
+
+
+class CustomerIndex:
+    def __init__(self, cdf: pd.DataFrame):
+        self.by_name: Dict[str, object] = {}
+        self.by_phone: Dict[str, object] = {}
+        empty = pd.Series(index=cdf.index, dtype=object)
+        names = cdf["client_name"] if "client_name" in cdf.columns else empty
+        phones = cdf["phone"] if "phone" in cdf.columns else empty
+        keys = cdf["phone_key"] if "phone_key" in cdf.columns else empty
+        # First row wins, like the scans this replaces
+        for label, name, phone, key in zip(cdf.index, names, phones, keys):
+            if not isinstance(key, str) or not key:
+                key = phone_key(phone)   # rows saved before the phone_key column existed
+            name = _name_key(name)
+            if name and name not in self.by_name:
+                self.by_name[name] = label
+            if key and key not in self.by_phone:
+                self.by_phone[key] = label
+        self.size = len(cdf)
+
+    def find(self, name, phone) -> Optional[object]:
+        """Row label of the customer with this name, else with this phone; None if new."""
+        label = self.by_name.get(_name_key(name))
+        if label is None:
+            key = phone_key(phone)
+            label = self.by_phone.get(key) if key else None
+        return label
+
+    def add(self, label, name, phone):
+        """Record an inserted / updated row."""
+        name_key, key = _name_key(name), phone_key(phone)
+        if name_key:
+            self.by_name.setdefault(name_key, label)
+        if key:
+            self.by_phone.setdefault(key, label)
+
+
+def _stamp(size: int) -> Tuple[float, int]:
+    try:
+        mtime = os.path.getmtime(CUSTOMERS_XLSX)
+    except OSError:
+        mtime = 0.0
+    return mtime, size
+
+
+def get_customer_index(cdf: pd.DataFrame) -> CustomerIndex:
+    """Index for a freshly loaded customers frame; rebuilt only when the file changed."""
+    global _cached
+    stamp = _stamp(len(cdf))
+    with _lock:
+        if _cached is not None and _cached[0] == stamp:
+            return _cached[1]
+    index = CustomerIndex(cdf)
+    with _lock:
+        _cached = (stamp, index)
+    return index
+
+
+def saved(index: CustomerIndex, cdf: pd.DataFrame):
+    """Call after writing `cdf` (which `index` already describes) to keep the index."""
+    global _cached
+    index.size = len(cdf)
+    with _lock:
+        _cached = (_stamp(len(cdf)), index)
+
+
+def ensure_db_schema():
+    """Add and backfill customers.phone_key plus lookup indexes (once per process)."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    _db.db_execute("ALTER TABLE customers ADD COLUMN IF NOT EXISTS phone_key TEXT")
+    _db.db_execute(
+        f"UPDATE customers SET phone_key = {SQL_PHONE_KEY.format(c='phone')} "
+        "WHERE phone_key IS NULL AND phone IS NOT NULL"
+    )
+    _db.db_execute("CREATE INDEX IF NOT EXISTS customers_phone_key_idx ON customers (phone_key)")
+    _db.db_execute("CREATE INDEX IF NOT EXISTS customers_name_idx ON customers (name)")
+    _schema_ready = True
+
+
+def db_find(name, phone) -> Optional[int]:
+    """Id of the customer with this name or normalized phone (indexed lookup)."""
+    ensure_db_schema()
+    rows = _db.db_query(
+        "SELECT id FROM customers WHERE name = %s OR phone_key = %s LIMIT 1",
+        (name, phone_key(phone) or None),
+    )
+    return rows[0].get("id") if rows else None
+
+
+def invalidate():
+    global _cached
+    with _lock:
+        _cached = None
+
+
+__all__ = ["CustomerIndex", "get_customer_index", "saved", "ensure_db_schema", "db_find", "invalidate"]
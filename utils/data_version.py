@@ -0,0 +1,27 @@
+"""
+Process-wide data version counters.
+
+Writers call `bump(name)` after persisting a dataset ("products", "records",
+"customers", ...); readers use `get(name)` as part of cache keys so cached
+indexes and derived views are rebuilt only after a change.
+"""
+
+import threading
+from typing import Dict
+
+_lock = threading.Lock()
+_versions: Dict[str, int] = {}
+
+
+def get(name: str) -> int:
+    with _lock:
+        return _versions.get(name, 0)
+
+
+def bump(name: str) -> int:
+    with _lock:
+        _versions[name] = _versions.get(name, 0) + 1
+        return _versions[name]
+
+
+__all__ = ["get", "bump"]
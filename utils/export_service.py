@@ -0,0 +1,77 @@
+"""
+On-demand export payloads.
+
+Pages pass `lazy(key, version, build)` as the `data` of `st.download_button`;
+Streamlit only calls it when the button is clicked, so reruns never pay for
+Excel / CSV serialization. Built bytes are cached by (key, version), where
+version describes the source data (see `source_version`) and any filters, so
+repeat downloads of unchanged data are served from memory.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Callable, Hashable, Optional, Tuple, Union
+
+import pandas as pd
+
+from utils import data_version
+
+
+MAX_ENTRIES = 16
+
+_lock = threading.Lock()
+_cache: "OrderedDict[Tuple[str, Hashable], bytes]" = OrderedDict()
+
+
+def source_version(name: str, path: Optional[str] = None) -> Tuple[int, float]:
+    """(data version counter, file mtime) for a dataset; changes after every save."""
+    try:
+        mtime = os.path.getmtime(path) if path else 0.0
+    except OSError:
+        mtime = 0.0
+    return data_version.get(name), mtime
+
+
+def excel_bytes(df: pd.DataFrame, index: bool = False) -> bytes:
+    buf = BytesIO()
+    df.to_excel(buf, index=index)
+    return buf.getvalue()
+
+
+def csv_bytes(df: pd.DataFrame, index: bool = False) -> bytes:
+    return df.to_csv(index=index).encode("utf-8")
+
+
+def get(key: str, version: Hashable, build: Callable[[], Union[bytes, str]]) -> bytes:
+    """Bytes for (key, version), building them on a cache miss."""
+    ck = (key, version)
+    with _lock:
+        if ck in _cache:
+            _cache.move_to_end(ck)
+            return _cache[ck]
+    data = build()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    with _lock:
+        # Older versions of the same export are never requested again
+        for old in [k for k in _cache if k[0] == key]:
+            del _cache[old]
+        _cache[ck] = data
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return data
+
+
+def lazy(key: str, version: Hashable, build: Callable[[], Union[bytes, str]]) -> Callable[[], bytes]:
+    """Zero-argument callable for `st.download_button(data=...)`."""
+    return lambda: get(key, version, build)
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+
+__all__ = ["source_version", "excel_bytes", "csv_bytes", "get", "lazy", "clear"]
@@ -0,0 +1,120 @@
+"""
+Local cache of Firestore collections for incremental pulls.
+
+Each collection is kept in data/firebase_cache/<collection>.json together with
+its high-water mark: the largest `updated_at` seen so far. `updated_at` is a
+Firestore server timestamp (see firebase_utils.batch_write), so marks from
+different writers are comparable. Pulls ask Firestore for documents with
+`updated_at >= hwm - overlap` and merge them here; re-pulled documents that
+did not change are not counted, and documents marked `deleted: True`
+(tombstones) are removed from the cache.
+
+Marks saved before server timestamps were used (client-clock strings) are
+ignored, so the first pull after upgrading reads the whole collection once.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+CACHE_DIR = Path("data") / "firebase_cache"
+HWM_FORMAT = "server-timestamp"
+
+_lock = threading.Lock()
+_memory: Dict[str, Dict] = {}
+
+
+def _path(collection: str) -> Path:
+    return Path(CACHE_DIR) / f"{collection}.json"
+
+
+def _load(collection: str) -> Dict:
+    state = _memory.get(collection)
+    if state is not None:
+        return state
+    state = {"hwm": None, "hwm_format": HWM_FORMAT, "docs": {}}
+    p = _path(collection)
+    if p.exists():
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+            hwm = loaded.get("hwm") if loaded.get("hwm_format") == HWM_FORMAT else None
+            state = {"hwm": hwm, "hwm_format": HWM_FORMAT, "docs": loaded.get("docs") or {}}
+        except Exception as e:
+            print(f"⚠️ Firebase cache for {collection} unreadable, starting fresh: {e}")
+    _memory[collection] = state
+    return state
+
+
+def _save(collection: str, state: Dict):
+    p = _path(collection)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, default=str)
+    os.replace(tmp, p)
+
+
+def _stamp(value) -> Optional[str]:
+    """UTC ISO form of a server timestamp; None for anything else (legacy string stamps)."""
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def high_water_mark(collection: str) -> Optional[datetime]:
+    with _lock:
+        hwm = _load(collection)["hwm"]
+    return datetime.fromisoformat(hwm) if hwm else None
+
+
+def merge(collection: str, changes: Iterable[Tuple[str, Dict]]) -> Dict[str, int]:
+    """Apply pulled (doc_id, data) pairs; tombstones delete. Returns counts of actual changes."""
+    counts = {"upserted": 0, "deleted": 0}
+    with _lock:
+        state = _load(collection)
+        docs = state["docs"]
+        hwm = state["hwm"]
+        for doc_id, data in changes:
+            stamp = _stamp(data.get("updated_at"))
+            if stamp and (hwm is None or stamp > hwm):
+                hwm = stamp
+            if data.get("deleted"):
+                if docs.pop(doc_id, None) is not None:
+                    counts["deleted"] += 1
+                continue
+            # Same JSON form as on disk, so overlapping re-pulls compare equal
+            data = json.loads(json.dumps(data, ensure_ascii=False, default=str))
+            if docs.get(doc_id) != data:
+                docs[doc_id] = data
+                counts["upserted"] += 1
+        state["hwm"] = hwm
+        _save(collection, state)
+    return counts
+
+
+def documents(collection: str) -> List[Dict]:
+    """Cached live documents of a collection (tombstones excluded)."""
+    with _lock:
+        return [dict(d) for d in _load(collection)["docs"].values()]
+
+
+def reset(collection: Optional[str] = None):
+    """Drop the cache so the next pull reads the whole collection again."""
+    with _lock:
+        names = [collection] if collection else [p.stem for p in Path(CACHE_DIR).glob("*.json")] + list(_memory)
+        for name in set(names):
+            _memory.pop(name, None)
+            try:
+                _path(name).unlink()
+            except FileNotFoundError:
+                pass
+
+
+__all__ = ["CACHE_DIR", "high_water_mark", "merge", "documents", "reset"]
@@ -3,15 +3,17 @@ Firebase Integration Utilities
 التعامل مع Firebase Firestore و Storage للبيانات السحابية
 """
 
-import firebase_admin
-from firebase_admin import credentials, firestore, storage
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import os
-import base64
+import re
+import uuid
 from pathlib import Path
 import streamlit as st
 
+from utils import sync_manifest, sync_outbox, firebase_cache, storage_uploader
+from utils.phone import phone_key
+
 # تهيئة Firebase مرة واحدة فقط
 _firebase_initialized = False
 
@@ -23,6 +25,10 @@ def init_firebase():
         return True
 
     try:
+        # firebase_admin (grpc, google-cloud) is only imported once Firebase is actually used
+        import firebase_admin
+        from firebase_admin import credentials
+
         cred = None
         # 1) من Streamlit Secrets (مهم على Streamlit Cloud)
         _firebase_keys = (
@@ -55,13 +61,331 @@ def init_firebase():
             st.error(f"❌ خطأ في تهيئة Firebase: {str(e)}")
         return False
 
+_emulator_client = None
+
+
 def get_firestore_client():
-    """الحصول على Firestore client"""
+    """الحصول على Firestore client (يدعم Firestore Emulator عبر FIRESTORE_EMULATOR_HOST)"""
+    global _emulator_client
+    if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        # المحاكي لا يحتاج Service Account
+        if _emulator_client is None:
+            from google.cloud import firestore as _gc_firestore
+            project = os.environ.get("GCLOUD_PROJECT") or os.environ.get("GOOGLE_CLOUD_PROJECT") or "demo-newton"
+            _emulator_client = _gc_firestore.Client(project=project)
+        return _emulator_client
     if not _firebase_initialized:
         if not init_firebase():
             return None
+    from firebase_admin import firestore
     return firestore.client()
 
+
+def _bucket():
+    """Default Storage bucket (imports firebase_admin.storage on first use)."""
+    from firebase_admin import storage
+    return storage.bucket()
+
+# ==========================================
+# معرّفات ثابتة + كتابة مجمّعة (WriteBatch)
+# ==========================================
+# Firestore يسمح بـ 500 عملية كحد أقصى في كل commit
+BATCH_LIMIT = 500
+
+
+# السحب التزايدي يعيد قراءة هذه النافذة قبل المؤشر (دفعات تُكتب متأخرة أو بترتيب مختلف)؛ الدمج idempotent
+PULL_OVERLAP = timedelta(minutes=10)
+
+
+def _server_stamp():
+    """طابع updated_at من ساعة خادم Firestore (وليس ساعة الجهاز) حتى يكون مؤشر السحب متسقاً بين الأجهزة"""
+    from google.cloud.firestore import SERVER_TIMESTAMP
+    return SERVER_TIMESTAMP
+
+
+def _slug(text):
+    """تحويل النص إلى مفتاح ثابت صالح كمعرّف مستند (بدون / أو مسافات)"""
+    s = str(text or "").strip().lower().replace("\u200f", "")
+    s = re.sub(r"[^0-9a-z\u0600-\u06ff]+", "-", s)
+    return s.strip("-")
+
+
+# رقم الهاتف بصيغة محلية من 10 أرقام (05XXXXXXXX) — التطبيع الموحد في utils/phone.py
+normalize_phone_digits = phone_key
+
+
+def product_doc_id(device):
+    """معرّف المنتج = اسم الجهاز بعد التطبيع"""
+    return _slug(device)
+
+
+def customer_doc_id(phone, name=None):
+    """معرّف العميل = الهاتف بعد التطبيع، أو الاسم إذا لم يوجد هاتف"""
+    digits = normalize_phone_digits(phone)
+    if len(digits) >= 7:
+        return digits
+    return "name-" + _slug(name) if _slug(name) else ""
+
+
+def record_doc_id(doc_type, number):
+    """معرّف السجل = type-number (مثال: i-I20250001)"""
+    t = _slug(doc_type)
+    n = _slug(number)
+    return f"{t}-{n}" if t and n else ""
+
+
+def _clean_value(v):
+    """تحويل قيم pandas/numpy إلى أنواع يقبلها Firestore"""
+    if isinstance(v, dict):
+        return {str(k): _clean_value(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_clean_value(x) for x in v]
+    if v is None or isinstance(v, (str, bool)):
+        return v
+    try:
+        import math
+        if isinstance(v, float) and math.isnan(v):
+            return None
+    except Exception:
+        pass
+    if hasattr(v, "isoformat"):
+        try:
+            return v.isoformat()
+        except Exception:
+            return str(v)
+    if hasattr(v, "item"):
+        # numpy scalars
+        try:
+            v = v.item()
+        except Exception:
+            return str(v)
+        if isinstance(v, float) and v != v:
+            return None
+        return v
+    if isinstance(v, (int, float)):
+        return v
+    return str(v)
+
+
+def _clean_doc(data):
+    try:
+        import pandas as pd
+        data = {k: (None if (not isinstance(v, (list, dict)) and pd.isna(v)) else v) for k, v in data.items()}
+    except Exception:
+        pass
+    return {str(k): _clean_value(v) for k, v in data.items()}
+
+
+def batch_write(collection, upserts=None, deletes=None):
+    """
+    كتابة مجمّعة إلى Firestore باستخدام WriteBatch (حتى 500 عملية لكل commit)
+
+    Args:
+        collection: اسم المجموعة
+        upserts: dict {doc_id: data} — يتم الدمج (merge) فتكون إعادة الحفظ idempotent
+        deletes: قائمة معرّفات للحذف — تُكتب كـ tombstone {deleted: True} حتى يراها السحب التزايدي
+
+    Returns:
+        int: عدد عمليات commit المنفذة (ceil(N/500))، أو -1 إذا Firebase غير متاح
+    """
+    db = get_firestore_client()
+    if not db:
+        return -1
+    upserts = upserts or {}
+    deletes = list(deletes or [])
+    now = _server_stamp()
+    ops = [("set", doc_id, data) for doc_id, data in upserts.items() if doc_id]
+    ops += [("delete", doc_id, None) for doc_id in deletes if doc_id]
+    commits = 0
+    coll = db.collection(collection)
+    for start in range(0, len(ops), BATCH_LIMIT):
+        batch = db.batch()
+        for op, doc_id, data in ops[start:start + BATCH_LIMIT]:
+            ref = coll.document(doc_id)
+            if op == "set":
+                doc = _clean_doc(data)
+                doc["updated_at"] = now
+                doc["deleted"] = False
+                batch.set(ref, doc, merge=True)
+            else:
+                batch.set(ref, {"deleted": True, "updated_at": now}, merge=True)
+        batch.commit()
+        commits += 1
+    return commits
+
+
+def _rows(df):
+    for _, row in df.iterrows():
+        yield {k: v for k, v in row.to_dict().items()}
+
+
+def _image_ref(value):
+    """مفتاح المحتوى للصورة: مفتاح المخزن كما هو، أو sha256 للـ Base64 المضمّن"""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        from utils.image_store import is_image_ref, decode_base64_image, make_ref
+        if is_image_ref(value):
+            return value.strip()
+        data = decode_base64_image(value)
+        return make_ref(data) if data else None
+    except Exception:
+        return None
+
+
+def product_docs(df):
+    """{doc_id: data} للمنتجات؛ الصورة تُحفظ كمفتاح محتوى (image_ref) وليس Base64"""
+    docs = {}
+    for row in _rows(df):
+        doc_id = product_doc_id(row.get("Device"))
+        if not doc_id:
+            continue
+        image_val = row.pop("ImageBase64", None)
+        row["product_id"] = doc_id
+        row["image_ref"] = _image_ref(image_val)
+        docs[doc_id] = row
+    return docs
+
+
+def customer_docs(df):
+    docs = {}
+    for row in _rows(df):
+        doc_id = customer_doc_id(row.get("phone"), row.get("client_name") or row.get("name"))
+        if not doc_id:
+            continue
+        row["customer_id"] = doc_id
+        docs[doc_id] = row
+    return docs
+
+
+# حقول السجل كما في records.xlsx / جدول records — شكل واحد لكل مستندات مجموعة records
+RECORD_FIELDS = ["base_id", "date", "type", "number", "amount", "client_name", "phone", "location", "note"]
+# تفاصيل المستند (المنتجات، التركيب، الخصم، الدفعات، الرصيد...) بنفس المعرّف في مجموعة مستقلة،
+# فلا تكتب المزامنة الكاملة من records.xlsx شكلاً أقصر فوق ما حفظته الصفحة
+RECORD_DETAILS_COLLECTION = "record_details"
+
+
+def _record_text(v):
+    if v is None or (isinstance(v, float) and v != v):
+        return None
+    s = str(v).strip()
+    return None if s.lower() in ("", "nan", "none", "nat") else s
+
+
+def record_doc(data, default_type=""):
+    """(doc_id, مستند السجل) بحقول RECORD_FIELDS فقط وبقيم موحّدة — نفس الشكل من الحفظ المفرد والمزامنة الكاملة"""
+    record = {k: _record_text(data.get(k)) for k in RECORD_FIELDS}
+    record["type"] = record["type"] or default_type or None
+    date = data.get("date")
+    if hasattr(date, "strftime"):
+        try:
+            record["date"] = date.strftime("%Y-%m-%d")
+        except Exception:
+            pass
+    try:
+        amount = float(data.get("amount"))
+        record["amount"] = None if amount != amount else amount
+    except (TypeError, ValueError):
+        record["amount"] = None
+    doc_id = record_doc_id(record["type"], record["number"])
+    record["record_id"] = doc_id
+    return doc_id, record
+
+
+def record_docs(df):
+    docs = {}
+    for row in _rows(df):
+        doc_id, record = record_doc(row)
+        if doc_id:
+            docs[doc_id] = record
+    return docs
+
+
+def _outbox_writer(collection, upserts, deletes):
+    """كاتب طابور المزامنة: كتابة مجمّعة إلى Firestore"""
+    return batch_write(collection, upserts, deletes)
+
+
+def start_sync_worker():
+    """تشغيل عامل طابور المزامنة في الخلفية (مرة واحدة لكل عملية)"""
+    return sync_outbox.start_worker(_outbox_writer)
+
+
+def flush_sync_queue(timeout=60.0):
+    """تفريغ طابور المزامنة فوراً في نفس الخيط (للسكربتات والاختبارات)"""
+    return sync_outbox.flush(_outbox_writer, timeout=timeout)
+
+
+def sync_collection(collection, docs, full=True):
+    """
+    دفع التغييرات فقط: مقارنة المستندات مع سجل المزامنة المحلي (sync_manifest)
+    ثم وضع المضاف/المعدّل والمحذوف في طابور المزامنة (sync_outbox) — لا انتظار للشبكة.
+
+    Args:
+        collection: اسم المجموعة
+        docs: dict {doc_id: data}
+        full: True إذا كانت docs هي المجموعة كاملة (لاكتشاف المحذوف)
+
+    Returns:
+        dict {"upserts", "deletes", "changed_ids"}
+
+    لا يحتاج اتصالاً بـ Firebase: الطابور يُحفظ على القرص والعامل يعيد المحاولة (backoff) حتى يصبح متاحاً.
+    """
+    cleaned = {doc_id: _clean_doc(d) for doc_id, d in docs.items()}
+    changed, deleted, hashes = sync_manifest.diff(
+        collection, cleaned, full=full, pending=sync_outbox.pending_state(collection)
+    )
+    stats = {"upserts": len(changed), "deletes": len(deleted), "changed_ids": list(changed)}
+    if changed or deleted:
+        sync_outbox.enqueue_many(collection, changed, deleted, hashes)
+        start_sync_worker()
+    return stats
+
+
+def sync_products_to_firebase(df, upload_images=True):
+    """مزامنة المنتجات المتغيرة فقط (upsert بمعرّفات ثابتة)، ورفع صور المنتجات المتغيرة"""
+    try:
+        stats = sync_collection('products', product_docs(df))
+        if stats and upload_images and stats.get("changed_ids") and "ImageBase64" in df.columns:
+            # رفع صور المنتجات المتغيرة في الخلفية (مع تخطي الصور المطابقة بـ MD5)
+            changed = set(stats["changed_ids"])
+            storage_uploader.submit_uploads(_bucket, [
+                (doc_id, image_val) for doc_id, image_val in _product_images(df) if doc_id in changed
+            ])
+        return stats
+    except Exception as e:
+        print(f"⚠️ تحذير Firebase: {str(e)}")
+        return None
+
+
+def sync_customers_to_firebase(df):
+    """مزامنة العملاء المتغيرين فقط (المعرّف = الهاتف بعد التطبيع)"""
+    try:
+        return sync_collection('customers', customer_docs(df))
+    except Exception as e:
+        print(f"⚠️ تحذير Firebase: {str(e)}")
+        return None
+
+
+def sync_records_to_firebase(df):
+    """مزامنة سجلات المستندات (q/i/r) المتغيرة فقط (المعرّف = type-number)"""
+    try:
+        return sync_collection('records', record_docs(df))
+    except Exception as e:
+        print(f"⚠️ تحذير Firebase: {str(e)}")
+        return None
+
+
+def _save_single(collection, doc_id, data, id_field):
+    """وضع مستند واحد بمعرّف ثابت في طابور المزامنة؛ يتم التخطي إذا لم يتغير المحتوى"""
+    if not doc_id:
+        # نفس شكل المعرّفات التلقائية في Firestore (20 حرفاً) دون الحاجة لاتصال
+        doc_id = uuid.uuid4().hex[:20]
+    data[id_field] = doc_id
+    stats = sync_collection(collection, {doc_id: data}, full=False)
+    return bool(stats and stats["upserts"])
+
+
 def save_product_to_firebase(product_data):
     """
     حفظ منتج جديد إلى Firebase Firestore + Storage
@@ -73,10 +397,6 @@ def save_product_to_firebase(product_data):
         bool: نجاح أو فشل العملية
     """
     try:
-        db = get_firestore_client()
-        if not db:
-            return False
-        
         # التحضير للبيانات
         product_to_save = product_data.copy()
         product_to_save['created_at'] = datetime.now().isoformat()
@@ -85,15 +405,15 @@ def save_product_to_firebase(product_data):
         # إزالة الصورة من البيانات الأساسية (سيتم حفظها في Storage)
         image_base64 = product_to_save.pop('ImageBase64', None)
         
-        # حفظ في Firestore
-        doc_ref = db.collection('products').document()
-        product_to_save['product_id'] = doc_ref.id
-        doc_ref.set(product_to_save)
+        # حفظ في Firestore (معرّف ثابت = اسم الجهاز بعد التطبيع)
+        doc_id = product_doc_id(product_to_save.get('Device'))
+        product_to_save['image_ref'] = _image_ref(image_base64)
+        changed = _save_single('products', doc_id, product_to_save, 'product_id')
         
-        # حفظ الصورة في Storage إذا كانت موجودة
-        if image_base64:
+        # حفظ الصورة في Storage (في الخلفية) إذا كانت موجودة وتغيّر المنتج
+        if image_base64 and changed:
             try:
-                save_product_image_to_storage(doc_ref.id, image_base64)
+                storage_uploader.submit_uploads(_bucket, [(product_to_save['product_id'], image_base64)])
             except Exception as e:
                 print(f"⚠️ تحذير: فشل حفظ الصورة: {str(e)}")
         
@@ -108,28 +428,63 @@ def save_product_image_to_storage(product_id, image_base64):
     
     Args:
         product_id: معرّف المنتج
-        image_base64: الصورة في صيغة Base64
+        image_base64: الصورة في صيغة Base64 أو مفتاح مخزن الصور (sha256:...)
     """
     try:
-        # تحويل Base64 إلى bytes
-        if ',' in image_base64:
-            image_data = base64.b64decode(image_base64.split(',')[1])
-        else:
-            image_data = base64.b64decode(image_base64)
-        
-        # حفظ في Storage
-        bucket = storage.bucket()
-        blob = bucket.blob(f'products/{product_id}/image.png')
-        blob.upload_from_string(image_data, content_type='image/png')
+        # يتم التخطي إذا كانت الصورة في Storage مطابقة (md5_hash)
+        result = storage_uploader.upload_image(_bucket(), product_id, image_base64)
+        if result["status"] in ("failed", "no image"):
+            raise ValueError(result["error"] or "image not found")
         
         return True
     except Exception as e:
         print(f"❌ خطأ في حفظ الصورة في Storage: {str(e)}")
         return False
 
+
+def _product_images(df):
+    """أزواج (product_id, الصورة) للمنتجات التي لها صورة"""
+    if "ImageBase64" not in df.columns:
+        return []
+    pairs = []
+    for _, row in df.iterrows():
+        image_val = row.get("ImageBase64")
+        doc_id = product_doc_id(row.get("Device"))
+        if doc_id and isinstance(image_val, str) and image_val.strip():
+            pairs.append((doc_id, image_val))
+    return pairs
+
+
+def sync_all_product_images_to_storage(df, max_workers=storage_uploader.DEFAULT_WORKERS, force=False, progress=None):
+    """
+    رفع جميع صور المنتجات إلى Storage بالتوازي (تخطي غير المتغيرة بمقارنة MD5)
+
+    Returns:
+        dict تقرير (uploaded, skipped, failed, bytes, seconds, images_per_sec, mb_per_sec) أو None
+    """
+    try:
+        if not get_firestore_client():
+            return None
+        return storage_uploader.upload_images(
+            _bucket(), _product_images(df), max_workers=max_workers, force=force, progress=progress
+        )
+    except Exception as e:
+        print(f"❌ خطأ في مزامنة صور المنتجات: {str(e)}")
+        return None
+
+def _save_record_doc(data, default_type):
+    """السجل في records (نفس شكل sync_records_to_firebase) وباقي الحمولة كاملة في record_details بنفس المعرّف"""
+    doc_id, record = record_doc(data, default_type)
+    saved = _save_single('records', doc_id, record, 'record_id')
+    details = {k: v for k, v in data.items() if k not in RECORD_FIELDS}
+    if details:
+        _save_single(RECORD_DETAILS_COLLECTION, record['record_id'], details, 'record_id')
+    return saved
+
+
 def save_invoice_to_firebase(invoice_data):
     """
-    حفظ فاتورة جديدة إلى Firebase Firestore
+    حفظ فاتورة إلى Firebase Firestore (مجموعة records، المعرّف = type-number)
     
     Args:
         invoice_data: dict بيانات الفاتورة
@@ -138,20 +493,7 @@ def save_invoice_to_firebase(invoice_data):
         bool: نجاح أو فشل العملية
     """
     try:
-        db = get_firestore_client()
-        if not db:
-            return False
-        
-        # التحضير للبيانات
-        invoice_to_save = invoice_data.copy()
-        invoice_to_save['created_at'] = datetime.now().isoformat()
-        invoice_to_save['updated_at'] = datetime.now().isoformat()
-        
-        # حفظ في Firestore
-        doc_ref = db.collection('invoices').document()
-        invoice_to_save['invoice_id'] = doc_ref.id
-        doc_ref.set(invoice_to_save)
-        
+        _save_record_doc(invoice_data, 'i')
         return True
     except Exception as e:
         st.error(f"❌ خطأ في حفظ الفاتورة: {str(e)}")
@@ -168,19 +510,14 @@ def save_customer_to_firebase(customer_data):
         bool: نجاح أو فشل العملية
     """
     try:
-        db = get_firestore_client()
-        if not db:
-            return False
-        
         # التحضير للبيانات
         customer_to_save = customer_data.copy()
         customer_to_save['created_at'] = datetime.now().isoformat()
         customer_to_save['updated_at'] = datetime.now().isoformat()
         
-        # حفظ في Firestore
-        doc_ref = db.collection('customers').document()
-        customer_to_save['customer_id'] = doc_ref.id
-        doc_ref.set(customer_to_save)
+        # حفظ في Firestore (معرّف ثابت = الهاتف بعد التطبيع)
+        doc_id = customer_doc_id(customer_to_save.get('phone'), customer_to_save.get('client_name') or customer_to_save.get('name'))
+        _save_single('customers', doc_id, customer_to_save, 'customer_id')
         
         return True
     except Exception as e:
@@ -189,7 +526,7 @@ def save_customer_to_firebase(customer_data):
 
 def save_quotation_to_firebase(quotation_data):
     """
-    حفظ عرض سعر جديد إلى Firebase Firestore
+    حفظ عرض سعر إلى Firebase Firestore (مجموعة records، المعرّف = type-number)
     
     Args:
         quotation_data: dict بيانات العرض
@@ -198,112 +535,89 @@ def save_quotation_to_firebase(quotation_data):
         bool: نجاح أو فشل العملية
     """
     try:
-        db = get_firestore_client()
-        if not db:
-            return False
-        
-        # التحضير للبيانات
-        quotation_to_save = quotation_data.copy()
-        quotation_to_save['created_at'] = datetime.now().isoformat()
-        quotation_to_save['updated_at'] = datetime.now().isoformat()
-        
-        # حفظ في Firestore
-        doc_ref = db.collection('quotations').document()
-        quotation_to_save['quotation_id'] = doc_ref.id
-        doc_ref.set(quotation_to_save)
-        
+        _save_record_doc(quotation_data, 'q')
         return True
     except Exception as e:
         st.error(f"❌ خطأ في حفظ العرض: {str(e)}")
         return False
 
+def pull_collection(collection):
+    """
+    سحب تزايدي: جلب المستندات التي updated_at لها >= (آخر مؤشر - PULL_OVERLAP) فقط ودمجها في الكاش المحلي
+    (data/firebase_cache). updated_at طابع خادم، والمستندات المحذوفة (tombstones) تُزال من الكاش.
+
+    Returns:
+        dict {"upserted", "deleted"} أو None إذا Firebase غير متاح
+    """
+    db = get_firestore_client()
+    if not db:
+        return None
+    query = db.collection(collection)
+    hwm = firebase_cache.high_water_mark(collection)
+    if hwm:
+        # نافذة تداخل قبل المؤشر: الدفعات التي تُثبَّت متأخرة تبقى ضمن السحب؛ المكرر لا يُحتسب تغييراً
+        since = hwm - PULL_OVERLAP
+        try:
+            from google.cloud.firestore_v1.base_query import FieldFilter
+            query = query.where(filter=FieldFilter("updated_at", ">=", since))
+        except Exception:
+            query = query.where("updated_at", ">=", since)
+        query = query.order_by("updated_at")
+    return firebase_cache.merge(collection, ((doc.id, doc.to_dict() or {}) for doc in query.stream()))
+
+
+def _get_all(collection, label):
+    try:
+        pull_collection(collection)
+    except Exception as e:
+        print(f"❌ خطأ في جلب {label}: {str(e)}")
+    return firebase_cache.documents(collection)
+
+
 def get_all_products_from_firebase():
     """
-    جلب جميع المنتجات من Firebase
+    جلب جميع المنتجات من Firebase (سحب تزايدي + كاش محلي)
     
     Returns:
         list: قائمة المنتجات
     """
-    try:
-        db = get_firestore_client()
-        if not db:
-            return []
-        
-        docs = db.collection('products').stream()
-        products = []
-        for doc in docs:
-            products.append(doc.to_dict())
-        
-        return products
-    except Exception as e:
-        print(f"❌ خطأ في جلب المنتجات: {str(e)}")
-        return []
+    return _get_all('products', 'المنتجات')
 
 def get_all_customers_from_firebase():
     """
-    جلب جميع العملاء من Firebase
+    جلب جميع العملاء من Firebase (سحب تزايدي + كاش محلي)
     
     Returns:
         list: قائمة العملاء
     """
-    try:
-        db = get_firestore_client()
-        if not db:
-            return []
-        
-        docs = db.collection('customers').stream()
-        customers = []
-        for doc in docs:
-            customers.append(doc.to_dict())
-        
-        return customers
-    except Exception as e:
-        print(f"❌ خطأ في جلب العملاء: {str(e)}")
-        return []
+    return _get_all('customers', 'العملاء')
 
 def get_all_invoices_from_firebase():
     """
-    جلب جميع الفواتير من Firebase
+    جلب جميع الفواتير من Firebase (سجلات النوع i في مجموعة records — سحب تزايدي + كاش محلي)
     
     Returns:
         list: قائمة الفواتير
     """
-    try:
-        db = get_firestore_client()
-        if not db:
-            return []
-        
-        docs = db.collection('invoices').stream()
-        invoices = []
-        for doc in docs:
-            invoices.append(doc.to_dict())
-        
-        return invoices
-    except Exception as e:
-        print(f"❌ خطأ في جلب الفواتير: {str(e)}")
-        return []
+    invoices = [d for d in _get_all('records', 'السجلات') if str(d.get('type') or '').strip().lower() == 'i']
+    details = {d.get('record_id'): d for d in _get_all(RECORD_DETAILS_COLLECTION, 'تفاصيل السجلات')}
+    return [{**details.get(d.get('record_id'), {}), **d} for d in invoices]
 
 def delete_product_from_firebase(product_id):
-    """حذف منتج من Firebase"""
+    """حذف منتج من Firebase (tombstone عبر طابور المزامنة)"""
     try:
-        db = get_firestore_client()
-        if not db:
-            return False
-        
-        db.collection('products').document(product_id).delete()
+        sync_outbox.enqueue('products', product_id, op='delete')
+        start_sync_worker()
         return True
     except Exception as e:
         st.error(f"❌ خطأ في حذف المنتج: {str(e)}")
         return False
 
 def delete_customer_from_firebase(customer_id):
-    """حذف عميل من Firebase"""
+    """حذف عميل من Firebase (tombstone عبر طابور المزامنة)"""
     try:
-        db = get_firestore_client()
-        if not db:
-            return False
-        
-        db.collection('customers').document(customer_id).delete()
+        sync_outbox.enqueue('customers', customer_id, op='delete')
+        start_sync_worker()
         return True
     except Exception as e:
         st.error(f"❌ خطأ في حذف العميل: {str(e)}")
@@ -311,7 +625,7 @@ def delete_customer_from_firebase(customer_id):
 
 def sync_excel_to_firebase():
     """
-    مزامنة بيانات Excel الموجودة إلى Firebase (استخدم مرة واحدة فقط)
+    مزامنة بيانات Excel الموجودة إلى Firebase (كتابة مجمّعة بمعرّفات ثابتة — آمنة للتكرار)
     """
     try:
         import pandas as pd
@@ -319,21 +633,19 @@ def sync_excel_to_firebase():
         # مزامنة المنتجات
         products_file = Path(__file__).parent.parent / "data" / "products.xlsx"
         if products_file.exists():
-            df_products = pd.read_excel(products_file)
-            for idx, row in df_products.iterrows():
-                product_dict = row.to_dict()
-                # تحويل NaN إلى None
-                product_dict = {k: (None if pd.isna(v) else v) for k, v in product_dict.items()}
-                save_product_to_firebase(product_dict)
+            sync_products_to_firebase(pd.read_excel(products_file))
         
         # مزامنة العملاء
         customers_file = Path(__file__).parent.parent / "data" / "customers.xlsx"
         if customers_file.exists():
-            df_customers = pd.read_excel(customers_file)
-            for idx, row in df_customers.iterrows():
-                customer_dict = row.to_dict()
-                customer_dict = {k: (None if pd.isna(v) else v) for k, v in customer_dict.items()}
-                save_customer_to_firebase(customer_dict)
+            sync_customers_to_firebase(pd.read_excel(customers_file))
+        
+        # مزامنة السجلات
+        records_file = Path(__file__).parent.parent / "data" / "records.xlsx"
+        if records_file.exists():
+            records_df = pd.read_excel(records_file)
+            records_df.columns = [str(c).strip().lower() for c in records_df.columns]
+            sync_records_to_firebase(records_df)
         
         return True
     except Exception as e:
@@ -0,0 +1,260 @@
+"""
+Perceptual-hash duplicate detection for product images.
+
+Builds dHash/pHash fingerprints (64-bit) for catalog images (store keys or
+inline base64) and the data/product_images folder, groups near-duplicates
+by Hamming distance and can collapse catalog rows onto one stored image.
+"""
+
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+
+from utils import image_store
+from utils.image_ingest import IMAGES_DIR, IMAGE_EXTENSIONS, parse_image_filename
+
+
+DEFAULT_MAX_DISTANCE = 6
+_DCT_CACHE: Dict[int, np.ndarray] = {}
+
+
+def _gray(data: bytes, size: Tuple[int, int]) -> np.ndarray:
+    if Image is None:
+        raise RuntimeError("Pillow is not installed; image hashing unavailable.")
+    img = Image.open(BytesIO(data))
+    if img.mode in ("RGBA", "LA", "P"):
+        # Same white flattening as the thumbnails so transparent PNGs compare fairly
+        img = img.convert("RGBA")
+        base = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        base.paste(img, mask=img.split()[-1])
+        img = base
+    img = img.convert("L").resize(size, Image.Resampling.LANCZOS)
+    return np.asarray(img, dtype=np.float64)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    value = 0
+    for b in bits.flatten():
+        value = (value << 1) | int(bool(b))
+    return value
+
+
+def dhash(data: bytes, hash_size: int = 8) -> int:
+    """Difference hash: compares neighbouring pixels of a (n+1)xn grayscale image."""
+    px = _gray(data, (hash_size + 1, hash_size))
+    return _bits_to_int(px[:, 1:] > px[:, :-1])
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    m = _DCT_CACHE.get(n)
+    if m is None:
+        k = np.arange(n)
+        m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+        m[0, :] *= 1 / np.sqrt(2)
+        m *= np.sqrt(2.0 / n)
+        _DCT_CACHE[n] = m
+    return m
+
+
+def phash(data: bytes, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """Perceptual hash: low-frequency DCT coefficients compared with their median."""
+    n = hash_size * highfreq_factor
+    px = _gray(data, (n, n))
+    d = _dct_matrix(n)
+    coeffs = (d @ px @ d.T)[:hash_size, :hash_size]
+    return _bits_to_int(coeffs > np.median(coeffs))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def fingerprint(data: bytes) -> Tuple[int, int]:
+    return dhash(data), phash(data)
+
+
+def _is_near(a: Tuple[int, int], b: Tuple[int, int], max_distance: int) -> bool:
+    # Both hashes must agree: dHash is sensitive to gradients, pHash to structure
+    return hamming(a[0], b[0]) <= max_distance and hamming(a[1], b[1]) <= max_distance
+
+
+def build_index(products_df: Optional[pd.DataFrame] = None, folder: Optional[Path] = IMAGES_DIR) -> pd.DataFrame:
+    """Fingerprint catalog images and folder files.
+
+    Returns a frame with columns: source ("catalog"/"folder"), row, Device, File,
+    Key (store key or None), Bytes, dhash, phash.
+    """
+    entries = []
+    seen: Dict[str, Tuple[int, int]] = {}  # sha256 -> fingerprint, avoids rehashing identical bytes
+    if products_df is not None and "ImageBase64" in products_df.columns:
+        for idx, row in products_df.iterrows():
+            value = row.get("ImageBase64")
+            if not isinstance(value, str) or not value.strip():
+                continue
+            data = image_store.image_bytes(value)
+            if not data:
+                continue
+            entries.append(("catalog", idx, row.get("Device"), "", value if image_store.is_image_ref(value) else None, data))
+    if folder is not None and Path(folder).exists():
+        for p in sorted(Path(folder).iterdir()):
+            if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS:
+                entries.append(("folder", None, None, p.name, None, p.read_bytes()))
+
+    rows = []
+    for source, idx, device, fname, key, data in entries:
+        digest = image_store.make_ref(data)
+        fp = seen.get(digest)
+        if fp is None:
+            try:
+                fp = fingerprint(data)
+            except Exception as e:
+                print(f"Skipping unreadable image {fname or device}: {e}")
+                continue
+            seen[digest] = fp
+        rows.append({
+            "source": source, "row": idx, "Device": device, "File": fname,
+            "Key": key, "Sha256": digest, "Bytes": len(data),
+            "dhash": fp[0], "phash": fp[1],
+        })
+    return pd.DataFrame(rows, columns=["source", "row", "Device", "File", "Key", "Sha256", "Bytes", "dhash", "phash"])
+
+
+def find_duplicate_groups(index: pd.DataFrame, max_distance: int = DEFAULT_MAX_DISTANCE) -> List[List[int]]:
+    """Group index positions whose fingerprints are within `max_distance` bits (union-find)."""
+    n = len(index)
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    fps = list(zip(index["dhash"].tolist(), index["phash"].tolist()))
+    # Bucket by each 16-bit quarter of the dHash (pigeonhole: any pair within
+    # <= 3 differing bits shares a quarter); fall back to all pairs for wider radii.
+    if max_distance <= 3:
+        buckets: Dict[Tuple[int, int], List[int]] = {}
+        for i, (d, _) in enumerate(fps):
+            for q in range(4):
+                buckets.setdefault((q, (d >> (16 * q)) & 0xFFFF), []).append(i)
+        candidates = set()
+        for members in buckets.values():
+            for a in range(len(members)):
+                for b in range(a + 1, len(members)):
+                    candidates.add((members[a], members[b]))
+    else:
+        candidates = ((a, b) for a in range(n) for b in range(a + 1, n))
+    for a, b in candidates:
+        if _is_near(fps[a], fps[b], max_distance):
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[rb] = ra
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def describe_groups(index: pd.DataFrame, groups: List[List[int]]) -> pd.DataFrame:
+    """Flatten duplicate groups into a report frame (one row per member)."""
+    rows = []
+    for gid, members in enumerate(groups, start=1):
+        for pos in members:
+            item = index.iloc[pos]
+            rows.append({
+                "Group": gid,
+                "Source": item["source"],
+                "Device": item["Device"] if pd.notna(item["Device"]) else "",
+                "File": item["File"],
+                "Bytes": int(item["Bytes"]),
+            })
+    return pd.DataFrame(rows, columns=["Group", "Source", "Device", "File", "Bytes"])
+
+
+def collapse_catalog_duplicates(
+    products_df: pd.DataFrame,
+    index: pd.DataFrame,
+    groups: List[List[int]],
+) -> Tuple[pd.DataFrame, int]:
+    """Point every catalog row in a duplicate group at one stored image.
+
+    The largest catalog image in each group (usually the best quality source)
+    is kept in the image store; returns (updated_df, rows_changed). Nothing is
+    saved.
+    """
+    out = products_df.copy()
+    changed = 0
+    for members in groups:
+        group = index.iloc[members]
+        catalog_rows = group[group["source"] == "catalog"]
+        if len(catalog_rows) < 2:
+            continue
+        keeper = catalog_rows.sort_values("Bytes", ascending=False).iloc[0]
+        data = image_store.image_bytes(out.at[keeper["row"], "ImageBase64"])
+        if not data:
+            continue
+        ref = image_store.put_image(data)
+        for _, item in catalog_rows.iterrows():
+            if out.at[item["row"], "ImageBase64"] != ref:
+                out.at[item["row"], "ImageBase64"] = ref
+                changed += 1
+    return out, changed
+
+
+def quarantine_folder_duplicates(
+    index: pd.DataFrame,
+    groups: List[List[int]],
+    folder: Path = IMAGES_DIR,
+    dry_run: bool = True,
+) -> List[str]:
+    """Move all but the newest file of each folder duplicate group to `<folder>/_duplicates`.
+
+    Returns the file names that were (or, with dry_run, would be) moved.
+    """
+    folder = Path(folder)
+    moved = []
+    for members in groups:
+        group = index.iloc[members]
+        files = [f for f in group.loc[group["source"] == "folder", "File"].tolist() if f]
+        # Only variants of the same base name are redundant; identical pictures
+        # saved under different device names still carry naming information.
+        by_base: Dict[str, List[str]] = {}
+        for fname in files:
+            by_base.setdefault(parse_image_filename(folder / fname)[0].lower(), []).append(fname)
+        for variants in by_base.values():
+            if len(variants) < 2:
+                continue
+            newest = max(variants, key=lambda f: parse_image_filename(folder / f)[1])
+            for fname in variants:
+                if fname == newest:
+                    continue
+                moved.append(fname)
+                if not dry_run:
+                    target = folder / "_duplicates"
+                    target.mkdir(parents=True, exist_ok=True)
+                    (folder / fname).replace(target / fname)
+    return moved
+
+
+__all__ = [
+    "DEFAULT_MAX_DISTANCE",
+    "dhash",
+    "phash",
+    "hamming",
+    "fingerprint",
+    "build_index",
+    "find_duplicate_groups",
+    "describe_groups",
+    "collapse_catalog_duplicates",
+    "quarantine_folder_duplicates",
+]
@@ -0,0 +1,219 @@
+"""
+Bulk product image ingest from data/product_images.
+
+Photos are named after devices with optional timestamp suffixes
+(e.g. ``Poe Switch_20251120_201546.png``). Filenames are grouped by base
+name, the newest variant of each group is kept, matched fuzzily to catalog
+``Device`` names, stored/thumbnailed in a process pool and attached to the
+products frame so the caller can persist everything with one save_products.
+"""
+
+import os
+import re
+import difflib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from utils import image_store
+
+
+IMAGES_DIR = Path("data") / "product_images"
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+DEFAULT_CUTOFF = 0.85
+
+_TIMESTAMP_RE = re.compile(r"_(\d{8})_(\d{6})$")
+_COPY_RE = re.compile(r"\s*\(\d+\)$")
+_LEADING_INDEX_RE = re.compile(r"^\d+\s*-\s*(?=[A-Za-z])")
+
+
+def parse_image_filename(path: Path) -> Tuple[str, str]:
+    """Return (base_name, sort_key) for a photo filename.
+
+    The sort key is the ``YYYYMMDDHHMMSS`` suffix when present, otherwise the
+    file mtime, so the newest variant sorts last.
+    """
+    stem = path.stem
+    m = _TIMESTAMP_RE.search(stem)
+    if m:
+        stem = stem[: m.start()]
+        key = m.group(1) + m.group(2)
+    else:
+        try:
+            key = "%014d" % int(path.stat().st_mtime)
+        except Exception:
+            key = "0"
+    stem = _COPY_RE.sub("", stem).strip()
+    return stem, key
+
+
+def _normalize(text) -> str:
+    s = str(text or "").lower().replace("\u200f", "")
+    s = s.replace("-", "")
+    s = re.sub(r"[^0-9a-z]+", " ", s)
+    return " ".join(s.split())
+
+
+def _variants(name: str) -> List[str]:
+    """Normalized name plus the form without a leading list index ("2-Smart Ac")."""
+    out = [_normalize(name)]
+    stripped = _LEADING_INDEX_RE.sub("", str(name))
+    if stripped != name:
+        out.append(_normalize(stripped))
+    return [v for v in out if v]
+
+
+def match_score(device: str, base_name: str) -> float:
+    """Similarity in [0, 1] between a Device name and a photo base name."""
+    best = 0.0
+    dev = _normalize(device)
+    if not dev:
+        return 0.0
+    dev_tokens = set(dev.split())
+    for cand in _variants(base_name):
+        if cand == dev:
+            return 1.0
+        ratio = difflib.SequenceMatcher(None, dev, cand).ratio()
+        recall = len(dev_tokens & set(cand.split())) / float(len(dev_tokens))
+        if recall == 1.0:
+            # All device words present in the filename ("Ceiling Speakers" vs "Dsppa Ceiling Speakers")
+            score = max(ratio, 0.9)
+        else:
+            # A missing word usually means a different model ("Outdoor" vs "Indoor")
+            score = min(ratio, recall)
+        best = max(best, score)
+    return best
+
+
+def newest_variants(folder: Path = IMAGES_DIR) -> Dict[str, Path]:
+    """Map each photo base name to its newest file."""
+    groups: Dict[str, Tuple[str, Path]] = {}
+    folder = Path(folder)
+    if not folder.exists():
+        return {}
+    for p in folder.iterdir():
+        if not p.is_file() or p.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        base, key = parse_image_filename(p)
+        cur = groups.get(base.lower())
+        if cur is None or key > cur[0]:
+            groups[base.lower()] = (key, p)
+    return {k: v[1] for k, v in groups.items()}
+
+
+def plan_ingest(
+    products_df: pd.DataFrame,
+    folder: Path = IMAGES_DIR,
+    cutoff: float = DEFAULT_CUTOFF,
+    overwrite: bool = False,
+) -> pd.DataFrame:
+    """Match every product to its best photo without touching any data.
+
+    Returns a frame with columns: row, Device, File, Score, Action where Action is
+    "attach", "skip (has image)" or "no match".
+    """
+    files = newest_variants(folder)
+    bases = [(parse_image_filename(p)[0], p) for p in files.values()]
+    rows = []
+    for idx, prod in products_df.iterrows():
+        device = prod.get("Device")
+        if device is None or not str(device).strip() or str(device) == "nan":
+            continue
+        best_score, best_path = 0.0, None
+        for base, path in bases:
+            score = match_score(device, base)
+            if score > best_score:
+                best_score, best_path = score, path
+        has_image = isinstance(prod.get("ImageBase64"), str) and bool(str(prod.get("ImageBase64")).strip())
+        if best_path is None or best_score < cutoff:
+            action = "no match"
+        elif has_image and not overwrite:
+            action = "skip (has image)"
+        else:
+            action = "attach"
+        rows.append({
+            "row": idx,
+            "Device": device,
+            "File": best_path.name if best_path is not None and best_score >= cutoff else "",
+            "Path": str(best_path) if best_path is not None else "",
+            "Score": round(best_score, 3),
+            "Action": action,
+        })
+    return pd.DataFrame(rows, columns=["row", "Device", "File", "Path", "Score", "Action"])
+
+
+def _store_file(path: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """Process-pool worker: store the original and build its thumbnails."""
+    try:
+        data = Path(path).read_bytes()
+        return path, image_store.put_image(data), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def ingest_images(
+    products_df: pd.DataFrame,
+    folder: Path = IMAGES_DIR,
+    cutoff: float = DEFAULT_CUTOFF,
+    overwrite: bool = False,
+    max_workers: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Attach matched photos to `products_df` (copy) as image store keys.
+
+    Returns (updated_df, plan) where plan has a "Result" column. Nothing is
+    saved; callers persist the updated frame with a single save_products().
+    """
+    plan = plan_ingest(products_df, folder, cutoff, overwrite)
+    out = products_df.copy()
+    plan["Result"] = ""
+    todo = plan[plan["Action"] == "attach"]
+    paths = sorted(set(todo["Path"]))
+    refs: Dict[str, Optional[str]] = {}
+    errors: Dict[str, str] = {}
+
+    if paths:
+        workers = max_workers or min(len(paths), os.cpu_count() or 2)
+        done = 0
+        if workers <= 1:
+            results = (_store_file(p) for p in paths)
+            for path, ref, err in results:
+                refs[path] = ref
+                if err:
+                    errors[path] = err
+                done += 1
+                if progress:
+                    progress(done, len(paths))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_store_file, p) for p in paths]
+                for fut in as_completed(futures):
+                    path, ref, err = fut.result()
+                    refs[path] = ref
+                    if err:
+                        errors[path] = err
+                    done += 1
+                    if progress:
+                        progress(done, len(paths))
+
+    for i, item in todo.iterrows():
+        ref = refs.get(item["Path"])
+        if ref:
+            out.at[item["row"], "ImageBase64"] = ref
+            plan.at[i, "Result"] = "attached"
+        else:
+            plan.at[i, "Result"] = f"failed: {errors.get(item['Path'], 'unknown error')}"
+    return out, plan
+
+
+__all__ = [
+    "IMAGES_DIR",
+    "DEFAULT_CUTOFF",
+    "parse_image_filename",
+    "match_score",
+    "newest_variants",
+    "plan_ingest",
+    "ingest_images",
+]
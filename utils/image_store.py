@@ -0,0 +1,291 @@
+"""
+Content-addressed product image store.
+
+Original image bytes are stored once per SHA-256 digest under
+data/image_store/objects/ and thumbnails are pre-generated for each display
+size (catalog grid, document line, Word card) under data/image_store/thumbs/.
+
+Catalog rows reference images with a short key ``sha256:<hex>`` kept in the
+existing ``ImageBase64`` column, so product reads carry ~71 characters per
+row instead of ~30 KB of inline base64, and identical images are stored once.
+Legacy inline base64 values keep working everywhere a key is accepted.
+"""
+
+import os
+import re
+import base64
+import hashlib
+import tempfile
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+
+from utils.settings import load_settings
+
+
+STORE_DIR = Path("data") / "image_store"
+OBJECTS_DIR = STORE_DIR / "objects"
+THUMBS_DIR = STORE_DIR / "thumbs"
+
+REF_PREFIX = "sha256:"
+_REF_RE = re.compile(r"^sha256:[0-9a-f]{64}$")
+
+# Named thumbnail sizes. Document sizes are derived from the cm settings used
+# by the quotation/Word layouts (line ~200 dpi for HTML/PDF, card ~300 dpi for docx).
+THUMB_SIZES = ("grid", "line", "card")
+THUMB_QUALITY = 85
+
+
+def _cm_to_px(cm: float, dpi: int) -> int:
+    return max(1, int(round(float(cm) / 2.54 * dpi)))
+
+
+def thumbnail_dimensions(size: str, settings: Optional[Dict[str, Any]] = None) -> Tuple[int, int]:
+    """Return (width, height) in pixels for a named thumbnail size."""
+    s = settings or load_settings()
+    if size == "grid":
+        return int(s.get("ui_product_image_width_px", 350)), int(s.get("ui_product_image_height_px", 195))
+    w_cm = float(s.get("quote_product_image_width_cm", 3.49))
+    h_cm = float(s.get("quote_product_image_height_cm", 1.5))
+    dpi = 300 if size == "card" else 200
+    return _cm_to_px(w_cm, dpi), _cm_to_px(h_cm, dpi)
+
+
+# ==========================================
+# KEYS
+# ==========================================
+def is_image_ref(value: Any) -> bool:
+    """True when `value` is a store key (``sha256:<64 hex>``)."""
+    if not isinstance(value, str):
+        return False
+    return bool(_REF_RE.match(value.strip()))
+
+
+def make_ref(data: bytes) -> str:
+    return REF_PREFIX + hashlib.sha256(data).hexdigest()
+
+
+def _digest(ref: str) -> str:
+    return ref.strip()[len(REF_PREFIX):]
+
+
+def _object_path(digest: str) -> Path:
+    return OBJECTS_DIR / digest[:2] / digest
+
+
+def _thumb_path(digest: str, size: str) -> Path:
+    return THUMBS_DIR / size / digest[:2] / f"{digest}.jpg"
+
+
+def _atomic_write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.unlink(tmp)
+        except Exception:
+            pass
+        raise
+
+
+def decode_base64_image(value: Any) -> Optional[bytes]:
+    """Decode a raw base64 string or ``data:`` URI into bytes (None if invalid)."""
+    if value is None:
+        return None
+    s = str(value).strip()
+    if not s or s.lower() in ("nan", "none"):
+        return None
+    if s.lower().startswith("data:"):
+        if "," not in s:
+            return None
+        s = s.split(",", 1)[1]
+    try:
+        return base64.b64decode("".join(s.split()), validate=False)
+    except Exception:
+        return None
+
+
+def guess_mime(data: bytes) -> str:
+    """Cheap magic-byte sniffing for the formats the app produces."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "application/octet-stream"
+
+
+# ==========================================
+# THUMBNAILS
+# ==========================================
+def render_thumbnail(data: bytes, width: int, height: int) -> bytes:
+    """Fit `data` inside width x height on a white canvas (no upscaling) and encode as JPEG."""
+    if Image is None:
+        raise RuntimeError("Pillow is not installed; thumbnails unavailable.")
+    img = Image.open(BytesIO(data))
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        base = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        base.paste(img, mask=img.split()[-1])
+        img = base.convert("RGB")
+    else:
+        img = img.convert("RGB")
+    img.thumbnail((width, height), Image.Resampling.LANCZOS)
+    canvas = Image.new("RGB", (width, height), (255, 255, 255))
+    canvas.paste(img, ((width - img.width) // 2, (height - img.height) // 2))
+    out = BytesIO()
+    canvas.save(out, format="JPEG", quality=THUMB_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def _build_thumbnail(digest: str, size: str, settings: Optional[Dict[str, Any]] = None) -> Optional[bytes]:
+    original = _object_path(digest)
+    if not original.exists():
+        return None
+    w, h = thumbnail_dimensions(size, settings)
+    data = render_thumbnail(original.read_bytes(), w, h)
+    _atomic_write(_thumb_path(digest, size), data)
+    return data
+
+
+# ==========================================
+# PUBLIC API
+# ==========================================
+def put_image(data: bytes, generate_thumbnails: bool = True) -> str:
+    """Store original bytes (once per digest) and return the ``sha256:`` key."""
+    if not data:
+        raise ValueError("Empty image data")
+    ref = make_ref(data)
+    digest = _digest(ref)
+    path = _object_path(digest)
+    if not path.exists():
+        _atomic_write(path, data)
+    if generate_thumbnails:
+        settings = load_settings()
+        for size in THUMB_SIZES:
+            if not _thumb_path(digest, size).exists():
+                try:
+                    _build_thumbnail(digest, size, settings)
+                except Exception as e:
+                    print(f"Thumbnail '{size}' failed for {digest[:12]}: {e}")
+    return ref
+
+
+def put_upload(uploaded_file) -> Optional[str]:
+    """Store a Streamlit UploadedFile (or any file-like) and return its key."""
+    if uploaded_file is None:
+        return None
+    try:
+        data = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
+    finally:
+        try:
+            uploaded_file.seek(0)
+        except Exception:
+            pass
+    return put_image(data) if data else None
+
+
+def put_base64(value: Any) -> Optional[str]:
+    """Move a legacy inline base64 value into the store; keys pass through unchanged."""
+    if is_image_ref(value):
+        return str(value).strip()
+    data = decode_base64_image(value)
+    return put_image(data) if data else None
+
+
+def has_image(ref: str) -> bool:
+    return is_image_ref(ref) and _object_path(_digest(ref)).exists()
+
+
+def get_original(ref: str) -> Optional[bytes]:
+    if not is_image_ref(ref):
+        return None
+    path = _object_path(_digest(ref))
+    return path.read_bytes() if path.exists() else None
+
+
+def get_thumbnail(ref: str, size: str = "grid") -> Optional[bytes]:
+    """Return thumbnail bytes for a key, generating them on first use."""
+    if not is_image_ref(ref) or size not in THUMB_SIZES:
+        return None
+    digest = _digest(ref)
+    path = _thumb_path(digest, size)
+    if path.exists():
+        return path.read_bytes()
+    try:
+        return _build_thumbnail(digest, size)
+    except Exception as e:
+        print(f"Thumbnail '{size}' failed for {digest[:12]}: {e}")
+        return None
+
+
+def thumbnail_data_url(ref: str, size: str = "line") -> Optional[str]:
+    data = get_thumbnail(ref, size)
+    if not data:
+        return None
+    return f"data:{guess_mime(data)};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def image_bytes(value: Any, size: Optional[str] = None) -> Optional[bytes]:
+    """Bytes for a key (thumbnail when `size` is given, else original) or a legacy base64 value."""
+    if is_image_ref(value):
+        return get_thumbnail(value, size) if size else get_original(value)
+    return decode_base64_image(value)
+
+
+def migrate_products(df):
+    """Replace inline base64 in a products frame with store keys.
+
+    Returns (new_df, migrated_count). Rows whose value cannot be decoded are
+    left untouched.
+    """
+    out = df.copy()
+    if "ImageBase64" not in out.columns:
+        return out, 0
+    migrated = 0
+    for idx, value in out["ImageBase64"].items():
+        if value is None or is_image_ref(value):
+            continue
+        try:
+            ref = put_base64(value)
+        except Exception as e:
+            print(f"Image migration failed for row {idx}: {e}")
+            ref = None
+        if ref:
+            out.at[idx, "ImageBase64"] = ref
+            migrated += 1
+    return out, migrated
+
+
+__all__ = [
+    "THUMB_SIZES",
+    "thumbnail_dimensions",
+    "is_image_ref",
+    "make_ref",
+    "decode_base64_image",
+    "guess_mime",
+    "render_thumbnail",
+    "put_image",
+    "put_upload",
+    "put_base64",
+    "has_image",
+    "get_original",
+    "get_thumbnail",
+    "thumbnail_data_url",
+    "image_bytes",
+    "migrate_products",
+]
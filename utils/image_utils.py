@@ -5,14 +5,18 @@ are returned as data URIs (data:image/...;base64,...) or `None`.
 
 Important: per requirements we do NOT load filesystem paths or URLs.
 If a value looks like an http(s) URL or a file path it will be ignored
-and `None` will be returned.
+and `None` will be returned. The only on-disk source is the managed
+content-addressed store (`utils.image_store`), addressed by `sha256:` keys.
 """
-from typing import Optional, Any
+from io import BytesIO
+from typing import Optional, Any, List, Tuple
 
 
-def ensure_data_url(value: Any) -> Optional[str]:
+def ensure_data_url(value: Any, size: str = "line") -> Optional[str]:
     """Normalize an image value to a data URI or return None.
 
+    - If `value` is an image store key (`sha256:<hex>`) the thumbnail for
+      `size` ("grid", "line" or "card") is returned as a data URI.
     - If `value` already starts with `data:` it is returned as-is.
     - If `value` is an http(s) or file URL it is rejected (return None).
     - Otherwise the string is treated as raw Base64 and prefixed with
@@ -27,6 +31,9 @@ def ensure_data_url(value: Any) -> Optional[str]:
     # Keep existing data URIs
     if low.startswith("data:"):
         return s
+    if low.startswith("sha256:"):
+        from utils.image_store import is_image_ref, thumbnail_data_url
+        return thumbnail_data_url(s, size) if is_image_ref(s) else None
     # Reject external URLs or file paths per requirement
     if low.startswith("http://") or low.startswith("https://") or low.startswith("file://"):
         return None
@@ -37,4 +44,92 @@ def ensure_data_url(value: Any) -> Optional[str]:
     return f"data:image/png;base64,{cleaned}"
 
 
-__all__ = ["ensure_data_url"]
+# ==========================================
+# ENCODING
+# ==========================================
+IMAGE_MIME = {"jpeg": "image/jpeg", "webp": "image/webp", "avif": "image/avif"}
+
+
+def supported_image_formats() -> List[str]:
+    """Output formats the installed Pillow can encode (JPEG is always listed)."""
+    formats = ["jpeg"]
+    try:
+        from PIL import features
+        if features.check("webp"):
+            formats.append("webp")
+        try:
+            avif_ok = features.check("avif")
+        except Exception:
+            avif_ok = False
+        if avif_ok:
+            formats.append("avif")
+    except Exception:
+        pass
+    return formats
+
+
+def _encode_once(img, fmt: str, quality: int) -> bytes:
+    buf = BytesIO()
+    if fmt == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    elif fmt == "avif":
+        img.save(buf, format="AVIF", quality=quality, speed=8)
+    else:
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def encode_to_budget(
+    img,
+    max_bytes: int = 24000,
+    fmt: str = "jpeg",
+    min_quality: int = 35,
+    max_quality: int = 85,
+    max_encodes: int = 5,
+) -> Tuple[bytes, str]:
+    """Encode an already-resized RGB PIL image at the best quality that fits `max_bytes`.
+
+    The first encode uses `max_quality`; if it is too large the next quality
+    is predicted from the size ratio, so most images settle in one or two
+    encodes. Remaining attempts bisect between the last fitting and the last
+    oversized quality. Returns (bytes, format) where format is one of
+    "jpeg", "webp", "avif"; unsupported formats fall back to JPEG.
+    """
+    fmt = (fmt or "jpeg").lower()
+    if fmt == "auto":
+        available = supported_image_formats()
+        fmt = "webp" if "webp" in available else "jpeg"
+    elif fmt not in supported_image_formats():
+        fmt = "jpeg"
+
+    data = _encode_once(img, fmt, max_quality)
+    if len(data) <= max_bytes:
+        return data, fmt
+
+    best = None  # highest-quality encode found that fits
+    lo, hi = min_quality, max_quality  # hi is known to be oversized
+    q = min_quality + int((max_quality - min_quality) * (max_bytes / float(len(data))) ** 1.5)
+    encodes = 1
+    floor_data = None
+    while encodes < max_encodes and lo < hi:
+        q = max(lo, min(hi - 1, q))
+        data_q = _encode_once(img, fmt, q)
+        encodes += 1
+        if q == min_quality:
+            floor_data = data_q
+        if len(data_q) <= max_bytes:
+            best = data_q
+            lo = q + 1
+            # Close enough to the budget: more encodes would gain little
+            if len(data_q) >= max_bytes * 0.85:
+                break
+        else:
+            hi = q
+        q = (lo + hi) // 2
+    if best is None:
+        # Nothing fit within the attempt budget (huge/noisy image): use the quality floor
+        best = floor_data if floor_data is not None else _encode_once(img, fmt, min_quality)
+    return best, fmt
+
+
+__all__ = ["ensure_data_url", "IMAGE_MIME", "supported_image_formats", "encode_to_budget"]
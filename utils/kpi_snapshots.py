@@ -0,0 +1,257 @@
+"""
+Daily KPI snapshots.
+
+One row per day in data/kpi_snapshots.sqlite: count and amount of
+quotations / invoices / receipts, amount received, outstanding balance at the
+end of that day (invoiced minus received, cumulative) and customers seen for
+the first time. The dashboard reads these few hundred rows instead of the
+whole ledger.
+
+`apply_record(rec)` (called from `record_events.record_saved`) folds one
+saved document in: its previous version, if any, is subtracted first, so
+re-saving a document with the same type-number does not double count.
+A customer's first day only ever moves earlier incrementally (a re-saved
+document that changes customer leaves the old customer counted).
+`backfill(records)` rebuilds every row from history; `daily(loader)` runs it
+automatically when the snapshots are missing or records.xlsx changed outside
+save_record.
+"""
+
+import os
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from utils.phone import phone_key
+
+
+SNAPSHOT_PATH = Path("data") / "kpi_snapshots.sqlite"
+RECORDS_XLSX = os.path.join("data", "records.xlsx")
+CUSTOMER_KEY_FORMAT = "phone_key"
+DOC_TYPES = ["q", "i", "r"]
+KPI_COLUMNS = [
+    "day", "q_count", "q_amount", "i_count", "i_amount", "r_count", "r_amount",
+    "received", "outstanding", "new_customers",
+]
+
+_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    path = Path(SNAPSHOT_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS daily_kpis ("
+        " day TEXT PRIMARY KEY,"
+        " q_count INTEGER NOT NULL DEFAULT 0, q_amount REAL NOT NULL DEFAULT 0,"
+        " i_count INTEGER NOT NULL DEFAULT 0, i_amount REAL NOT NULL DEFAULT 0,"
+        " r_count INTEGER NOT NULL DEFAULT 0, r_amount REAL NOT NULL DEFAULT 0,"
+        " received REAL NOT NULL DEFAULT 0, outstanding REAL NOT NULL DEFAULT 0,"
+        " new_customers INTEGER NOT NULL DEFAULT 0)"
+    )
+    # One row per document so re-saves replace instead of adding
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS documents ("
+        " doc_key TEXT PRIMARY KEY, day TEXT NOT NULL, type TEXT NOT NULL, number TEXT,"
+        " amount REAL NOT NULL, client_name TEXT, customer_key TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS documents_type_day ON documents(type, day)")
+    conn.execute("CREATE TABLE IF NOT EXISTS customers_seen (customer_key TEXT PRIMARY KEY, first_day TEXT NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+
+def _records_mtime() -> str:
+    # Prefixed with the customer-key format so snapshots keyed the old way are backfilled again
+    try:
+        return f"{CUSTOMER_KEY_FORMAT}:{os.path.getmtime(RECORDS_XLSX)!r}"
+    except OSError:
+        return ""
+
+
+def _text(v) -> str:
+    if v is None or (isinstance(v, float) and pd.isna(v)):
+        return ""
+    s = str(v).strip()
+    return "" if s.lower() in ("nan", "none", "nat") else s
+
+
+def _customer_key(name, phone) -> str:
+    key = phone_key(phone)
+    if len(key) >= 7:
+        return "p:" + key
+    name = _text(name).lower()
+    return "n:" + name if name else ""
+
+
+def _documents(records: pd.DataFrame) -> pd.DataFrame:
+    """Normalized documents (last saved version per type-number)."""
+    rec = records.reindex(columns=["date", "type", "number", "amount", "client_name", "phone"])
+    docs = pd.DataFrame({
+        "day": pd.to_datetime(rec["date"], errors="coerce").dt.strftime("%Y-%m-%d").fillna(""),
+        "type": rec["type"].map(_text).str.lower(),
+        "number": rec["number"].map(_text),
+        "amount": pd.to_numeric(rec["amount"], errors="coerce").fillna(0.0),
+        "client_name": rec["client_name"].map(_text),
+        "customer_key": [_customer_key(n, p) for n, p in zip(rec["client_name"], rec["phone"])],
+    }, index=records.index)
+    docs = docs[docs["type"].isin(DOC_TYPES)]
+    keys = docs["type"] + "-" + docs["number"]
+    docs["doc_key"] = keys.where(docs["number"] != "", "row-" + docs.index.astype(str))
+    return docs.drop_duplicates("doc_key", keep="last")
+
+
+def _daily_frame(docs: pd.DataFrame) -> pd.DataFrame:
+    counts = pd.crosstab(docs["day"], docs["type"]).reindex(columns=DOC_TYPES, fill_value=0)
+    amounts = (
+        docs.pivot_table(index="day", columns="type", values="amount", aggfunc="sum", fill_value=0.0)
+        .reindex(columns=DOC_TYPES, fill_value=0.0)
+    )
+    daily = pd.DataFrame(index=counts.index)
+    for t in DOC_TYPES:
+        daily[f"{t}_count"] = counts[t]
+        daily[f"{t}_amount"] = amounts[t].reindex(daily.index, fill_value=0.0)
+    daily["received"] = daily["r_amount"]
+    daily["outstanding"] = (daily["i_amount"] - daily["r_amount"]).cumsum()
+    firsts = docs[docs["customer_key"] != ""].groupby("customer_key")["day"].min()
+    daily["new_customers"] = firsts.value_counts().reindex(daily.index, fill_value=0)
+    return daily.sort_index()
+
+
+def backfill(records: pd.DataFrame) -> int:
+    """Recompute every daily row from records. Returns the number of days written."""
+    docs = _documents(records)
+    daily = _daily_frame(docs) if not docs.empty else pd.DataFrame(columns=KPI_COLUMNS[1:])
+    firsts = docs[docs["customer_key"] != ""].groupby("customer_key")["day"].min()
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                for table in ("daily_kpis", "documents", "customers_seen"):
+                    conn.execute(f"DELETE FROM {table}")
+                conn.executemany(
+                    f"INSERT INTO daily_kpis({', '.join(KPI_COLUMNS)}) VALUES ({', '.join('?' * len(KPI_COLUMNS))})",
+                    daily.rename_axis("day").reset_index()[KPI_COLUMNS].to_numpy().tolist(),
+                )
+                conn.executemany(
+                    "INSERT INTO documents(doc_key, day, type, number, amount, client_name, customer_key) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    docs[["doc_key", "day", "type", "number", "amount", "client_name", "customer_key"]].to_numpy().tolist(),
+                )
+                conn.executemany("INSERT INTO customers_seen(customer_key, first_day) VALUES (?, ?)", firsts.items())
+                conn.execute("INSERT OR REPLACE INTO meta(name, value) VALUES ('stamp', ?)", (_records_mtime(),))
+        finally:
+            conn.close()
+    return len(daily)
+
+
+def _bump_day(conn: sqlite3.Connection, day: str, doc_type: str, count: int, amount: float):
+    if not conn.execute("SELECT 1 FROM daily_kpis WHERE day = ?", (day,)).fetchone():
+        prev = conn.execute("SELECT outstanding FROM daily_kpis WHERE day < ? ORDER BY day DESC LIMIT 1", (day,)).fetchone()
+        conn.execute("INSERT INTO daily_kpis(day, outstanding) VALUES (?, ?)", (day, prev[0] if prev else 0.0))
+    conn.execute(
+        f"UPDATE daily_kpis SET {doc_type}_count = {doc_type}_count + ?, {doc_type}_amount = {doc_type}_amount + ? WHERE day = ?",
+        (count, amount, day),
+    )
+    if doc_type == "r":
+        conn.execute("UPDATE daily_kpis SET received = received + ? WHERE day = ?", (amount, day))
+    delta = amount if doc_type == "i" else -amount if doc_type == "r" else 0.0
+    if delta:
+        # Outstanding is cumulative: every later day moves with it
+        conn.execute("UPDATE daily_kpis SET outstanding = outstanding + ? WHERE day >= ?", (delta, day))
+
+
+def _see_customer(conn: sqlite3.Connection, customer_key: str, day: str):
+    if not customer_key:
+        return
+    row = conn.execute("SELECT first_day FROM customers_seen WHERE customer_key = ?", (customer_key,)).fetchone()
+    if row and row[0] <= day:
+        return
+    if row:
+        conn.execute("UPDATE daily_kpis SET new_customers = new_customers - 1 WHERE day = ?", (row[0],))
+    conn.execute("INSERT OR REPLACE INTO customers_seen(customer_key, first_day) VALUES (?, ?)", (customer_key, day))
+    conn.execute("UPDATE daily_kpis SET new_customers = new_customers + 1 WHERE day = ?", (day,))
+
+
+def apply_record(rec: Dict) -> bool:
+    """Fold one saved document into the snapshots. False if there is nothing to update yet."""
+    docs = _documents(pd.DataFrame([rec]))
+    if docs.empty:
+        return False
+    doc = docs.iloc[0].to_dict()
+    if doc["doc_key"].startswith("row-"):
+        doc["doc_key"] = "row-" + uuid.uuid4().hex
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                if not conn.execute("SELECT 1 FROM meta WHERE name = 'stamp'").fetchone():
+                    return False  # never backfilled; the next read builds everything
+                old = conn.execute("SELECT day, type, amount FROM documents WHERE doc_key = ?", (doc["doc_key"],)).fetchone()
+                if old:
+                    _bump_day(conn, old[0], old[1], -1, -old[2])
+                _bump_day(conn, doc["day"], doc["type"], 1, float(doc["amount"]))
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents(doc_key, day, type, number, amount, client_name, customer_key) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (doc["doc_key"], doc["day"], doc["type"], doc["number"], float(doc["amount"]), doc["client_name"], doc["customer_key"]),
+                )
+                _see_customer(conn, doc["customer_key"], doc["day"])
+                conn.execute("INSERT OR REPLACE INTO meta(name, value) VALUES ('stamp', ?)", (_records_mtime(),))
+        finally:
+            conn.close()
+    return True
+
+
+def _fresh() -> bool:
+    with _lock:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE name = 'stamp'").fetchone()
+        finally:
+            conn.close()
+    return row is not None and row[0] == _records_mtime()
+
+
+def _query(sql: str, params: tuple = ()) -> List[tuple]:
+    with _lock:
+        conn = _connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+
+def daily(loader: Optional[Callable[[], pd.DataFrame]] = None) -> pd.DataFrame:
+    """All daily rows ordered by day; backfills first (via `loader`) when stale."""
+    if loader is not None and not _fresh():
+        backfill(loader())
+    rows = _query(f"SELECT {', '.join(KPI_COLUMNS)} FROM daily_kpis ORDER BY day")
+    return pd.DataFrame(rows, columns=KPI_COLUMNS)
+
+
+def latest_documents(doc_type: str, limit: int = 10) -> pd.DataFrame:
+    """Most recent documents of one type (day, number, client_name, amount)."""
+    rows = _query(
+        "SELECT day, number, client_name, amount FROM documents WHERE type = ? ORDER BY day DESC LIMIT ?",
+        (doc_type, limit),
+    )
+    return pd.DataFrame(rows, columns=["date", "number", "client_name", "amount"])
+
+
+def invalidate():
+    """Forget the stamp; the next `daily(loader)` backfills from records."""
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM meta WHERE name = 'stamp'")
+        finally:
+            conn.close()
+
+
+__all__ = ["SNAPSHOT_PATH", "KPI_COLUMNS", "backfill", "apply_record", "daily", "latest_documents", "invalidate"]
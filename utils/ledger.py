@@ -0,0 +1,121 @@
+"""
+Vectorized customer ledger.
+
+Records are loaded and normalized (name, phone) once per records version;
+quotation / invoice / receipt totals are then aggregated with single
+groupbys by phone, by name and by (phone, name). A customer's totals are the
+records matching their phone OR their name, computed by inclusion-exclusion:
+by_phone + by_name - by_both.
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+import pandas as pd
+
+from utils import data_version
+from utils.phone import phone_key
+
+
+RECORDS_XLSX = os.path.join("data", "records.xlsx")
+RELOAD_AFTER_SECONDS = 300  # also pick up records written by other processes
+TOTAL_COLUMNS = ["q", "i", "r"]
+
+_lock = threading.Lock()
+_cached: Optional[Tuple[tuple, float, "Ledger"]] = None
+
+
+def _name_key(series: pd.Series) -> pd.Series:
+    out = series.fillna("").astype(str).str.strip().str.lower()
+    return out.where(out != "nan", "")
+
+
+def _phone_key(series: pd.Series, phone_norm: Callable) -> pd.Series:
+    # Normalize each distinct value once, then map back
+    raw = series.where(series.notna(), None)
+    uniques = {v: (phone_norm(v) or "") for v in pd.unique(raw.astype(object)) if v is not None}
+    return raw.map(lambda v: uniques.get(v, "") if v is not None else "").astype(str)
+
+
+class Ledger:
+    def __init__(self, records: pd.DataFrame, phone_norm: Callable = phone_key):
+        self.phone_norm = phone_norm
+        rec = records.copy()
+        for col in ["type", "amount", "client_name", "phone"]:
+            if col not in rec.columns:
+                rec[col] = None
+        rec["_name"] = _name_key(rec["client_name"])
+        rec["_phone"] = _phone_key(rec["phone"], phone_norm)
+        rec["_amount"] = pd.to_numeric(rec["amount"], errors="coerce").fillna(0.0)
+        rec["_type"] = rec["type"].fillna("").astype(str).str.strip().str.lower()
+        self.records = rec
+
+        typed = rec[rec["_type"].isin(TOTAL_COLUMNS)]
+        self.by_phone = self._pivot(typed[typed["_phone"] != ""], ["_phone"])
+        self.by_name = self._pivot(typed[typed["_name"] != ""], ["_name"])
+        self.by_both = self._pivot(typed[(typed["_phone"] != "") & (typed["_name"] != "")], ["_phone", "_name"])
+
+    @staticmethod
+    def _pivot(df: pd.DataFrame, keys) -> pd.DataFrame:
+        totals = df.pivot_table(index=keys, columns="_type", values="_amount", aggfunc="sum", fill_value=0.0)
+        return totals.reindex(columns=TOTAL_COLUMNS, fill_value=0.0)
+
+    def customer_totals(self, customers: pd.DataFrame, name_col: str = "client_name", phone_col: str = "phone") -> pd.DataFrame:
+        """q / i / r / outstanding for every customer row (same index as `customers`)."""
+        names = _name_key(customers[name_col]) if name_col in customers.columns else pd.Series("", index=customers.index)
+        if "phone_key" in customers.columns and self.phone_norm is phone_key:
+            # Persisted by save_customers; no per-row normalization needed
+            phones = customers["phone_key"].fillna("").astype(str)
+        elif phone_col in customers.columns:
+            phones = _phone_key(customers[phone_col], self.phone_norm)
+        else:
+            phones = pd.Series("", index=customers.index)
+        keys = pd.DataFrame({"_phone": phones, "_name": names}, index=customers.index)
+
+        def lookup(table: pd.DataFrame, cols, mask) -> pd.DataFrame:
+            out = pd.DataFrame(0.0, index=customers.index, columns=TOTAL_COLUMNS)
+            if table.empty or not mask.any():
+                return out
+            joined = keys.loc[mask, cols].join(table, on=cols)[TOTAL_COLUMNS].fillna(0.0)
+            out.loc[mask] = joined.values
+            return out
+
+        has_phone = keys["_phone"] != ""
+        has_name = keys["_name"] != ""
+        totals = (
+            lookup(self.by_phone, ["_phone"], has_phone)
+            + lookup(self.by_name, ["_name"], has_name)
+            - lookup(self.by_both, ["_phone", "_name"], has_phone & has_name)
+        )
+        totals["outstanding"] = totals["i"] - totals["r"]
+        return totals
+
+    def totals(self, name, phone=None) -> Tuple[float, float, float, float]:
+        """(total_q, total_i, total_r, outstanding) for one customer."""
+        row = self.customer_totals(pd.DataFrame({"client_name": [name], "phone": [phone]})).iloc[0]
+        return float(row["q"]), float(row["i"]), float(row["r"]), float(row["outstanding"])
+
+
+def _records_mtime() -> float:
+    try:
+        return os.path.getmtime(RECORDS_XLSX)
+    except OSError:
+        return 0.0
+
+
+def get_ledger(loader: Callable[[], pd.DataFrame], phone_norm: Callable = phone_key) -> Ledger:
+    """Process-wide ledger; `loader` runs only when records changed or the cache went stale."""
+    global _cached
+    key = (data_version.get("records"), _records_mtime())
+    with _lock:
+        if _cached is not None and _cached[0] == key and time.time() - _cached[1] < RELOAD_AFTER_SECONDS:
+            return _cached[2]
+    ledger = Ledger(loader(), phone_norm)
+    with _lock:
+        _cached = (key, time.time(), ledger)
+    return ledger
+
+
+__all__ = ["Ledger", "get_ledger"]
@@ -0,0 +1,211 @@
+"""
+Materialized project-lifecycle view.
+
+One row per project (base_id): customer, which documents exist (quotation /
+invoice / receipt), invoiced, paid, balance and last update. The view is
+built with vectorized groupbys from a facts table holding one row per
+document, keyed "base_id|type-number" (the last saved version of a document
+wins; the same number under another project is a separate document), and
+persisted to data/lifecycle_view.pkl.
+
+`apply_record(rec)` is called from `record_events.record_saved` after every
+save: it upserts the document's fact and recomputes only the projects it
+touches. The whole view is rebuilt when the records changed behind its back
+or the pickle is missing: the stamp holds the records.xlsx mtime and, in
+Postgres mode, a fingerprint of the records table (row count + content hash).
+The fingerprint query runs at most once per RECHECK_AFTER_SECONDS (and after
+each save), not on every render.
+"""
+
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import pandas as pd
+
+try:
+    from utils import db as _db
+except Exception:
+    _db = None
+
+
+VIEW_PATH = Path("data") / "lifecycle_view.pkl"
+RECORDS_XLSX = os.path.join("data", "records.xlsx")
+FACT_COLUMNS = ["base_id", "date", "type", "number", "amount", "client_name", "phone", "location"]
+VIEW_COLUMNS = [
+    "base_id", "client", "phone", "location",
+    "has_q", "has_i", "has_r", "invoiced", "paid", "balance", "last_update",
+]
+DOC_TYPES = ["q", "i", "r"]
+RECHECK_AFTER_SECONDS = 300  # how stale the records-table fingerprint may get (edits by other processes)
+
+_lock = threading.Lock()
+_state: Optional[Dict] = None   # {"stamp", "facts", "view"}
+_fingerprint: Optional[Tuple[float, Optional[tuple]]] = None   # (checked at, fingerprint)
+
+
+def _records_mtime() -> Optional[float]:
+    try:
+        return os.path.getmtime(RECORDS_XLSX)
+    except OSError:
+        return None
+
+
+def _db_fingerprint() -> Optional[tuple]:
+    """(row count, content hash) of the records table; None without a database."""
+    if _db is None or not _db.get_connection_string():
+        return None
+    try:
+        rows = _db.db_query(
+            "SELECT COUNT(*) AS n, md5(string_agg(concat_ws('|', base_id, date, type, number, amount, client_name, phone, location), ',' "
+            "ORDER BY base_id, type, number, date)) AS digest FROM records"
+        )
+    except Exception:
+        return None
+    return (int(rows[0]["n"]), rows[0]["digest"]) if rows else None
+
+
+def _stamp(recheck: bool = False) -> tuple:
+    global _fingerprint
+    if recheck or _fingerprint is None or time.time() - _fingerprint[0] > RECHECK_AFTER_SECONDS:
+        _fingerprint = (time.time(), _db_fingerprint())
+    return (_records_mtime(), _fingerprint[1])
+
+
+def _fact_keys(facts: pd.DataFrame) -> pd.Index:
+    number = facts["number"].astype(str).str.strip()
+    keys = facts["base_id"].astype(str).str.strip() + "|" + facts["type"] + "-" + number
+    missing = facts["number"].isna() | number.isin(["", "nan", "None"])
+    # Documents without a number cannot be replaced later; keep each as its own fact
+    keys = keys.where(~missing, "row-" + pd.Series(range(len(facts)), index=facts.index).astype(str))
+    return pd.Index(keys, name="key")
+
+
+def _facts(records: pd.DataFrame) -> pd.DataFrame:
+    facts = records.reindex(columns=FACT_COLUMNS).copy()
+    facts["type"] = facts["type"].fillna("").astype(str).str.strip().str.lower()
+    facts["amount"] = pd.to_numeric(facts["amount"], errors="coerce").fillna(0.0)
+    facts["date"] = pd.to_datetime(facts["date"], errors="coerce")
+    facts.index = _fact_keys(facts)
+    return facts[~facts.index.duplicated(keep="last")]
+
+
+def build_view(facts: pd.DataFrame) -> pd.DataFrame:
+    """Lifecycle rows (indexed by base_id) for the given facts."""
+    f = facts[facts["base_id"].notna()]
+    if f.empty:
+        return pd.DataFrame(columns=VIEW_COLUMNS[1:], index=pd.Index([], name="base_id"))
+    first = f.drop_duplicates("base_id", keep="first").set_index("base_id")
+    present = pd.crosstab(f["base_id"], f["type"]).reindex(columns=DOC_TYPES, fill_value=0) > 0
+    sums = (
+        f.pivot_table(index="base_id", columns="type", values="amount", aggfunc="sum", fill_value=0.0)
+        .reindex(columns=DOC_TYPES, fill_value=0.0)
+    )
+    view = pd.DataFrame(index=present.index)
+    view["client"] = first["client_name"]
+    view["phone"] = first["phone"]
+    view["location"] = first["location"]
+    for t in DOC_TYPES:
+        view[f"has_{t}"] = present[t]
+    view["invoiced"] = sums["i"].reindex(view.index, fill_value=0.0)
+    view["paid"] = sums["r"].reindex(view.index, fill_value=0.0)
+    view["balance"] = view["invoiced"] - view["paid"]
+    view["last_update"] = f.groupby("base_id")["date"].max()
+    return view
+
+
+def _save(state: Dict):
+    path = Path(VIEW_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".pkl.tmp")
+    with open(tmp, "wb") as fh:
+        pickle.dump(state, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _load() -> Optional[Dict]:
+    global _state
+    if _state is None and Path(VIEW_PATH).exists():
+        try:
+            with open(VIEW_PATH, "rb") as fh:
+                _state = pickle.load(fh)
+        except Exception as e:
+            print(f"⚠️ Lifecycle view unreadable, rebuilding: {e}")
+    return _state
+
+
+def rebuild(records: pd.DataFrame) -> pd.DataFrame:
+    """Recompute the whole view from records and persist it."""
+    global _state
+    facts = _facts(records)
+    state = {"stamp": _stamp(recheck=True), "facts": facts, "view": build_view(facts)}
+    with _lock:
+        _state = state
+        _save(state)
+    return state["view"]
+
+
+def get_view(loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """The lifecycle view as a frame; `loader` runs only when a full rebuild is needed."""
+    stamp = _stamp()
+    with _lock:
+        state = _load()
+        if state is not None and state.get("stamp") == stamp:
+            return state["view"].reset_index()
+    return rebuild(loader()).reset_index()
+
+
+def _refresh(state: Dict, base_ids: Iterable):
+    facts, view = state["facts"], state["view"]
+    for base_id in {b for b in base_ids if pd.notna(b)}:
+        rows = build_view(facts[facts["base_id"] == base_id])
+        view = view.drop(index=base_id, errors="ignore")
+        if not rows.empty:
+            view = pd.concat([view, rows]) if not view.empty else rows
+    view.index.name = "base_id"
+    state["view"] = view.sort_index()
+
+
+def apply_record(rec: Dict) -> bool:
+    """Upsert one saved document and recompute its project. False if no view exists yet."""
+    fact = _facts(pd.DataFrame([rec]))
+    with _lock:
+        state = _load()
+        if state is None:
+            return False
+        facts = state["facts"]
+        key = fact.index[0]
+        if key.startswith("row-"):
+            n = len(facts)
+            while f"row-{n}" in facts.index:
+                n += 1
+            key = f"row-{n}"
+            fact.index = pd.Index([key], name="key")
+        touched = [fact.at[key, "base_id"]]
+        if key in facts.index:
+            touched.append(facts.at[key, "base_id"])
+            facts = facts.drop(index=key)
+        state["facts"] = pd.concat([facts, fact]) if not facts.empty else fact
+        _refresh(state, touched)
+        # The save just changed the table: re-read its fingerprint
+        state["stamp"] = _stamp(recheck=True)
+        _save(state)
+    return True
+
+
+def invalidate():
+    """Drop the view; the next `get_view` rebuilds it from records."""
+    global _state, _fingerprint
+    with _lock:
+        _state = None
+        _fingerprint = None
+        try:
+            Path(VIEW_PATH).unlink()
+        except FileNotFoundError:
+            pass
+
+
+__all__ = ["VIEW_PATH", "VIEW_COLUMNS", "build_view", "rebuild", "get_view", "apply_record", "invalidate"]
@@ -11,6 +11,7 @@ try:
     from utils import db as _db
 except Exception:
     _db = None
+from utils import data_version
 
 
 def ensure_logs_file():
@@ -39,6 +40,7 @@ def log_event(user: str, page: str, action: str, details: str = ""):
                 _db.db_execute('INSERT INTO logs("timestamp", "user", page, action, details) VALUES (%s,%s,%s,%s,%s)', (
                     datetime.now().strftime("%Y-%m-%d %H:%M:%S"), str(user), str(page), str(action), str(details)
                 ))
+                data_version.bump("logs")
                 return
             except Exception:
                 # Fall back to Excel below
@@ -63,6 +65,7 @@ def log_event(user: str, page: str, action: str, details: str = ""):
         # Append and save
         logs = pd.concat([logs, new_log], ignore_index=True)
         logs.to_excel("data/logs.xlsx", index=False)
+        data_version.bump("logs")
     except Exception as e:
         print(f"Error logging event: {e}")
 
@@ -5,11 +5,29 @@ and Full AI Assistant capabilities
 
 import os
 import json
-from typing import Optional, List, Dict
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Tuple
 
 
 # Store API key (should be moved to environment or settings)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Alternative endpoint, e.g. http://127.0.0.1:8765/v1 for scripts/openai_stub_server.py
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Generated quotation title/description, reused while the inputs are unchanged
+PROJECT_DETAILS_TTL = 3600  # seconds
+PROJECT_DETAILS_MAX = 128   # entries, least recently used evicted first
+
+_details_lock = threading.Lock()
+_details_cache: "OrderedDict[Tuple, Tuple[float, Dict[str, str]]]" = OrderedDict()
+
+
+def _client():
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
 
 def chat_with_ai(message: str, history: List[Dict] = None) -> str:
@@ -24,8 +42,7 @@ def chat_with_ai(message: str, history: List[Dict] = None) -> str:
         AI response string
     """
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        client = _client()
         
         messages = history or []
         if not any(msg.get("role") == "system" for msg in messages):
@@ -58,8 +75,7 @@ def generate_document(doc_type: str, context: Dict) -> str:
         Generated document text
     """
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        client = _client()
         
         prompt = f"""Generate a professional {doc_type} document with the following details:
         
@@ -90,8 +106,7 @@ def analyze_file(file_content: str, file_type: str) -> str:
         Analysis report
     """
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        client = _client()
         
         prompt = f"""Analyze this {file_type} file and provide insights:
 
@@ -113,6 +128,89 @@ Provide:
         return f"❌ Error: {str(e)}"
 
 
+def _details_key(products: List[Tuple[str, float]], client_name: str, location: str) -> Tuple:
+    """Order-insensitive key: same products/quantities, client and location hit the cache."""
+    items = sorted(
+        (" ".join(str(name or "").lower().split()), float(qty or 0))
+        for name, qty in products
+    )
+    norm = lambda v: " ".join(str(v or "").lower().split())
+    return tuple(items), norm(client_name), norm(location)
+
+
+def _details_get(key: Tuple) -> Optional[Dict[str, str]]:
+    with _details_lock:
+        hit = _details_cache.get(key)
+        if hit is None:
+            return None
+        if hit[0] < time.monotonic():
+            del _details_cache[key]
+            return None
+        _details_cache.move_to_end(key)
+        return dict(hit[1])
+
+
+def _details_put(key: Tuple, value: Dict[str, str]):
+    with _details_lock:
+        _details_cache[key] = (time.monotonic() + PROJECT_DETAILS_TTL, dict(value))
+        _details_cache.move_to_end(key)
+        while len(_details_cache) > PROJECT_DETAILS_MAX:
+            _details_cache.popitem(last=False)
+
+
+def generate_project_details(products: List[Tuple[str, float]], client_name: str, location: str) -> Dict[str, str]:
+    """
+    Project title and description for a quotation.
+
+    Both prompts are sent concurrently, and successful results are cached
+    (PROJECT_DETAILS_TTL / PROJECT_DETAILS_MAX) on the normalized product
+    list, client name and location, so regenerating an unchanged quotation
+    returns immediately.
+
+    Args:
+        products: [(product name, qty), ...]
+        client_name: Client name used in the prompts
+        location: Project location used in the prompts
+
+    Returns:
+        {"title": ..., "description": ...}; failed calls carry chat_with_ai's "❌ Error" text
+    """
+    key = _details_key(products, client_name, location)
+    cached = _details_get(key)
+    if cached is not None:
+        return cached
+
+    products_str = "\n".join(f"- {name} (Qty: {int(qty)})" for name, qty in products)
+    title_prompt = f"""Generate a short professional project title (max 8 words) for a smart home quotation with these products:
+{products_str}
+
+Client: {client_name}
+Location: {location}
+
+Return ONLY the title, nothing else."""
+    desc_prompt = f"""Generate a concise professional project description (2-3 sentences, max 150 words) for a smart home quotation with these products:
+{products_str}
+
+Client: {client_name}
+Location: {location}
+
+Return ONLY the description, nothing else. Focus on benefits and scope."""
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        title = pool.submit(chat_with_ai, title_prompt, [])
+        desc = pool.submit(chat_with_ai, desc_prompt, [])
+        result = {"title": title.result().strip(), "description": desc.result().strip()}
+
+    if not any(v.startswith("❌") for v in result.values()):
+        _details_put(key, result)
+    return result
+
+
+def clear_project_details_cache():
+    with _details_lock:
+        _details_cache.clear()
+
+
 def generate_project_description(product_list: list, api_key: str) -> Optional[str]:
     """
     Generate project description using OpenAI ChatGPT based on selected products.
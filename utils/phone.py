@@ -0,0 +1,83 @@
+"""
+Phone number normalization shared by every page and store.
+
+`phone_key` is the one canonical form used for matching customers: the UAE
+local 10-digit number (05XXXXXXXX) for mobiles given as +971 / 00971 / 5XXXXXXXX
+/ 05XXXXXXXX, Excel floats (502992932.0) included, otherwise the last ten
+digits. It is also the Firestore customer document id, and `SQL_PHONE_KEY`
+computes the same value in Postgres for backfilling the `phone_key` column.
+"""
+
+import re
+from typing import Optional
+
+import pandas as pd
+
+
+def phone_key(raw) -> str:
+    """Canonical local form of a phone number ("" when there are no digits)."""
+    s = str(raw if raw is not None else "").strip()
+    if s.lower() in ("", "nan", "none"):
+        return ""
+    # Excel sometimes reads numbers as floats (502992932.0)
+    if re.fullmatch(r"\d+\.0+", s):
+        s = s.split(".")[0]
+    digits = re.sub(r"\D", "", s)
+    if not digits:
+        return ""
+    if digits.startswith("00971"):
+        digits = digits[2:]
+    if digits.startswith("971") and len(digits) >= 12:
+        return "0" + digits[3:12]
+    if len(digits) == 9 and digits.startswith("5"):
+        return "0" + digits
+    if len(digits) == 10 and digits.startswith("0"):
+        return digits
+    return digits[-10:]
+
+
+def format_phone(raw) -> Optional[str]:
+    """Display form of a UAE mobile (+971 50 123 4567); None for anything else."""
+    key = phone_key(raw)
+    if len(key) == 10 and key.startswith("05"):
+        return f"+971 {key[1:3]} {key[3:6]} {key[6:]}"
+    return None
+
+
+def label_mask(raw) -> str:
+    """Phone part of selectbox labels ("0502992932 xxxxxxxxxx")."""
+    key = phone_key(raw)
+    return f"{key} xxxxxxxxxx" if key else "xxxxxxxxxx"
+
+
+def with_phone_keys(df: pd.DataFrame, column: str = "phone", refresh: bool = False) -> pd.DataFrame:
+    """Add / complete the `phone_key` column.
+
+    On load only rows without a key are computed; writers pass refresh=True so
+    edited phones never keep a stale key.
+    """
+    df = df.copy()
+    if "phone_key" not in df.columns or refresh:
+        df["phone_key"] = None
+    keys = df["phone_key"].astype(object)
+    missing = keys.isna() | (keys.astype(str).str.strip().isin(["", "nan", "None"]))
+    if missing.any() and column in df.columns:
+        keys = keys.where(~missing, df.loc[missing, column].map(phone_key))
+    df["phone_key"] = keys.fillna("").astype(str)
+    return df
+
+
+# Postgres expression mirroring phone_key() for a text column named {c}
+SQL_PHONE_KEY = (
+    "(SELECT CASE"
+    " WHEN d = '' THEN NULL"
+    " WHEN d LIKE '00971%%' AND length(d) >= 14 THEN '0' || substr(d, 6, 9)"
+    " WHEN d LIKE '971%%' AND length(d) >= 12 THEN '0' || substr(d, 4, 9)"
+    " WHEN length(d) = 9 AND d LIKE '5%%' THEN '0' || d"
+    " WHEN length(d) = 10 AND d LIKE '0%%' THEN d"
+    " ELSE right(d, 10) END"
+    " FROM (SELECT regexp_replace(regexp_replace(coalesce({c}::text, ''), '\\.0+$', ''), '\\D', '', 'g') AS d) s)"
+)
+
+
+__all__ = ["phone_key", "format_phone", "label_mask", "with_phone_keys", "SQL_PHONE_KEY"]
@@ -0,0 +1,420 @@
+"""
+Merkle-style reconciliation between Excel, Postgres and Firestore.
+
+Every dataset (records, customers, products) is reduced to canonical rows
+(key + normalized fields) and grouped into buckets: records by month of
+`date`, customers and products by the first character of their name. Each
+store reports one hash per bucket (an MD5 over the ordered row MD5s; Postgres
+computes it in SQL, Firestore is hashed from the incrementally pulled local
+cache), and only buckets whose hashes disagree are fetched row by row. The
+result is a discrepancy report plus a repair plan relative to a chosen
+source of truth. Nothing is written.
+"""
+
+import hashlib
+import math
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.phone import SQL_PHONE_KEY, phone_key
+
+try:
+    from utils import db as _db
+except Exception:
+    _db = None
+
+
+SEP = "\x1f"
+STORES = ("excel", "postgres", "firestore")
+
+# dataset -> (excel file, firestore collection, canonical fields in hash order)
+DATASETS = {
+    "records": ("records.xlsx", "records", ["date", "type", "number", "amount", "client_name", "phone"]),
+    "customers": ("customers.xlsx", "customers", ["name", "phone", "address"]),
+    "products": ("products.xlsx", "products", ["device", "description", "unit_price", "warranty"]),
+}
+
+# Postgres: canonical key / bucket / field expressions mirroring the Python normalizers below
+_SQL_TEXT = "btrim(coalesce({c}::text, ''))"
+_SQL_MONEY = "coalesce(to_char(round({c}::numeric, 2), 'FM999999999990.00'), '')"
+_SQL_PHONE = "coalesce(" + SQL_PHONE_KEY + ", '')"
+_SQL_DATE = "left(btrim(coalesce({c}::text, '')), 10)"
+
+_SQL = {
+    "records": {
+        "table": "records",
+        "key": f"lower({_SQL_TEXT.format(c='type')}) || '-' || {_SQL_TEXT.format(c='number')}",
+        "bucket": f"coalesce(nullif(left({_SQL_DATE.format(c='date')}, 7), ''), '?')",
+        "fields": [
+            _SQL_DATE.format(c="date"),
+            f"lower({_SQL_TEXT.format(c='type')})",
+            _SQL_TEXT.format(c="number"),
+            _SQL_MONEY.format(c="amount"),
+            _SQL_TEXT.format(c="client_name"),
+            _SQL_PHONE.format(c="phone"),
+        ],
+    },
+    "customers": {
+        "table": "customers",
+        "key": f"lower({_SQL_TEXT.format(c='name')}) || '|' || {_SQL_PHONE.format(c='phone')}",
+        "bucket": f"coalesce(nullif(left(lower({_SQL_TEXT.format(c='name')}), 1), ''), '?')",
+        "fields": [
+            _SQL_TEXT.format(c="name"),
+            _SQL_PHONE.format(c="phone"),
+            _SQL_TEXT.format(c="address"),
+        ],
+    },
+    "products": {
+        "table": "products",
+        "key": f"lower({_SQL_TEXT.format(c='device')})",
+        "bucket": f"coalesce(nullif(left(lower({_SQL_TEXT.format(c='device')}), 1), ''), '?')",
+        "fields": [
+            _SQL_TEXT.format(c="device"),
+            _SQL_TEXT.format(c="description"),
+            _SQL_MONEY.format(c="unit_price"),
+            _SQL_TEXT.format(c="warranty"),
+        ],
+    },
+}
+
+
+# ==========================================
+# CANONICAL FORM
+# ==========================================
+def _missing(v: Any) -> bool:
+    return v is None or (isinstance(v, float) and math.isnan(v)) or (not isinstance(v, (list, dict)) and pd.isna(v))
+
+
+def _text(v: Any) -> str:
+    if _missing(v):
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v).strip()
+
+
+def _money(v: Any) -> str:
+    if _missing(v) or str(v).strip() == "":
+        return ""
+    try:
+        return "%.2f" % round(float(str(v).replace("AED", "").replace(",", "").strip()), 2)
+    except Exception:
+        return ""
+
+
+def _phone(v: Any) -> str:
+    return phone_key(_text(v))
+
+
+def _date(v: Any) -> str:
+    if _missing(v):
+        return ""
+    if hasattr(v, "strftime"):
+        return v.strftime("%Y-%m-%d")
+    return str(v).strip()[:10]
+
+
+def _first(row: Dict, *names) -> Any:
+    for n in names:
+        v = row.get(n)
+        if not _missing(v) and str(v).strip() != "":
+            return v
+    return None
+
+
+def canonical_row(dataset: str, row: Dict) -> Tuple[str, str, Dict[str, str]]:
+    """(bucket, key, fields) for one source row, whatever store it came from."""
+    if dataset == "records":
+        f = {
+            "date": _date(row.get("date")),
+            "type": _text(row.get("type")).lower(),
+            "number": _text(row.get("number")),
+            "amount": _money(row.get("amount")),
+            "client_name": _text(row.get("client_name")),
+            "phone": _phone(row.get("phone")),
+        }
+        return (f["date"][:7] or "?"), f"{f['type']}-{f['number']}", f
+    if dataset == "customers":
+        f = {
+            "name": _text(_first(row, "name", "client_name")),
+            "phone": _phone(row.get("phone")),
+            "address": _text(_first(row, "address", "location")),
+        }
+        return (f["name"][:1].lower() or "?"), f"{f['name'].lower()}|{f['phone']}", f
+    if dataset == "products":
+        f = {
+            "device": _text(_first(row, "device", "Device")),
+            "description": _text(_first(row, "description", "Description")),
+            "unit_price": _money(_first(row, "unit_price", "UnitPrice")),
+            "warranty": _text(_first(row, "warranty", "Warranty")),
+        }
+        return (f["device"][:1].lower() or "?"), f["device"].lower(), f
+    raise ValueError(f"Unknown dataset: {dataset}")
+
+
+def row_hash(key: str, dataset: str, fields: Dict[str, str]) -> str:
+    values = [fields[name] for name in DATASETS[dataset][2]]
+    return hashlib.md5(SEP.join([key] + values).encode("utf-8")).hexdigest()
+
+
+def _bucket_hash(entries: List[Tuple[str, str]]) -> str:
+    # Ordered by (key, row hash) in code-point order == Postgres COLLATE "C" on UTF-8
+    return hashlib.md5("".join(h for _, h in sorted(entries)).encode("utf-8")).hexdigest()
+
+
+# ==========================================
+# STORES
+# ==========================================
+class _FrameStore:
+    """Excel and Firestore: rows are local (file / pulled cache), hashed in Python."""
+
+    def __init__(self, name: str, loader: Callable[[str], Optional[List[Dict]]]):
+        self.name = name
+        self._loader = loader
+        self._rows: Dict[str, Dict[str, Dict[str, Tuple[str, Dict[str, str], int]]]] = {}
+
+    def _index(self, dataset: str):
+        if dataset not in self._rows:
+            rows = self._loader(dataset)
+            if rows is None:
+                return None
+            buckets: Dict[str, Dict[str, Tuple[str, Dict[str, str], int]]] = {}
+            for raw in rows:
+                bucket, key, fields = canonical_row(dataset, raw)
+                if key.strip("-|"):
+                    prev = buckets.setdefault(bucket, {}).get(key)
+                    # Duplicate keys keep the first row but are counted, like every row counts in SQL
+                    if prev is None:
+                        buckets[bucket][key] = (row_hash(key, dataset, fields), fields, 1)
+                    else:
+                        buckets[bucket][key] = (prev[0], prev[1], prev[2] + 1)
+            self._rows[dataset] = buckets
+        return self._rows[dataset]
+
+    def available(self, dataset: str) -> bool:
+        return self._index(dataset) is not None
+
+    def bucket_hashes(self, dataset: str) -> Dict[str, Tuple[str, int]]:
+        index = self._index(dataset) or {}
+        return {
+            b: (_bucket_hash([(k, h) for k, (h, _, n) in rows.items() for _ in range(n)]), sum(n for _, _, n in rows.values()))
+            for b, rows in index.items()
+        }
+
+    def rows(self, dataset: str, buckets: List[str]) -> Dict[str, Tuple[Dict[str, str], int]]:
+        index = self._index(dataset) or {}
+        return {k: (f, n) for b in buckets for k, (_, f, n) in index.get(b, {}).items()}
+
+
+class _PostgresStore:
+    """Postgres: bucket hashes are computed server-side; only drifting buckets are transferred."""
+
+    name = "postgres"
+
+    def _select(self, dataset: str) -> str:
+        spec = _SQL[dataset]
+        fields = ", ".join(f"{expr} AS f{i}" for i, expr in enumerate(spec["fields"]))
+        return (
+            f"SELECT {spec['bucket']} AS bucket, {spec['key']} AS key, {fields}, "
+            f"md5(concat_ws(chr(31), {spec['key']}, {', '.join(spec['fields'])})) AS h FROM {spec['table']}"
+        )
+
+    def available(self, dataset: str) -> bool:
+        if _db is None or not _db.get_connection_string():
+            return False
+        try:
+            _db.db_query(f"SELECT 1 FROM {_SQL[dataset]['table']} LIMIT 1")
+            return True
+        except Exception:
+            return False
+
+    def bucket_hashes(self, dataset: str) -> Dict[str, Tuple[str, int]]:
+        sql = (
+            f"SELECT bucket, md5(string_agg(h, '' ORDER BY key COLLATE \"C\", h COLLATE \"C\")) AS bh, COUNT(*) AS n "
+            f"FROM ({self._select(dataset)}) t WHERE btrim(key, '-|') <> '' GROUP BY bucket"
+        )
+        return {r["bucket"]: (r["bh"], int(r["n"])) for r in _db.db_query(sql)}
+
+    def rows(self, dataset: str, buckets: List[str]) -> Dict[str, Tuple[Dict[str, str], int]]:
+        names = DATASETS[dataset][2]
+        sql = (
+            f"SELECT * FROM ({self._select(dataset)}) t WHERE bucket = ANY(%s) AND btrim(key, '-|') <> '' "
+            f"ORDER BY key COLLATE \"C\", h COLLATE \"C\""
+        )
+        out: Dict[str, Tuple[Dict[str, str], int]] = {}
+        for r in _db.db_query(sql, (list(buckets),)):
+            prev = out.get(r["key"])
+            if prev is None:
+                out[r["key"]] = ({name: r[f"f{i}"] for i, name in enumerate(names)}, 1)
+            else:
+                out[r["key"]] = (prev[0], prev[1] + 1)
+        return out
+
+
+def _excel_loader(data_dir: Path):
+    def load(dataset: str):
+        path = Path(data_dir) / DATASETS[dataset][0]
+        if not path.exists():
+            return None
+        df = pd.read_excel(path)
+        if dataset == "records":
+            df.columns = [str(c).strip().lower() for c in df.columns]
+        return df.to_dict("records")
+    return load
+
+
+def _firestore_loader(dataset: str):
+    try:
+        from utils.firebase_utils import pull_collection
+        from utils import firebase_cache
+    except Exception:
+        return None
+    collection = DATASETS[dataset][1]
+    if pull_collection(collection) is None:
+        return None
+    return firebase_cache.documents(collection)
+
+
+def make_stores(data_dir: Path = Path("data"), include=STORES) -> Dict[str, Any]:
+    stores = {
+        "excel": _FrameStore("excel", _excel_loader(data_dir)),
+        "postgres": _PostgresStore(),
+        "firestore": _FrameStore("firestore", _firestore_loader),
+    }
+    return {name: stores[name] for name in include}
+
+
+# ==========================================
+# RECONCILE
+# ==========================================
+def reconcile_dataset(dataset: str, stores: Dict[str, Any]) -> Dict[str, Any]:
+    """Compare one dataset across the available stores.
+
+    Returns {"dataset", "stores", "buckets_total", "buckets_mismatched",
+    "rows_fetched", "discrepancies": [...]} where each discrepancy is
+    {"bucket", "key", "issue", "present_in", "missing_in", "fields"}.
+    """
+    live = {name: s for name, s in stores.items() if s.available(dataset)}
+    hashes = {name: s.bucket_hashes(dataset) for name, s in live.items()}
+    all_buckets = sorted(set().union(*[set(h) for h in hashes.values()])) if hashes else []
+    mismatched = [
+        b for b in all_buckets
+        if len({hashes[name].get(b, (None, 0))[0] for name in live}) > 1
+    ]
+
+    rows = {name: s.rows(dataset, mismatched) for name, s in live.items()} if mismatched else {}
+    discrepancies = []
+    buckets_of = {}
+    for name, r in rows.items():
+        for key, (fields, _) in r.items():
+            buckets_of.setdefault(key, canonical_row(dataset, fields)[0])
+    for key in sorted(buckets_of):
+        present = [name for name in live if key in rows[name]]
+        missing = [name for name in live if key not in rows[name]]
+        if missing:
+            discrepancies.append({
+                "bucket": buckets_of[key], "key": key, "issue": "missing",
+                "present_in": present, "missing_in": missing, "fields": {},
+            })
+        counts = {name: rows[name][key][1] for name in present}
+        if any(n > 1 for n in counts.values()):
+            discrepancies.append({
+                "bucket": buckets_of[key], "key": key, "issue": "duplicate",
+                "present_in": present, "missing_in": missing,
+                "fields": {"rows": {name: str(n) for name, n in counts.items()}},
+            })
+        values = {name: rows[name][key][0] for name in present}
+        diff = {}
+        for field in DATASETS[dataset][2]:
+            seen = {name: v.get(field, "") for name, v in values.items()}
+            if len(set(seen.values())) > 1:
+                diff[field] = seen
+        if diff:
+            discrepancies.append({
+                "bucket": buckets_of[key], "key": key, "issue": "different",
+                "present_in": present, "missing_in": missing, "fields": diff,
+            })
+    return {
+        "dataset": dataset,
+        "stores": list(live),
+        "buckets_total": len(all_buckets),
+        "buckets_mismatched": len(mismatched),
+        "rows_fetched": sum(len(r) for r in rows.values()),
+        "discrepancies": discrepancies,
+    }
+
+
+def counts_differ(d: Dict[str, Any], store: str, source: str) -> bool:
+    rows = d["fields"].get("rows", {})
+    return int(rows.get(store, "0")) > max(1, int(rows.get(source, "1")))
+
+
+def repair_plan(report: Dict[str, Any], source: str) -> List[Dict[str, Any]]:
+    """Actions that would make every other store match `source` for one dataset report."""
+    plan = []
+    if source not in report["stores"]:
+        return plan
+    for d in report["discrepancies"]:
+        in_source = source in d["present_in"]
+        for store in report["stores"]:
+            if store == source:
+                continue
+            if d["issue"] == "missing":
+                if in_source and store in d["missing_in"]:
+                    plan.append({"dataset": report["dataset"], "store": store, "action": "insert", "key": d["key"]})
+                elif not in_source and store in d["present_in"]:
+                    plan.append({"dataset": report["dataset"], "store": store, "action": "delete", "key": d["key"]})
+            elif d["issue"] == "duplicate":
+                if counts_differ(d, store, source):
+                    plan.append({"dataset": report["dataset"], "store": store, "action": "dedupe", "key": d["key"]})
+            elif in_source and store in d["present_in"]:
+                fields = {f: v[source] for f, v in d["fields"].items() if v.get(store) != v.get(source)}
+                if fields:
+                    plan.append({"dataset": report["dataset"], "store": store, "action": "update", "key": d["key"], "set": fields})
+    return plan
+
+
+def reconcile(
+    datasets=tuple(DATASETS),
+    include=STORES,
+    source: Optional[str] = None,
+    data_dir: Path = Path("data"),
+) -> Dict[str, Any]:
+    """Run reconciliation; `source` defaults to Postgres when reachable, else Excel."""
+    stores = make_stores(data_dir, include)
+    reports = [reconcile_dataset(d, stores) for d in datasets]
+    if source is None:
+        source = "postgres" if any("postgres" in r["stores"] for r in reports) else "excel"
+    plan = [step for r in reports for step in repair_plan(r, source)]
+    return {"source": source, "reports": reports, "plan": plan}
+
+
+def discrepancies_frame(result: Dict[str, Any]) -> pd.DataFrame:
+    rows = []
+    for r in result["reports"]:
+        for d in r["discrepancies"]:
+            rows.append({
+                "Dataset": r["dataset"],
+                "Bucket": d["bucket"],
+                "Key": d["key"],
+                "Issue": d["issue"],
+                "Present in": ", ".join(d["present_in"]),
+                "Missing in": ", ".join(d["missing_in"]),
+                "Fields": "; ".join(f"{f}: {v}" for f, v in d["fields"].items()),
+            })
+    return pd.DataFrame(rows, columns=["Dataset", "Bucket", "Key", "Issue", "Present in", "Missing in", "Fields"])
+
+
+__all__ = [
+    "DATASETS",
+    "STORES",
+    "canonical_row",
+    "row_hash",
+    "make_stores",
+    "reconcile_dataset",
+    "repair_plan",
+    "reconcile",
+    "discrepancies_frame",
+]
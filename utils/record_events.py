@@ -0,0 +1,33 @@
+"""
+Hooks run after a quotation / invoice / receipt record is persisted.
+
+Every page's save_record calls `record_saved(rec)` once the row is written
+(DB or Excel) so caches derived from records are refreshed.
+"""
+
+from typing import Dict, Optional
+
+from utils import data_version, kpi_snapshots, lifecycle, search_index
+
+# Views maintained incrementally from saved records (apply_record / invalidate)
+_VIEWS = [("Lifecycle view", lifecycle), ("KPI snapshots", kpi_snapshots), ("Search index", search_index)]
+
+
+def record_saved(rec: Optional[Dict] = None):
+    """Bump the records version and fold the record into the derived views."""
+    data_version.bump("records")
+    for label, view in _VIEWS:
+        try:
+            if rec:
+                view.apply_record(rec)
+            else:
+                view.invalidate()
+        except Exception as e:
+            print(f"⚠️ {label} update failed, rebuilding on next read: {e}")
+            try:
+                view.invalidate()
+            except Exception:
+                pass
+
+
+__all__ = ["record_saved"]
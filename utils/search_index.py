@@ -0,0 +1,465 @@
+"""
+Global in-memory search over customers, documents and products.
+
+Every searchable item is one entry (customer, quotation / invoice / receipt,
+product) made of normalized field values: names, phones (utils.phone keys),
+document numbers, locations, product descriptions. Distinct values are
+indexed by trigram in an inverted index; a query intersects the posting sets
+of its trigrams, rarest first, checks the few surviving values for the full
+substring and walks their entries best match first, so lookups stay in the
+low milliseconds with 100k documents. Values equal to or starting with the
+query are read from a sorted value list first, so capping how many other
+matches are ranked never drops the best ones. Queries shorter than three
+characters use a word-prefix map, and when no value contains the query the
+values sharing most of its trigrams are used instead (typos).
+
+The index is maintained incrementally: `apply_record(rec)` (called from
+`record_events.record_saved`) upserts one document, and `get_search_index`
+re-syncs a source only when its data version or file changed, diffing the
+loaded rows against the indexed ones so unchanged entries are left alone.
+The periodic re-sync that picks up edits made by other processes runs in a
+background thread, so no search request waits for the loaders.
+"""
+
+import bisect
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from utils import data_version
+from utils.phone import phone_key
+
+
+KINDS = ("customer", "record", "product")
+# kind -> (data version name, backing Excel file)
+SOURCES = {
+    "customer": ("customers", os.path.join("data", "customers.xlsx")),
+    "record": ("records", os.path.join("data", "records.xlsx")),
+    "product": ("products", os.path.join("data", "products.xlsx")),
+}
+PAGES = {"customer": "customers", "record": "reports", "product": "products"}
+DOC_LABELS = {"q": "Quotation", "i": "Invoice", "r": "Receipt"}
+LEGACY_TYPES = {label.lower(): t for t, label in DOC_LABELS.items()}   # rows saved as "Invoice"
+MAX_PREFIX = 2
+VERIFY_BELOW = 64           # stop intersecting postings once this few candidates remain
+MAX_SCORED_TERMS = 2000     # values ranked per query besides exact / prefix matches (common names match tens of thousands)
+RESORT_ABOVE = 1000         # a sync changing more entries than this re-sorts the value list once instead
+FUZZY_MIN_SCORE = 0.5
+FUZZY_MAX_POSTINGS = 5000   # typo matching ignores trigrams more common than this
+RELOAD_AFTER_SECONDS = 300  # also pick up edits made by other processes (e.g. directly in Postgres)
+
+Entry = Dict[str, object]   # {"kind", "key", "title", "subtitle", "filter", "terms"}
+
+_lock = threading.Lock()
+_index: Optional["SearchIndex"] = None
+_stamps: Dict[str, Tuple[int, float, float]] = {}   # kind -> (version, mtime, synced at)
+_refreshing: Set[str] = set()                       # kinds being re-synced in the background
+
+
+def _norm(text) -> str:
+    if text is None or (isinstance(text, float) and text != text):
+        return ""
+    s = " ".join(str(text).replace("\u200f", "").lower().split())
+    return "" if s in ("nan", "none", "nat") else s
+
+
+def _partial_phone(digits: str) -> str:
+    """Local form of a (possibly incomplete) typed number: +971 / 00971 5... -> 05..."""
+    if digits.startswith("00"):
+        digits = digits[2:]
+    if digits.startswith("971"):
+        digits = digits[3:]
+    digits = digits.lstrip("0")
+    return f"0{digits}" if digits else ""
+
+
+def _grams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _words(text: str) -> Set[str]:
+    return {w for w in re.split(r"[^0-9a-z؀-ۿ]+", text) if w}
+
+
+def _query_text(query) -> str:
+    q = _norm(query)
+    # "+971 50 123 4567" / "050-1234567": search the digits
+    if re.fullmatch(r"[\d\s+\-()]+", q) and len(re.sub(r"\D", "", q)) >= 3:
+        digits = re.sub(r"\D", "", q)
+        q = _partial_phone(digits) if digits.startswith(("971", "00")) else digits
+    return q
+
+
+def _entry(kind: str, key: str, title: str, subtitle: str, filter_text: str, primary: str, others: Iterable[str]) -> Entry:
+    # Terms are (role, normalized value): role 0 is the field shown as the title
+    terms = [(0, primary)] if primary else []
+    terms += [(1, t) for t in others if t and t != primary]
+    return {
+        "kind": kind, "key": key, "title": title, "subtitle": subtitle,
+        "filter": filter_text, "terms": tuple(dict.fromkeys(terms)),
+    }
+
+
+def _clean(value) -> str:
+    s = str(value or "").strip()
+    return "" if s.lower() in ("nan", "none", "nat") else s
+
+
+def customer_entry(row: Dict) -> Optional[Entry]:
+    name = _norm(row.get("client_name"))
+    phone = phone_key(row.get("phone"))
+    if not name and not phone:
+        return None
+    location = _clean(row.get("location"))
+    title = _clean(row.get("client_name")) or phone
+    return _entry(
+        "customer", f"customer:{name}|{phone}", title,
+        " · ".join(x for x in (phone, location) if x), title,
+        name or phone, (phone, _norm(location)),
+    )
+
+
+def record_entry(row: Dict) -> Optional[Entry]:
+    doc_type = _norm(row.get("type"))
+    doc_type = LEGACY_TYPES.get(doc_type, doc_type)
+    number = _norm(re.sub(r"\.0+$", "", _clean(row.get("number"))))
+    if doc_type not in DOC_LABELS or not number:
+        return None
+    try:
+        amount = float(row.get("amount") or 0.0)
+    except (TypeError, ValueError):
+        amount = 0.0
+    if amount != amount:
+        amount = 0.0
+    client = _clean(row.get("client_name"))
+    return _entry(
+        "record", f"record:{doc_type}-{number}", f"{DOC_LABELS[doc_type]} {number.upper()}",
+        " · ".join(x for x in (client, f"{amount:,.2f} AED") if x), client,
+        number, (_norm(row.get("client_name")), phone_key(row.get("phone")), _norm(row.get("location"))),
+    )
+
+
+def product_entry(row: Dict) -> Optional[Entry]:
+    device = _clean(row.get("Device"))
+    if not device:
+        return None
+    desc = _clean(row.get("Description"))
+    return _entry("product", f"product:{device}", device, desc, device, _norm(device), (_norm(desc),))
+
+
+ENTRY_BUILDERS = {"customer": customer_entry, "record": record_entry, "product": product_entry}
+
+
+def entries_from(kind: str, df: pd.DataFrame) -> Dict[str, Entry]:
+    """Entries keyed by entry key (the last row wins, like re-saved documents)."""
+    build = ENTRY_BUILDERS[kind]
+    out: Dict[str, Entry] = {}
+    if df is None or df.empty:
+        return out
+    for row in df.to_dict("records"):
+        entry = build(row)
+        if entry is not None:
+            out[entry["key"]] = entry
+    return out
+
+
+def _match_rank(text: str, q: str) -> int:
+    if text == q:
+        return 0
+    if text.startswith(q):
+        return 1
+    if f" {q}" in f" {text}":
+        return 2
+    return 3
+
+
+class SearchIndex:
+    """Trigram index over distinct field values ("terms"), each pointing to its entries.
+
+    Names and locations repeat across thousands of documents, so indexing
+    terms instead of entries keeps postings small, and matching / ranking work
+    is proportional to the number of matching values rather than documents.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Entry] = {}
+        self._term_id: Dict[Tuple[int, str], int] = {}
+        self._terms: List[Optional[Tuple[int, str]]] = []
+        self._term_entries: List[Set[str]] = []
+        self._free: List[int] = []
+        self._grams: Dict[str, Set[int]] = {}
+        self._prefixes: Dict[str, Set[int]] = {}
+        # (value, term id) in value order for prefix ranges; None until re-sorted after a bulk sync
+        self._sorted: Optional[List[Tuple[str, int]]] = []
+        # Searches run while a background re-sync may be applying changes
+        self._mutex = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _tokens(self, text: str) -> Iterable[Tuple[Dict[str, Set[int]], str]]:
+        for g in _grams(text):
+            yield self._grams, g
+        for w in _words(text):
+            for n in range(1, min(MAX_PREFIX, len(w)) + 1):
+                yield self._prefixes, w[:n]
+
+    def _add_term(self, term: Tuple[int, str], key: str):
+        tid = self._term_id.get(term)
+        if tid is None:
+            tid = self._free.pop() if self._free else len(self._terms)
+            if tid == len(self._terms):
+                self._terms.append(term)
+                self._term_entries.append(set())
+            else:
+                self._terms[tid] = term
+            self._term_id[term] = tid
+            for table, token in self._tokens(term[1]):
+                table.setdefault(token, set()).add(tid)
+            if self._sorted is not None:
+                bisect.insort(self._sorted, (term[1], tid))
+        self._term_entries[tid].add(key)
+
+    def _drop_term(self, term: Tuple[int, str], key: str):
+        tid = self._term_id.get(term)
+        if tid is None:
+            return
+        keys = self._term_entries[tid]
+        keys.discard(key)
+        if keys:
+            return
+        for table, token in self._tokens(term[1]):
+            ids = table.get(token)
+            if ids is not None:
+                ids.discard(tid)
+                if not ids:
+                    del table[token]
+        if self._sorted is not None:
+            i = bisect.bisect_left(self._sorted, (term[1], tid))
+            if i < len(self._sorted) and self._sorted[i] == (term[1], tid):
+                del self._sorted[i]
+        del self._term_id[term]
+        self._terms[tid] = None
+        self._free.append(tid)
+
+    def remove(self, key: str) -> bool:
+        with self._mutex:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            for term in entry["terms"]:
+                self._drop_term(term, key)
+            return True
+
+    def upsert(self, entry: Entry):
+        with self._mutex:
+            old = self._entries.get(entry["key"])
+            if old == entry:
+                return
+            if old is not None:
+                self.remove(entry["key"])
+            self._entries[entry["key"]] = entry
+            for term in entry["terms"]:
+                self._add_term(term, entry["key"])
+
+    def sync(self, kind: str, entries: Dict[str, Entry]) -> Tuple[int, int]:
+        """Make the entries of one kind equal `entries`; returns (upserted, removed)."""
+        with self._mutex:
+            gone = [k for k, e in self._entries.items() if e["kind"] == kind and k not in entries]
+            changed = [e for key, e in entries.items() if self._entries.get(key) != e]
+            if len(gone) + len(changed) > RESORT_ABOVE:
+                self._sorted = None
+            for key in gone:
+                self.remove(key)
+            for entry in changed:
+                self.upsert(entry)
+            return len(changed), len(gone)
+
+    def _prefix_terms(self, q: str, n: int) -> List[int]:
+        """Up to `n` term ids whose value starts with `q` (exact matches first), in value order."""
+        if self._sorted is None:
+            self._sorted = sorted((term[1], tid) for tid, term in enumerate(self._terms) if term is not None)
+        out = []
+        i = bisect.bisect_left(self._sorted, (q,))
+        while i < len(self._sorted) and len(out) < n and self._sorted[i][0].startswith(q):
+            out.append(self._sorted[i][1])
+            i += 1
+        return out
+
+    def _candidates(self, q: str) -> Tuple[Set[int], bool]:
+        """(candidate term ids, whether they still need the substring check)."""
+        if len(q) < 3:
+            sets = sorted((self._prefixes.get(w[:MAX_PREFIX], set()) for w in _words(q)), key=len)
+            if not sets:
+                return set(), False
+            out = set(sets[0])
+            for s in sets[1:]:
+                out &= s
+            return out, False
+        postings = sorted((self._grams.get(g, set()) for g in _grams(q)), key=len)
+        out = set(postings[0])
+        for ids in postings[1:]:
+            if len(out) <= VERIFY_BELOW:
+                break
+            out &= ids
+        return out, True
+
+    def _fuzzy(self, q: str) -> List[Tuple[float, str, int]]:
+        grams = _grams(q)
+        need = max(1, int(len(grams) * FUZZY_MIN_SCORE))
+        # Trigrams shared by most values (digit runs, "al ") cost the most and tell the least
+        usable = [p for p in (self._grams.get(g) for g in grams) if p and len(p) <= FUZZY_MAX_POSTINGS]
+        if len(usable) < need:
+            return []
+        counts: Dict[int, int] = {}
+        for ids in usable:
+            for tid in ids:
+                counts[tid] = counts.get(tid, 0) + 1
+        return [
+            (8.0 + 1.0 - c / float(len(grams)), self._terms[tid][1], tid)
+            for tid, c in counts.items() if c >= need
+        ]
+
+    def search(self, query: str, limit: Optional[int] = 20, kinds: Optional[Iterable[str]] = None) -> List[Dict[str, str]]:
+        """Ranked entries matching `query`.
+
+        Each hit is {"kind", "key", "title", "subtitle", "page", "filter"}; `filter`
+        is the text to put in the target page's own search box.
+        """
+        q = _query_text(query)
+        if not q:
+            return []
+        with self._mutex:
+            return self._search(q, limit, set(kinds or KINDS))
+
+    def _search(self, q: str, limit: Optional[int], kinds: Set[str]) -> List[Dict[str, str]]:
+        tids, verify = self._candidates(q)
+        # Exact and prefix matches come from the sorted values, so the cap below never drops them
+        head = self._prefix_terms(q, MAX_SCORED_TERMS)
+        scored = []
+        for tid in head:
+            role, text = self._terms[tid]
+            scored.append((role * 4.0 + _match_rank(text, q), text, tid))
+        head, rest = set(head), 0
+        for tid in tids:
+            if tid in head:
+                continue
+            role, text = self._terms[tid]
+            if verify and q not in text:
+                continue
+            scored.append((role * 4.0 + _match_rank(text, q), text, tid))
+            rest += 1
+            if rest >= MAX_SCORED_TERMS:
+                break
+        if not scored and len(q) >= 3:
+            scored = self._fuzzy(q)
+        scored.sort()
+        # Best terms first; stop once enough entries are collected
+        ranks: Dict[str, float] = {}
+        for rank, _, tid in scored:
+            if limit and len(ranks) >= limit:
+                break
+            for key in self._term_entries[tid]:
+                if key not in ranks and self._entries[key]["kind"] in kinds:
+                    ranks[key] = rank
+                    if limit and len(ranks) >= limit:
+                        break
+        hits = sorted(ranks, key=lambda k: (ranks[k], KINDS.index(self._entries[k]["kind"]), self._entries[k]["title"]))
+        if limit:
+            hits = hits[:limit]
+        out = []
+        for key in hits:
+            entry = self._entries[key]
+            out.append({
+                "kind": entry["kind"], "key": key, "title": entry["title"],
+                "subtitle": entry["subtitle"], "page": PAGES[entry["kind"]], "filter": entry["filter"],
+            })
+        return out
+
+
+def _stamp(kind: str) -> Tuple[int, float]:
+    name, path = SOURCES[kind]
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = 0.0
+    return data_version.get(name), mtime
+
+
+def _sync_kind(index: SearchIndex, kind: str, loader: Callable[[], pd.DataFrame]):
+    stamp = _stamp(kind)
+    try:
+        entries = entries_from(kind, loader())
+    except Exception as e:
+        print(f"⚠️ Search index could not load {kind}s: {e}")
+        return
+    with _lock:
+        if index is _index:
+            index.sync(kind, entries)
+            _stamps[kind] = stamp + (time.time(),)
+
+
+def _background_sync(index: SearchIndex, kind: str, loader: Callable[[], pd.DataFrame]):
+    try:
+        _sync_kind(index, kind, loader)
+    finally:
+        with _lock:
+            _refreshing.discard(kind)
+
+
+def get_search_index(loaders: Dict[str, Callable[[], pd.DataFrame]]) -> SearchIndex:
+    """Process-wide index; each kind's loader runs only when that source changed or went stale.
+
+    A changed (or never loaded) source is synced before returning. A source
+    that only went stale is re-synced in a background thread and the current
+    index is returned right away.
+    """
+    global _index
+    with _lock:
+        if _index is None:
+            _index = SearchIndex()
+        index = _index
+        changed, aged = [], []
+        for kind in loaders:
+            if kind not in _stamps or _stamps[kind][:2] != _stamp(kind):
+                changed.append(kind)
+            elif time.time() - _stamps[kind][2] > RELOAD_AFTER_SECONDS and kind not in _refreshing:
+                _refreshing.add(kind)
+                aged.append(kind)
+    for kind in aged:
+        threading.Thread(
+            target=_background_sync, args=(index, kind, loaders[kind]), name=f"search-sync-{kind}", daemon=True
+        ).start()
+    for kind in changed:
+        _sync_kind(index, kind, loaders[kind])
+    return index
+
+
+def apply_record(rec: Dict) -> bool:
+    """Index one saved document. False if the index has not been built yet."""
+    entry = record_entry(rec)
+    with _lock:
+        if _index is None or "record" not in _stamps:
+            return False
+        if entry is not None:
+            _index.upsert(entry)
+        _stamps["record"] = _stamp("record") + (_stamps["record"][2],)
+    return True
+
+
+def invalidate():
+    """Drop the index; the next `get_search_index` rebuilds it."""
+    global _index
+    with _lock:
+        _index = None
+        _stamps.clear()
+
+
+__all__ = [
+    "KINDS", "PAGES", "SearchIndex", "entries_from",
+    "get_search_index", "apply_record", "invalidate",
+]
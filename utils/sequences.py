@@ -0,0 +1,195 @@
+"""
+Atomic document-number and base_id sequences.
+
+Counters are named per period: "base:20260114" for the project ids of a day
+(20260114-001, -002, ...) and "q:2026" / "i:2026" / "r:2026" for quotation,
+invoice and receipt numbers of a year (Q20260001, ...). Each holds the last
+value handed out. With Postgres configured they live in a `sequences` table and
+are advanced with a single UPDATE ... RETURNING; otherwise in a local SQLite
+file (data/sequences.sqlite) under a BEGIN IMMEDIATE lock, so concurrent
+sessions and processes never receive the same value.
+
+A counter that does not exist yet is seeded once from the existing records
+(highest sequence already used for that period), replacing the old
+"count matching rows + 1" scans.
+
+Pages display `peek_number` and reserve it with `claim_number` when saving;
+the claim fails if another session saved that number first, and the page then
+takes a fresh one from `next_number` instead of keeping a duplicate.
+"""
+
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+import pandas as pd
+
+try:
+    from utils import db as _db
+except Exception:
+    _db = None
+
+
+SEQUENCES_PATH = Path("data") / "sequences.sqlite"
+NUMBER_PREFIX = {"q": "Q", "i": "I", "r": "R"}
+NUMBER_WIDTH = 4
+BASE_WIDTH = 3
+
+Seed = Callable[[], int]
+
+_lock = threading.Lock()
+_pg_ready = False
+
+
+def _connect() -> sqlite3.Connection:
+    path = Path(SEQUENCES_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+    conn.execute("CREATE TABLE IF NOT EXISTS sequences (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    return conn
+
+
+def _local(name: str, seed: Seed, op: str, value: int = 0) -> int:
+    with _lock:
+        conn = _connect()
+        try:
+            # Write lock on the file for the whole read-modify-write
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()
+                current = row[0] if row else int(seed())
+                if op == "peek":
+                    conn.execute("ROLLBACK")
+                    return current + 1
+                if op == "claim" and value <= current:
+                    conn.execute("ROLLBACK")
+                    return 0   # already handed out
+                new = current + 1 if op == "allocate" else value
+                conn.execute("INSERT OR REPLACE INTO sequences(name, value) VALUES (?, ?)", (name, new))
+                conn.execute("COMMIT")
+                return new
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+
+def _use_db() -> bool:
+    return _db is not None and bool(_db.get_connection_string())
+
+
+def _pg(name: str, seed: Seed, op: str, value: int = 0) -> int:
+    global _pg_ready
+    if not _pg_ready:
+        _db.db_execute("CREATE TABLE IF NOT EXISTS sequences (name TEXT PRIMARY KEY, value BIGINT NOT NULL)")
+        _pg_ready = True
+    if op == "peek":
+        rows = _db.db_query("SELECT value FROM sequences WHERE name = %s", (name,))
+        return (int(rows[0]["value"]) if rows else int(seed())) + 1
+    if op == "allocate":
+        sql, params = "UPDATE sequences SET value = value + 1 WHERE name = %s RETURNING value", (name,)
+    else:
+        # A claim only succeeds while the value is still above everything handed out
+        sql, params = "UPDATE sequences SET value = %s WHERE name = %s AND value < %s RETURNING value", (value, name, value)
+    row = _db.db_execute(sql, params, returning=True)
+    if row is None and not _db.db_query("SELECT 1 FROM sequences WHERE name = %s", (name,)):
+        # First use of this counter: seed it, concurrent seeders agree via ON CONFLICT
+        _db.db_execute(
+            "INSERT INTO sequences(name, value) VALUES (%s, %s) ON CONFLICT (name) DO NOTHING", (name, int(seed()))
+        )
+        row = _db.db_execute(sql, params, returning=True)
+    return int(row["value"]) if row else 0
+
+
+def _run(name: str, seed: Seed, op: str, value: int = 0) -> int:
+    if _use_db():
+        try:
+            return _pg(name, seed, op, value)
+        except Exception as e:
+            print(f"⚠️ Sequence {name} unavailable in database, using local counter: {e}")
+    return _local(name, seed, op, value)
+
+
+def allocate(name: str, seed: Seed = lambda: 0) -> int:
+    """Hand out the next value of a counter; never returns the same value twice."""
+    return _run(name, seed, "allocate")
+
+
+def peek(name: str, seed: Seed = lambda: 0) -> int:
+    """The value `allocate` would return now, without consuming it (for display)."""
+    return _run(name, seed, "peek")
+
+
+def claim(name: str, value: int, seed: Seed = lambda: 0) -> bool:
+    """Take `value` if nothing at or above it was handed out yet; False when it is already used."""
+    return _run(name, seed, "claim", int(value)) > 0
+
+
+def _max_suffix(values: pd.Series, prefix: str) -> int:
+    found = values.astype(str).str.extract(f"^{re.escape(prefix)}(\\d+)$", expand=False).dropna()
+    return int(found.astype(int).max()) if not found.empty else 0
+
+
+def _seed_from(loader: Callable[[], pd.DataFrame], column: str, prefix: str) -> Seed:
+    def seed() -> int:
+        records = loader()
+        if records is None or records.empty or column not in records.columns:
+            return 0
+        return _max_suffix(records[column].dropna(), prefix)
+    return seed
+
+
+def next_base_id(loader: Callable[[], pd.DataFrame], day: Optional[datetime] = None) -> str:
+    """Allocate a project id YYYYMMDD-NNN; `loader` (records) is read only to seed a new day."""
+    today_id = (day or datetime.today()).strftime('%Y%m%d')
+    seq = allocate(f"base:{today_id}", _seed_from(loader, "base_id", f"{today_id}-"))
+    return f"{today_id}-{str(seq).zfill(BASE_WIDTH)}"
+
+
+def _number_parts(doc_type: str, day: Optional[datetime]):
+    year = (day or datetime.today()).year
+    prefix = f"{NUMBER_PREFIX[doc_type]}{year}"
+    return f"{doc_type}:{year}", prefix
+
+
+def peek_number(doc_type: str, loader: Callable[[], pd.DataFrame], day: Optional[datetime] = None) -> str:
+    """Next document number for the type ("q", "i", "r"), e.g. Q20260001, without consuming it."""
+    name, prefix = _number_parts(doc_type, day)
+    seq = peek(name, _seed_from(loader, "number", prefix))
+    return f"{prefix}{str(seq).zfill(NUMBER_WIDTH)}"
+
+
+def next_number(doc_type: str, loader: Callable[[], pd.DataFrame], day: Optional[datetime] = None) -> str:
+    """Allocate a fresh document number for the type; never returned twice."""
+    name, prefix = _number_parts(doc_type, day)
+    seq = allocate(name, _seed_from(loader, "number", prefix))
+    return f"{prefix}{str(seq).zfill(NUMBER_WIDTH)}"
+
+
+def claim_number(doc_type: str, number: str, loader: Callable[[], pd.DataFrame], day: Optional[datetime] = None) -> bool:
+    """Reserve a document number at save time; False when another save already used it.
+
+    Numbers in this year's numbering are checked against the counter, so two
+    sessions that displayed the same peeked number cannot both keep it. Other
+    (hand-typed) numbers are checked against the saved records.
+    """
+    name, prefix = _number_parts(doc_type, day)
+    number = str(number or "").strip()
+    m = re.fullmatch(f"{re.escape(prefix)}(\\d+)", number)
+    if m:
+        return claim(name, int(m.group(1)), _seed_from(loader, "number", prefix))
+    records = loader()
+    if records is None or records.empty or not {"type", "number"}.issubset(records.columns):
+        return True
+    taken = (records["type"].astype(str).str.lower() == doc_type) & (records["number"].astype(str).str.strip() == number)
+    return not taken.any()
+
+
+__all__ = [
+    "SEQUENCES_PATH", "allocate", "peek", "claim",
+    "next_base_id", "peek_number", "next_number", "claim_number",
+]
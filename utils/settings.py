@@ -19,6 +19,8 @@ DEFAULT_SETTINGS = {
     "ui_product_image_height_px": 195,
     "quote_product_image_width_cm": 3.49,
     "quote_product_image_height_cm": 1.5,
+    "product_image_format": "jpeg",
+    "product_image_max_kb": 24,
     "openai_api_key": "",
     "ui_accent": "none"
 }
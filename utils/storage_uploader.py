@@ -0,0 +1,119 @@
+"""
+Concurrent product image uploads to Firebase Storage.
+
+Images are resolved from image store keys or inline base64, hashed locally
+and compared with the blob's stored `md5_hash` (base64 MD5, as Cloud Storage
+reports it) so unchanged images are never re-sent. Uploads run on a thread
+pool: `upload_images` blocks and returns a throughput report (bulk sync),
+`submit_uploads` hands work to a shared background pool so saves return
+immediately.
+"""
+
+import base64
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils import image_store
+
+
+DEFAULT_WORKERS = 8
+BLOB_PATH = "products/{product_id}/image.png"
+
+_background: Optional[ThreadPoolExecutor] = None
+_background_lock = threading.Lock()
+
+
+def md5_b64(data: bytes) -> str:
+    """Base64 MD5 digest in the form Cloud Storage exposes as `blob.md5_hash`."""
+    return base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+
+
+def upload_image(bucket, product_id: str, value: Any, force: bool = False) -> Dict[str, Any]:
+    """Upload one product image unless the remote copy already has the same MD5."""
+    result = {"product_id": product_id, "status": "failed", "bytes": 0, "error": None}
+    try:
+        data = image_store.image_bytes(value)
+        if not data:
+            result["status"] = "no image"
+            return result
+        path = BLOB_PATH.format(product_id=product_id)
+        local_md5 = md5_b64(data)
+        if not force:
+            # get_blob is a metadata-only request; None when the object does not exist yet
+            remote = bucket.get_blob(path)
+            if remote is not None and remote.md5_hash == local_md5:
+                result.update(status="skipped", bytes=len(data))
+                return result
+        blob = bucket.blob(path)
+        blob.upload_from_string(data, content_type=image_store.guess_mime(data))
+        result.update(status="uploaded", bytes=len(data))
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def upload_images(
+    bucket,
+    items: Iterable[Tuple[str, Any]],
+    max_workers: int = DEFAULT_WORKERS,
+    force: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, Any]:
+    """Upload (product_id, image_value) pairs concurrently and report throughput.
+
+    Returns {"uploaded", "skipped", "failed", "bytes", "seconds",
+    "images_per_sec", "mb_per_sec", "results"}; throughput counts uploaded
+    images only.
+    """
+    items = [(pid, v) for pid, v in items if pid and isinstance(v, str) and v.strip()]
+    t0 = time.perf_counter()
+    results: List[Dict[str, Any]] = []
+    if items:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+            futures = [pool.submit(upload_image, bucket, pid, v, force) for pid, v in items]
+            for done, fut in enumerate(as_completed(futures), start=1):
+                results.append(fut.result())
+                if progress:
+                    progress(done, len(items))
+    seconds = time.perf_counter() - t0
+    uploaded = [r for r in results if r["status"] == "uploaded"]
+    sent = sum(r["bytes"] for r in uploaded)
+    return {
+        "uploaded": len(uploaded),
+        "skipped": sum(1 for r in results if r["status"] == "skipped"),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "bytes": sent,
+        "seconds": round(seconds, 2),
+        "images_per_sec": round(len(uploaded) / seconds, 2) if seconds else 0.0,
+        "mb_per_sec": round(sent / 1e6 / seconds, 3) if seconds else 0.0,
+        "results": results,
+    }
+
+
+def submit_uploads(bucket_factory: Callable[[], Any], items: Iterable[Tuple[str, Any]]) -> int:
+    """Queue uploads on the shared background pool; returns the number submitted."""
+    global _background
+    items = [(pid, v) for pid, v in items if pid and isinstance(v, str) and v.strip()]
+    if not items:
+        return 0
+    with _background_lock:
+        if _background is None:
+            _background = ThreadPoolExecutor(max_workers=DEFAULT_WORKERS, thread_name_prefix="storage-upload")
+
+    def _run(pid, value):
+        try:
+            r = upload_image(bucket_factory(), pid, value)
+        except Exception as e:
+            r = {"status": "failed", "error": str(e)}
+        if r["status"] == "failed":
+            print(f"❌ Storage upload failed for {pid}: {r['error']}")
+
+    for pid, value in items:
+        _background.submit(_run, pid, value)
+    return len(items)
+
+
+__all__ = ["DEFAULT_WORKERS", "md5_b64", "upload_image", "upload_images", "submit_uploads"]
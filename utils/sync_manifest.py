@@ -0,0 +1,134 @@
+"""
+Local sync manifest for Firestore change tracking.
+
+Stores the content hash of every document last pushed to Firestore in a
+small SQLite file (data/sync_manifest.sqlite). Sync functions diff the
+current rows against it and only push inserted, changed or deleted
+documents, then record what landed.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+MANIFEST_PATH = Path("data") / "sync_manifest.sqlite"
+# Fields that change on every write and must not affect the content hash
+VOLATILE_FIELDS = {"updated_at", "created_at"}
+
+_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    path = Path(MANIFEST_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS manifest ("
+        " collection TEXT NOT NULL,"
+        " doc_id TEXT NOT NULL,"
+        " hash TEXT NOT NULL,"
+        " synced_at TEXT NOT NULL,"
+        " PRIMARY KEY (collection, doc_id))"
+    )
+    return conn
+
+
+def content_hash(doc: Dict) -> str:
+    """Stable SHA-1 of a document's content, ignoring volatile timestamps."""
+    payload = {k: v for k, v in doc.items() if k not in VOLATILE_FIELDS}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def load_hashes(collection: str) -> Dict[str, str]:
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute("SELECT doc_id, hash FROM manifest WHERE collection = ?", (collection,)).fetchall()
+        finally:
+            conn.close()
+    return {doc_id: h for doc_id, h in rows}
+
+
+def diff(
+    collection: str,
+    docs: Dict[str, Dict],
+    full: bool = True,
+    pending: Optional[Tuple[Dict[str, str], Iterable[str]]] = None,
+) -> Tuple[Dict[str, Dict], List[str], Dict[str, str]]:
+    """Compare `docs` ({doc_id: data}) with the manifest.
+
+    Returns (changed_docs, deleted_ids, new_hashes). Deletions are only
+    reported when `docs` is the full collection (`full=True`). `pending` is
+    (queued_set_hashes, queued_delete_ids) from the outbox; queued writes count
+    as already synced so they are not queued twice.
+    """
+    known = load_hashes(collection)
+    if pending:
+        queued_sets, queued_deletes = pending
+        known.update(queued_sets)
+        for doc_id in queued_deletes:
+            known.pop(doc_id, None)
+    changed: Dict[str, Dict] = {}
+    hashes: Dict[str, str] = {}
+    for doc_id, data in docs.items():
+        h = content_hash(data)
+        if known.get(doc_id) != h:
+            changed[doc_id] = data
+            hashes[doc_id] = h
+    deleted = sorted(set(known) - set(docs)) if full else []
+    return changed, deleted, hashes
+
+
+def mark_synced(collection: str, hashes: Dict[str, str], deleted: Optional[Iterable[str]] = None):
+    """Record documents that reached Firestore (and forget deleted ones)."""
+    now = datetime.now().isoformat()
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO manifest(collection, doc_id, hash, synced_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(collection, doc_id) DO UPDATE SET hash = excluded.hash, synced_at = excluded.synced_at",
+                    [(collection, doc_id, h, now) for doc_id, h in hashes.items()],
+                )
+                if deleted:
+                    conn.executemany(
+                        "DELETE FROM manifest WHERE collection = ? AND doc_id = ?",
+                        [(collection, doc_id) for doc_id in deleted],
+                    )
+        finally:
+            conn.close()
+
+
+def reset(collection: Optional[str] = None):
+    """Forget sync state so the next sync pushes everything again."""
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                if collection:
+                    conn.execute("DELETE FROM manifest WHERE collection = ?", (collection,))
+                else:
+                    conn.execute("DELETE FROM manifest")
+        finally:
+            conn.close()
+
+
+def summary() -> Dict[str, int]:
+    """Number of tracked documents per collection."""
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute("SELECT collection, COUNT(*) FROM manifest GROUP BY collection").fetchall()
+        finally:
+            conn.close()
+    return {c: n for c, n in rows}
+
+
+__all__ = ["MANIFEST_PATH", "content_hash", "load_hashes", "diff", "mark_synced", "reset", "summary"]
@@ -0,0 +1,274 @@
+"""
+Durable outbound queue for Firestore writes.
+
+Saves enqueue their document into a small SQLite file (data/sync_outbox.sqlite)
+and return immediately; a daemon worker thread drains the queue in batches.
+Rows are keyed by (collection, doc_id) so repeated saves of the same document
+coalesce into one pending write. Failed batches are retried with exponential
+backoff and moved to a dead-letter state after MAX_ATTEMPTS. Because the queue
+lives on disk, pending writes survive restarts and are picked up by the next
+worker. Successful writes are recorded in the sync manifest.
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils import sync_manifest
+
+
+OUTBOX_PATH = Path("data") / "sync_outbox.sqlite"
+BATCH_SIZE = 500
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 2.0      # seconds, doubled per attempt
+BACKOFF_MAX = 600.0     # cap between retries
+IDLE_WAIT = 30.0        # worker wakes at least this often to pick up retries
+
+# writer(collection, upserts {doc_id: data}, deletes [doc_id]) -> commits (-1 = backend unavailable)
+Writer = Callable[[str, Dict[str, Dict], List[str]], int]
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    path = Path(OUTBOX_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS outbox ("
+        " collection TEXT NOT NULL,"
+        " doc_id TEXT NOT NULL,"
+        " op TEXT NOT NULL,"
+        " payload TEXT,"
+        " hash TEXT,"
+        " rev INTEGER NOT NULL DEFAULT 1,"
+        " status TEXT NOT NULL DEFAULT 'pending',"
+        " attempts INTEGER NOT NULL DEFAULT 0,"
+        " next_attempt_at REAL NOT NULL DEFAULT 0,"
+        " last_error TEXT,"
+        " enqueued_at TEXT NOT NULL,"
+        " PRIMARY KEY (collection, doc_id))"
+    )
+    return conn
+
+
+def _execute(sql: str, params: Iterable = (), many: bool = False):
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                cur = conn.executemany(sql, params) if many else conn.execute(sql, tuple(params))
+                return cur.fetchall() if cur.description else cur.rowcount
+        finally:
+            conn.close()
+
+
+# ==========================================
+# ENQUEUE
+# ==========================================
+def enqueue_many(collection: str, upserts: Optional[Dict[str, Dict]] = None,
+                 deletes: Optional[Iterable[str]] = None, hashes: Optional[Dict[str, str]] = None) -> int:
+    """Queue document writes; a newer write for the same document replaces the pending one."""
+    now = datetime.now().isoformat()
+    hashes = hashes or {}
+    rows = [
+        (collection, doc_id, "set", json.dumps(data, ensure_ascii=False, default=str),
+         hashes.get(doc_id) or sync_manifest.content_hash(data), now)
+        for doc_id, data in (upserts or {}).items() if doc_id
+    ]
+    rows += [(collection, doc_id, "delete", None, None, now) for doc_id in (deletes or []) if doc_id]
+    if not rows:
+        return 0
+    _execute(
+        "INSERT INTO outbox(collection, doc_id, op, payload, hash, enqueued_at) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(collection, doc_id) DO UPDATE SET op = excluded.op, payload = excluded.payload, "
+        "hash = excluded.hash, rev = outbox.rev + 1, status = 'pending', attempts = 0, "
+        "next_attempt_at = 0, last_error = NULL, enqueued_at = excluded.enqueued_at",
+        rows, many=True,
+    )
+    _wake.set()
+    return len(rows)
+
+
+def enqueue(collection: str, doc_id: str, data: Optional[Dict] = None, op: str = "set", doc_hash: Optional[str] = None) -> int:
+    if op == "delete":
+        return enqueue_many(collection, deletes=[doc_id])
+    return enqueue_many(collection, {doc_id: data or {}}, hashes={doc_id: doc_hash} if doc_hash else None)
+
+
+def pending_state(collection: str) -> Tuple[Dict[str, str], List[str]]:
+    """(hashes of queued sets, ids of queued deletes) for a collection, dead letters excluded."""
+    rows = _execute("SELECT doc_id, op, hash FROM outbox WHERE collection = ? AND status = 'pending'", (collection,))
+    sets = {doc_id: h for doc_id, op, h in rows if op == "set"}
+    deletes = [doc_id for doc_id, op, _ in rows if op == "delete"]
+    return sets, deletes
+
+
+# ==========================================
+# DRAIN
+# ==========================================
+def _backoff(attempts: int) -> float:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+    return delay * (0.8 + 0.4 * random.random())
+
+
+def drain_once(writer: Writer, limit: int = BATCH_SIZE) -> int:
+    """Send one batch of due writes per collection. Returns the number of documents written."""
+    now = time.time()
+    due = _execute(
+        "SELECT collection, doc_id, op, payload, hash, rev, attempts FROM outbox "
+        "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY enqueued_at LIMIT ?",
+        (now, limit),
+    )
+    by_collection: Dict[str, list] = {}
+    for row in due:
+        by_collection.setdefault(row[0], []).append(row)
+
+    written = 0
+    for collection, rows in by_collection.items():
+        upserts = {r[1]: json.loads(r[3] or "{}") for r in rows if r[2] == "set"}
+        deletes = [r[1] for r in rows if r[2] == "delete"]
+        try:
+            commits = writer(collection, upserts, deletes)
+            error = None if commits >= 0 else "Firebase not available"
+        except Exception as e:
+            commits, error = -1, str(e)
+
+        if error is None:
+            # Only drop rows that were not re-queued while the batch was in flight
+            _execute(
+                "DELETE FROM outbox WHERE collection = ? AND doc_id = ? AND rev = ?",
+                [(collection, r[1], r[5]) for r in rows], many=True,
+            )
+            sync_manifest.mark_synced(
+                collection,
+                {r[1]: r[4] for r in rows if r[2] == "set" and r[4]},
+                deletes,
+            )
+            written += len(rows)
+            continue
+
+        # An unavailable backend is not the documents' fault: retry later without burning attempts
+        unavailable = commits == -1 and error == "Firebase not available"
+        # One retry time per batch keeps the documents together on the next attempt
+        retry_at = time.time() + _backoff(max(1, max(r[6] for r in rows) + (0 if unavailable else 1)))
+        updates = []
+        for r in rows:
+            attempts = r[6] if unavailable else r[6] + 1
+            status = "dead" if attempts >= MAX_ATTEMPTS else "pending"
+            updates.append((status, attempts, retry_at, error, collection, r[1], r[5]))
+        _execute(
+            "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? "
+            "WHERE collection = ? AND doc_id = ? AND rev = ?",
+            updates, many=True,
+        )
+        print(f"⚠️ Sync queue: {collection} batch failed ({error}); retrying later")
+    return written
+
+
+def flush(writer: Writer, timeout: float = 60.0) -> bool:
+    """Drain everything that is due in the calling thread. True if nothing pending remains due."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if drain_once(writer) == 0:
+            break
+    return not _execute("SELECT 1 FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? LIMIT 1", (time.time(),))
+
+
+def _next_due_in() -> float:
+    rows = _execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'")
+    nxt = rows[0][0] if rows else None
+    if nxt is None:
+        return IDLE_WAIT
+    return max(0.0, min(IDLE_WAIT, nxt - time.time()))
+
+
+def _run(writer: Writer):
+    while True:
+        try:
+            while drain_once(writer):
+                pass
+            wait = _next_due_in()
+        except Exception as e:
+            print(f"⚠️ Sync queue worker error: {e}")
+            wait = IDLE_WAIT
+        _wake.wait(wait)
+        _wake.clear()
+
+
+def start_worker(writer: Writer) -> bool:
+    """Start the background drain thread once per process. Returns True if it was started now."""
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return False
+        _worker = threading.Thread(target=_run, args=(writer,), name="firebase-sync-outbox", daemon=True)
+        _worker.start()
+        return True
+
+
+def worker_running() -> bool:
+    return _worker is not None and _worker.is_alive()
+
+
+# ==========================================
+# STATUS / ADMIN
+# ==========================================
+def stats() -> Dict[str, int]:
+    rows = _execute("SELECT status, COUNT(*) FROM outbox GROUP BY status")
+    out = {"pending": 0, "dead": 0}
+    out.update({s: n for s, n in rows})
+    return out
+
+
+def list_items(status: Optional[str] = None, limit: int = 200) -> List[Dict]:
+    sql = "SELECT collection, doc_id, op, status, attempts, next_attempt_at, last_error, enqueued_at FROM outbox"
+    params: tuple = ()
+    if status:
+        sql += " WHERE status = ?"
+        params = (status,)
+    sql += " ORDER BY enqueued_at LIMIT ?"
+    rows = _execute(sql, params + (limit,))
+    keys = ["collection", "doc_id", "op", "status", "attempts", "next_attempt_at", "last_error", "enqueued_at"]
+    items = [dict(zip(keys, r)) for r in rows]
+    for item in items:
+        item["next_attempt_at"] = datetime.fromtimestamp(item["next_attempt_at"]).isoformat(timespec="seconds") if item["next_attempt_at"] else ""
+    return items
+
+
+def retry_dead() -> int:
+    """Move dead letters back to pending with a fresh attempt budget."""
+    n = _execute(
+        "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = 0, last_error = NULL WHERE status = 'dead'"
+    )
+    _wake.set()
+    return n
+
+
+def purge_dead() -> int:
+    return _execute("DELETE FROM outbox WHERE status = 'dead'")
+
+
+__all__ = [
+    "OUTBOX_PATH",
+    "MAX_ATTEMPTS",
+    "enqueue",
+    "enqueue_many",
+    "pending_state",
+    "drain_once",
+    "flush",
+    "start_worker",
+    "worker_running",
+    "stats",
+    "list_items",
+    "retry_dead",
+    "purge_dead",
+]